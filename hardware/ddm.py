@@ -0,0 +1,135 @@
+"""
+SFP digital diagnostics (DDM) conversion, A2h registers as described in
+https://cdn.hackaday.io/files/21599924091616/AN_2030_DDMI_for_SFP_Rev_E2.pdf
+
+Values are decoded with a single struct.unpack and plain float arithmetic, dBm comes from
+a precomputed table of all 65536 raw power values. Output matches the previous NumPy scalar conversion exactly.
+
+Externally calibrated modules report raw A/D values, these are corrected with the calibration constants
+(A2h 56-91) to the same units as internally calibrated modules before conversion.
+Alarm and warning thresholds (A2h 0-39) are converted the same way as measurements.
+"""
+import struct
+import numpy as np
+
+DIAG_FORMAT = struct.Struct(">hHHHH")  # temp, vcc, tx bias, tx power, rx power - all msb first
+THRESHOLD_FORMAT = struct.Struct(">hhhh" + "H" * 16)  # high alarm, low alarm, high warning, low warning of each measurement
+CALIBRATION_FORMAT = struct.Struct(">fffff" + "Hh" * 4)  # rx power polynomial from 4th order down, slope and offset of tx bias, tx power, temp, vcc
+
+DIAG_IMPLEMENTED = 0x40  # diag_settings (A0h register 92) bits
+INTERNALLY_CALIBRATED = 0x20
+EXTERNALLY_CALIBRATED = 0x10
+
+THRESHOLDS_REG = 0
+THRESHOLDS_LENGTH = 40
+CALIBRATION_REG = 56
+CALIBRATION_LENGTH = 36
+STATIC_PAGE_LENGTH = CALIBRATION_REG + CALIBRATION_LENGTH  # thresholds and calibration are read together on init
+
+TEMP_LSB = 256  # temperature is signed, 1/256 degC per LSB
+VCC_LSB = 10000  # 100 uV per LSB
+TX_BIAS_LSB = 500  # 2 uA per LSB, converted to mA
+POWER_LSB = 10000  # optical power LSB is 0.1 uW, so the range is [0, 6.5535]mW
+SLOPE_LSB = 256  # calibration slopes are unsigned 8.8 fixed point
+DBM_DECIMALS = 3
+NO_POWER_DBM = -40.0  # reported for 0 mW, -40.0 is lower limit
+
+MEASUREMENTS = ("temp", "vcc", "tx_bias", "tx_power", "rx_power")
+THRESHOLDS = ("high_alarm", "low_alarm", "high_warning", "low_warning")
+
+def _build_dbm_table():
+    """Return list of dBm values for every raw power value"""
+    with np.errstate(divide="ignore"):
+        table = np.round(10 * np.log10(np.arange(1 << 16) / POWER_LSB), DBM_DECIMALS)
+    table[0] = NO_POWER_DBM
+    return table
+
+DBM_ARRAY = _build_dbm_table()
+DBM_TABLE = DBM_ARRAY.tolist()  # python floats, indexing a list is much faster than a numpy array for single values
+
+def unpack_diagnostics(block):
+    """Return raw (temp, vcc, tx_bias, tx_power, rx_power) from 10 byte diagnostics block"""
+    return DIAG_FORMAT.unpack(bytes(block))
+
+def raw_to_temp(raw):
+    """Return temperature in degC"""
+    return raw / TEMP_LSB
+
+def raw_to_mW(raw):
+    """Return optical power in mW"""
+    return raw / POWER_LSB
+
+def raw_to_dBm(raw):
+    """Return optical power in dBm"""
+    return DBM_TABLE[raw]
+
+def raw_to_dBm_array(raw):
+    """Return dBm of an array of raw power values, use for converting whole history buffers at once"""
+    return DBM_ARRAY[np.asarray(raw, dtype=np.uint16)]
+
+def _clamp(value, low, high):
+    return min(max(int(round(value)), low), high)
+
+def decode_calibration(block):
+    """Return external calibration constants from 36 byte block at A2h register 56"""
+    values = CALIBRATION_FORMAT.unpack(bytes(block))
+    calibration = {"rx_power": values[4::-1]}  # polynomial coefficients from 0th order up
+    for i, name in enumerate(("tx_bias", "tx_power", "temp", "vcc")):
+        slope, offset = values[5 + 2 * i: 7 + 2 * i]
+        calibration[name] = (slope / SLOPE_LSB, offset)
+    return calibration
+
+def calibrate(raw, calibration):
+    """Return raw (temp, vcc, tx_bias, tx_power, rx_power) corrected with external calibration constants"""
+    temp, vcc, tx_bias, tx_power, rx_power = raw
+    slope, offset = calibration["temp"]
+    temp = _clamp(slope * temp + offset, -0x8000, 0x7FFF)
+    slope, offset = calibration["vcc"]
+    vcc = _clamp(slope * vcc + offset, 0, 0xFFFF)
+    slope, offset = calibration["tx_bias"]
+    tx_bias = _clamp(slope * tx_bias + offset, 0, 0xFFFF)
+    slope, offset = calibration["tx_power"]
+    tx_power = _clamp(slope * tx_power + offset, 0, 0xFFFF)
+    rx_power = _clamp(sum(coefficient * rx_power ** order for order, coefficient in enumerate(calibration["rx_power"])), 0, 0xFFFF)
+    return temp, vcc, tx_bias, tx_power, rx_power
+
+def convert(raw, calibration=None):
+    """Return measurements of raw (temp, vcc, tx_bias, tx_power, rx_power) in degC, V, mA, mW and dBm"""
+    if calibration is not None:
+        raw = calibrate(raw, calibration)
+    temp, vcc, tx_bias, tx_power, rx_power = raw
+    return {
+        "temp": temp / TEMP_LSB,
+        "vcc": vcc / VCC_LSB,
+        "tx_bias": tx_bias / TX_BIAS_LSB,
+        "tx_power_dBm": DBM_TABLE[tx_power],
+        "rx_power_dBm": DBM_TABLE[rx_power],
+        "tx_power": tx_power / POWER_LSB,
+        "rx_power": rx_power / POWER_LSB,
+    }
+
+def decode_diagnostics(block, calibration=None):
+    """Return all measurements of 10 byte diagnostics block, calibration is given for externally calibrated modules"""
+    return convert(DIAG_FORMAT.unpack(bytes(block)), calibration)
+
+def decode_thresholds(block, calibration=None):
+    """Return {threshold: measurements} of 40 byte thresholds block at A2h register 0"""
+    values = THRESHOLD_FORMAT.unpack(bytes(block))
+    return {name: convert(values[i::len(THRESHOLDS)], calibration) for i, name in enumerate(THRESHOLDS)}
+
+def check_thresholds(diagnostics, thresholds):
+    """Return {measurement: "high_alarm" | "high_warning" | "low_warning" | "low_alarm" | "ok"} of diagnostics"""
+    flags = {}
+    for name in MEASUREMENTS:
+        value = diagnostics[name]
+        if value > thresholds["high_alarm"][name]:
+            flags[name] = "high_alarm"
+        elif value < thresholds["low_alarm"][name]:
+            flags[name] = "low_alarm"
+        elif value > thresholds["high_warning"][name]:
+            flags[name] = "high_warning"
+        elif value < thresholds["low_warning"][name]:
+            flags[name] = "low_warning"
+        else:
+            flags[name] = "ok"
+    return flags
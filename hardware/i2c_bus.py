@@ -0,0 +1,74 @@
+"""
+Shared SMBus handles, one open handle per bus for the whole process.
+Drivers get a handle with open_bus and give it back with release_bus, the bus is closed when the last driver releases it.
+Every bus call holds the bus lock, so drivers used from different threads do not interleave transactions.
+"""
+import logging
+
+from smbus2 import SMBus
+from threading import Lock, RLock
+
+log = logging.getLogger()
+
+class SharedBus():
+    def __init__(self, channel):
+        """Open SMBus on channel, raises if the bus is not available"""
+        self.channel = channel
+        self.bus = SMBus(channel)
+        self.lock = RLock()  # hold for a group of transactions that must not be interleaved, e.g. behind a switch
+        self.references = 0
+        self.transactions = 0
+
+    def _call(self, method, *args):
+        with self.lock:
+            self.transactions += 1
+            return getattr(self.bus, method)(*args)
+
+    def read_byte(self, address):
+        return self._call("read_byte", address)
+
+    def write_byte(self, address, value):
+        return self._call("write_byte", address, value)
+
+    def read_byte_data(self, address, register):
+        return self._call("read_byte_data", address, register)
+
+    def read_word_data(self, address, register):
+        return self._call("read_word_data", address, register)
+
+    def read_i2c_block_data(self, address, register, length):
+        return self._call("read_i2c_block_data", address, register, length)
+
+    def i2c_rdwr(self, *messages):
+        return self._call("i2c_rdwr", *messages)
+
+_buses = {}  # channel -> SharedBus
+_buses_lock = Lock()
+
+def open_bus(channel):
+    """Return shared handle of bus on channel, opened on first use"""
+    with _buses_lock:
+        bus = _buses.get(channel)
+        if bus is None:
+            bus = SharedBus(channel)
+            _buses[channel] = bus
+        bus.references += 1
+        return bus
+
+def release_bus(bus):
+    """Give back handle returned by open_bus, close the bus if no driver uses it anymore"""
+    with _buses_lock:
+        bus.references -= 1
+        if bus.references > 0:
+            return
+        if _buses.get(bus.channel) is bus:
+            del _buses[bus.channel]
+    try:
+        bus.bus.close()
+    except Exception as e:
+        log.debug(f"Error when closing i2c bus {bus.channel}: {e}")
+
+def get_open_buses():
+    """Return {channel: number of drivers using it} of open buses"""
+    with _buses_lock:
+        return {channel: bus.references for channel, bus in _buses.items()}
@@ -5,8 +5,10 @@ I2C SMBus protocol
 Datasheet: https://www.nxp.com/docs/en/data-sheet/PCA9546A.pdf
 """
 import logging
-from smbus2 import SMBus
+from threading import RLock
+from contextlib import contextmanager
 
+from .i2c_bus import open_bus, release_bus
 from ...src.constants import I2C_CHANNEL
 
 log = logging.getLogger()
@@ -14,33 +16,50 @@ log = logging.getLogger()
 class Pca9546a():
     def __init__(self, address):
         """Init smbus channel and Pca9546 driver on specified address."""
+        self.selected = None  # channel configuration last written to the switch, None if unknown
+        self.lock = RLock()  # held while a group of reads on one channel is in progress
+        self.transactions = 0  # i2c transactions on the switch
+        self.writes_skipped = 0  # select_channel calls with the configuration already selected
+
+        self.i2c_bus = None
         try:
-            self.i2c_bus = SMBus(I2C_CHANNEL)
+            self.i2c_bus = open_bus(I2C_CHANNEL)
+            self.lock = self.i2c_bus.lock  # devices behind the switch share the bus, so a channel window holds the whole bus
             self.i2c_address = address              # whatever we see on RPi
             if self.read_config_register() is None:
                 raise ValueError
         except ValueError:
             log.error("Pca9546 ERROR: No device found on address {}!".format(hex(address)))
-            self.i2c_bus = None
+            self.close()
         except:
             log.error("Bus on channel {} is not available. Error raised by Pca9546.".format(I2C_CHANNEL))
             log.info("Available busses are listed as /dev/i2c*")
-            self.i2c_bus = None
+            self.close()
    
     def __del__(self):
         """Driver destructor."""
-        self.i2c_bus = None
+        self.close()
+
+    def close(self):
+        """Release shared i2c bus"""
+        if self.i2c_bus is not None:
+            release_bus(self.i2c_bus)
+            self.i2c_bus = None
 
     def read_config_register(self):
+        self.transactions += 1
         try:
-            return self.i2c_bus.read_byte(self.i2c_address)
+            self.selected = self.i2c_bus.read_byte(self.i2c_address)
+            return self.selected
         except Exception as e:
             log.error(f"An exception occured when trying to read config register: {e}")
+            self.selected = None
             return None
 
     def select_channel(self, val=None, ch0=0, ch1=0, ch2=0, ch3=0):
         """
         Set internal register to desired combination of channels.
+        The write is skipped if the combination is already selected.
         """
 
         if type(val) is not int:
@@ -51,27 +70,38 @@ class Pca9546a():
             log.error(f"Specified channel configuration must be between 0000 (0 dec) and 1111 (15 dec)")
             return False
 
-        if ch0 < 0 or ch0 > 1:
-            log.error(f"Channel 0 must be set to either 0 or 1")
-            return False
-
-        if ch1 < 0 or ch1 > 1:
-            log.error(f"Channel 1 must be set to either 0 or 1")
-            return False
-        
-        if ch2 < 0 or ch2 > 1:
-            log.error(f"Channel 2 must be set to either 0 or 1")
-            return False
-
-        if ch3 < 0 or ch3 > 1:
-            log.error(f"Channel 3 must be set to either 0 or 1")
-            return False
+        for i, ch in enumerate((ch0, ch1, ch2, ch3)):
+            if ch < 0 or ch > 1:
+                log.error(f"Channel {i} must be set to either 0 or 1")
+                return False
 
         if val is None:
             val = ch0 | (ch1<<1) | (ch2<<2) | (ch3<<3)
-        try:
-            self.i2c_bus.write_byte(self.i2c_address, val)
-            return True
-        except Exception as e:
-            log.error(f"An exception occured when trying to write config register: {e}")
-            return False
+
+        with self.lock:
+            if val == self.selected:  # switch is only written by this driver, so the tracked configuration is still valid
+                self.writes_skipped += 1
+                return True
+
+            self.transactions += 1
+            try:
+                self.i2c_bus.write_byte(self.i2c_address, val)
+                self.selected = val
+                return True
+            except Exception as e:
+                log.error(f"An exception occured when trying to write config register: {e}")
+                self.selected = None
+                return False
+
+    @contextmanager
+    def channel(self, val):
+        """
+        Select channel configuration and hold the switch for a group of reads, yield True if selected.
+        Usage: `with switch.channel(0x01) as selected: ...`
+        """
+        with self.lock:
+            yield self.select_channel(val=val)
+
+    def get_stats(self):
+        """Return i2c transactions and skipped channel writes of the switch"""
+        return {"transactions": self.transactions, "writes_skipped": self.writes_skipped}
@@ -1,9 +1,11 @@
 """Made with https://cdn.hackaday.io/files/21599924091616/AN_2030_DDMI_for_SFP_Rev_E2.pdf"""
-from smbus2 import SMBus
-import numpy as np
+from smbus2 import i2c_msg
 import logging
 import time
 
+from .ddm import *
+from .i2c_bus import open_bus, release_bus
+
 I2C_CHANNEL = 1
 
 SFP_I2C_PROBE_BUS_MAX = 5
@@ -27,6 +29,10 @@ SFP_CHECKSUM_REG = 63
 
 SFP_DIAG_MONITORING_REG = 92
 
+SFP_ID_PAGE_LENGTH = 96  # base (0-63) and extended (64-95) ID fields, read at once on init
+SFP_CHECKSUM_BASE_LENGTH = 63  # register 63 holds the low byte of the sum of registers 0-62
+I2C_BLOCK_LENGTH = 32  # SMBus block read limit, used when the adapter does not support i2c_rdwr
+
 # DIAGNOSTICS REGISTERS
 SFP_DIAG_REG_START = 96  # msb at 96, lsb at 97
 TEMP_OFFSET = 0
@@ -57,111 +63,114 @@ class Sfp():
                 "tx_power_dBm": None,
                 "rx_power_dBm": None,
                 "tx_power": None,
-                "rx_power": None
-            }
+                "rx_power": None,
+                "vcc": None,
+                "tx_bias": None
+            },
+            "flags": {}
         }
 
+        self.id_page = None  # raw ID page, cached on init
+        self.checksum_valid = None
+        self.thresholds = None  # alarm and warning thresholds, None if module has no diagnostics
+        self.calibration = None  # external calibration constants, None if module is internally calibrated
+
+        self.i2c_bus = None
         try:
-            self.i2c_bus = SMBus(I2C_CHANNEL)
+            self.i2c_bus = open_bus(I2C_CHANNEL)
             self.init()
         except Exception as e:
             log.error("An error occured during sfp initializion!")
-            self.i2c_bus = None
+            self.close()
             raise Exception(e)
    
     def __del__(self):
         """Driver destructor."""
-        self.i2c_bus = None
+        self.close()
+
+    def close(self):
+        """Release shared i2c bus"""
+        if self.i2c_bus is not None:
+            release_bus(self.i2c_bus)
+            self.i2c_bus = None
 
     def init(self):
-        """Init and read all info registers"""
+        """Read ID page in one transfer and parse all info registers from it"""
         try:
-            manufacturer = self.i2c_bus.read_i2c_block_data(SFP_I2C_INFO_ADDRESS, SFP_MANUFACTURER_REG, SFP_MANUFACTURER_LENGTH)
-            self.data["module_info"]["manufacturer"] = "".join(chr(x) for x in manufacturer)
-        except Exception as e:
-            raise Exception(f"An error occured during manufacturer data i2c read: {e}")
-
-        try:    
-            revision = self.i2c_bus.read_i2c_block_data(SFP_I2C_INFO_ADDRESS, SFP_REVISION_REG, SFP_REVISION_LENGTH)
-            self.data["module_info"]["revision"] = "".join(chr(x) for x in revision)
+            page = self.read_id_page()
         except Exception as e:
-            raise Exception(f"An error occured during revision i2c read: {e}")
-
-        try:    
-            serial_num = self.i2c_bus.read_i2c_block_data(SFP_I2C_INFO_ADDRESS, SFP_SERIAL_NO_REG, SFP_SERIAL_NO_LENGTH)
-            self.data["module_info"]["serial_num"] = "".join(chr(x) for x in serial_num)
-        except Exception as e:
-            raise Exception(f"An error occured during serial number i2c read: {e}")
-
-        try:    
-            self.data["module_info"]["sfp_type"] = self.i2c_bus.read_byte_data(SFP_I2C_INFO_ADDRESS, SFP_TYPE_REG)
-        except Exception as e:
-            raise Exception(f"An error occured during sfp type i2c read: {e}")
-        
+            raise Exception(f"An error occured during ID page i2c read: {e}")
+
+        self.checksum_valid = sum(page[:SFP_CHECKSUM_BASE_LENGTH]) & 0xFF == page[SFP_CHECKSUM_REG]
+        if not self.checksum_valid:
+            log.warning("Sfp ID page checksum mismatch, module info may be corrupted")
+        self.id_page = page
+
+        self.data["module_info"]["manufacturer"] = "".join(chr(x) for x in page[SFP_MANUFACTURER_REG:SFP_MANUFACTURER_REG + SFP_MANUFACTURER_LENGTH])
+        self.data["module_info"]["revision"] = "".join(chr(x) for x in page[SFP_REVISION_REG:SFP_REVISION_REG + SFP_REVISION_LENGTH])
+        self.data["module_info"]["serial_num"] = "".join(chr(x) for x in page[SFP_SERIAL_NO_REG:SFP_SERIAL_NO_REG + SFP_SERIAL_NO_LENGTH])
+        self.data["module_info"]["sfp_type"] = page[SFP_TYPE_REG]
+        self.data["module_info"]["connector"] = page[SFP_CONNECTOR_REG]
+        self.data["module_info"]["bitrate"] = page[SFP_BITRATE_REG] * 100
+        self.data["module_info"]["wavelength"] = page[SFP_WAVELENGTH_REG] * 256 + page[SFP_WAVELENGTH_REG + 1]  # msb first
+        self.diag_settings = page[SFP_DIAG_MONITORING_REG]
+
+        self.init_diagnostics()
+
+    def init_diagnostics(self):
+        """Read and cache alarm/warning thresholds and external calibration constants of A2h page"""
+        if not self.diag_settings & DIAG_IMPLEMENTED:
+            log.warning("Sfp does not implement digital diagnostics")
+            return
         try:
-            self.data["module_info"]["connector"] = self.i2c_bus.read_byte_data(SFP_I2C_INFO_ADDRESS, SFP_CONNECTOR_REG)
+            page = self.read_block(SFP_I2C_DIAG_ADDRESS, THRESHOLDS_REG, STATIC_PAGE_LENGTH)
         except Exception as e:
-            raise Exception(f"An error occured during connector type i2c read: {e}")
+            log.warning(f"An error occured during thresholds i2c read: {e}")
+            return
 
-        try:    
-            self.data["module_info"]["bitrate"] = self.i2c_bus.read_byte_data(SFP_I2C_INFO_ADDRESS, SFP_BITRATE_REG) * 100
-        except Exception as e:
-            raise Exception(f"An error occured during bitrate i2c read: {e}")
+        if self.diag_settings & EXTERNALLY_CALIBRATED:
+            self.calibration = decode_calibration(page[CALIBRATION_REG:CALIBRATION_REG + CALIBRATION_LENGTH])
+        self.thresholds = decode_thresholds(page[THRESHOLDS_REG:THRESHOLDS_REG + THRESHOLDS_LENGTH], self.calibration)
 
-        try:    
-            wavelength = self.i2c_bus.read_word_data(SFP_I2C_INFO_ADDRESS, SFP_WAVELENGTH_REG)
-            self.data["module_info"]["wavelength"] = (wavelength & 0xff) * 256 + ((wavelength & 0xff00) >> 8)
-        except Exception as e:
-            raise Exception(f"An error occured during wavelength i2c read: {e}")
+    def read_id_page(self):
+        """Read ID page from address 0x50"""
+        return self.read_block(SFP_I2C_INFO_ADDRESS, 0, SFP_ID_PAGE_LENGTH)
 
-        try:    
-            self.diag_settings = self.i2c_bus.read_byte_data(SFP_I2C_INFO_ADDRESS, SFP_DIAG_MONITORING_REG)
+    def read_block(self, address, reg, length):
+        """Read length registers with a single i2c_rdwr transaction, fall back to SMBus block reads"""
+        try:
+            write = i2c_msg.write(address, [reg])
+            read = i2c_msg.read(address, length)
+            self.i2c_bus.i2c_rdwr(write, read)
+            return bytes(read)
         except Exception as e:
-            raise Exception(f"An error occured during diagnostics settings i2c read: {e}")
+            log.debug(f"Combined i2c read failed, reading in blocks: {e}")
 
-    def convert_to_fp(self, number, num_bits, divisor):
-        """Convert num_bits bit number to a floating point number"""
-        val = 0
-        for bit in range(0, num_bits):
-            val += (number & (1 << bit)) / divisor
-        return val
+        block = bytearray()
+        for start in range(reg, reg + length, I2C_BLOCK_LENGTH):
+            block += bytes(self.i2c_bus.read_i2c_block_data(address, start, min(I2C_BLOCK_LENGTH, reg + length - start)))
+        return bytes(block)
 
-    def convert_to_dB(self, mW):
-        """Convert mW to dB and return value"""
-        if mW == 0.0:
-            return -40.0  # -40.0 is lower limit
-        return 10 * np.log10(mW)
+    def get_id_page(self):
+        """Return raw ID page read on init"""
+        return self.id_page
 
     def get_diagnostics(self):
         """Get sfp module diagnostics"""
-
         diagnostics_block = self.i2c_bus.read_i2c_block_data(SFP_I2C_DIAG_ADDRESS, SFP_DIAG_REG_START, DIAG_DATA_LENGTH)
-        temp_bytes = diagnostics_block[TEMP_OFFSET: VCC_OFFSET]
-        temp_h = float(np.int8(temp_bytes[0]))  # signed int8
-        temp_l = self.convert_to_fp(temp_bytes[1], 8, 256)
-        temp = temp_h + temp_l
-        self.data["diagnostics"]["temp"] = temp
-
-        # next is transciever supply voltage - skip this for now
-
-        # next is tx bias current in uA - skip
-
-        # next is tx output power in mW
-        tx_bytes = diagnostics_block[TX_POWER_OFFSET:RX_POWER_OFFSET]
-        tx_power = float(np.uint16((tx_bytes[0] << 8) | tx_bytes[1]) / 10000)  # LSB is equal to 100 uW, so the range is [0, 6.5535]mW
-        self.data["diagnostics"]["tx_power"] = tx_power
-        tx_power_dbm = round(self.convert_to_dB(tx_power), 3)
-        self.data["diagnostics"]["tx_power_dBm"] = float(tx_power_dbm)
-
-        # next is rx received power in mW
-        rx_bytes = diagnostics_block[RX_POWER_OFFSET:]
-        rx_power = float(np.uint16((rx_bytes[0] << 8) | rx_bytes[1]) / 10000) # LSB is equal to 100 uW, so the range is [0, 6.5535]mW
-        self.data["diagnostics"]["rx_power"] = rx_power
-        rx_power_dbm = round(self.convert_to_dB(rx_power), 3)
-        self.data["diagnostics"]["rx_power_dBm"] = float(rx_power_dbm)
-
+        self.data["diagnostics"].update(decode_diagnostics(diagnostics_block, self.calibration))
+        if self.thresholds is not None:
+            self.data["flags"] = check_thresholds(self.data["diagnostics"], self.thresholds)
         return self.data["diagnostics"]
 
+    def get_thresholds(self):
+        """Get alarm and warning thresholds read on init, None if module has no diagnostics"""
+        return self.thresholds
+
+    def get_flags(self):
+        """Get threshold crossing of each measurement on last diagnostics read"""
+        return self.data["flags"]
+
     def get_module_info(self):
         """Get data"""
         return self.data["module_info"]
@@ -1,8 +1,7 @@
 import logging
-from xmlrpc.server import SimpleXMLRPCServer
-from xmlrpc.server import SimpleXMLRPCRequestHandler
 
 from .src.koruza import Koruza
+from .src.rpc_server import create_server
 
 # config loggers
 logging.getLogger("filelock").disabled = True # disable filelock logger
@@ -18,14 +17,8 @@ log = logging.getLogger()
 log.info("-------------- NEW RUN with logging enabled --------------")
 
 if __name__ == "__main__":
-    # Restrict to a particular path.
-    class RequestHandler(SimpleXMLRPCRequestHandler):
-        rpc_paths = ('/RPC2',)
-
-    with SimpleXMLRPCServer(('localhost', 8000),
-                            requestHandler=RequestHandler, allow_none=True, logRequests=False) as server:
-        server.register_introspection_functions()
-        server.register_instance(Koruza())
+    # Requests are handled in a worker pool, slow methods run in a separate pool
+    with create_server(Koruza(), ('localhost', 8000)) as server:
         log.info("Serving XML-RPC on localhost port 8000")
         try:
             server.serve_forever()
@@ -0,0 +1,293 @@
+"""
+Automatic link alignment - scans motor positions while sampling SFP rx power and converges on the peak
+"""
+
+import math
+import time
+import random
+import logging
+
+from threading import Thread, Lock, Event
+
+from .motor_control import MOTOR_LIMIT, clamp
+
+log = logging.getLogger()
+
+SCAN_STEP = 500  # motor steps between neighbouring scan points
+SCAN_RADIUS = 5000  # scan area half width around the start position, in motor steps
+MIN_STEP = 50  # hill climbing stops when step is halved below this
+NO_SIGNAL_DBM = -40.0  # sfp reading without signal
+
+class AlignmentState():
+    IDLE = "idle"
+    RUNNING = "running"
+    DONE = "done"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+class ScanPattern():
+    SPIRAL = "spiral"  # square spiral outwards from start position, then hill climb from best point
+    RASTER = "raster"  # serpentine grid around start position, then hill climb from best point
+    ADAPTIVE = "adaptive"  # hill climb from start position with halving step
+
+class AlignmentCancelled(Exception):
+    pass
+
+class MoveStalled(Exception):
+    """Raised by move_to when motors stalled before reaching the target, the point is skipped"""
+    pass
+
+def spiral_points(center_x, center_y, step, radius):
+    """Yield points of a square spiral around center, ring by ring"""
+    yield center_x, center_y
+    for ring in range(1, radius // step + 1):
+        d = ring * step
+        x, y = center_x - d, center_y - d
+        for dx, dy in ((1, 0), (0, 1), (-1, 0), (0, -1)):  # walk the ring edges
+            for _ in range(2 * ring):
+                yield x, y
+                x += dx * step
+                y += dy * step
+
+def raster_points(center_x, center_y, step, radius):
+    """Yield points of a serpentine grid around center, row by row"""
+    offsets = list(range(-(radius // step) * step, radius + 1, step))
+    for row, dy in enumerate(offsets):
+        for dx in (offsets if row % 2 == 0 else reversed(offsets)):
+            yield center_x + dx, center_y + dy
+
+class AlignmentEngine():
+    def __init__(self, move_to, read_power, get_position, clock=time.time, limit=MOTOR_LIMIT):
+        """
+        Init alignment engine on top of given motor and power callables:
+            - move_to(x, y) moves motors, blocks until the move completes and returns reached (x, y),
+              raises MoveStalled if motors stalled on the way
+            - read_power(after) returns rx power in dBm measured after timestamp `after`
+            - get_position() returns current (x, y)
+        """
+        self.move_to = move_to
+        self.read_power = read_power
+        self.get_position = get_position
+        self.clock = clock
+        self.limit = limit
+
+        self.lock = Lock()
+        self.cancel_event = Event()
+        self.thread = None
+
+        self.status = self._new_status(AlignmentState.IDLE, None)
+        self.samples = {}
+
+    def _new_status(self, state, pattern):
+        return {
+            "state": state,
+            "pattern": pattern,
+            "progress": 0.0,  # estimated, 1.0 when done
+            "points": 0,  # sampled positions
+            "moves": 0,
+            "best": None,  # {"x", "y", "rx_power_dBm"}
+            "skipped": [],  # {"x", "y", "error"} of points not sampled because motors stalled
+            "current": None,
+            "start_time": self.clock(),
+            "elapsed": 0.0,
+            "error": None,
+        }
+
+    def start(self, pattern=ScanPattern.SPIRAL, step=SCAN_STEP, radius=SCAN_RADIUS, min_step=MIN_STEP, target_dBm=None):
+        """Start alignment in background thread, return False if one is already running"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            self.cancel_event.clear()
+            self.status = self._new_status(AlignmentState.RUNNING, pattern)
+            self.thread = Thread(target=self.run, args=(pattern, step, radius, min_step, target_dBm), daemon=True)
+            self.thread.start()
+        return True
+
+    def cancel(self):
+        """Cancel running alignment, motors stay at the last sampled position"""
+        self.cancel_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def is_running(self):
+        return self.status["state"] == AlignmentState.RUNNING
+
+    def get_status(self):
+        """Return progress and best position found so far"""
+        with self.lock:
+            status = dict(self.status)
+            status["skipped"] = list(status["skipped"])
+        if status["state"] == AlignmentState.RUNNING:
+            status["elapsed"] = self.clock() - status["start_time"]
+        return status
+
+    def run(self, pattern=ScanPattern.SPIRAL, step=SCAN_STEP, radius=SCAN_RADIUS, min_step=MIN_STEP, target_dBm=None):
+        """Run alignment in calling thread and return final status"""
+        with self.lock:
+            if self.status["state"] != AlignmentState.RUNNING:
+                self.status = self._new_status(AlignmentState.RUNNING, pattern)
+        self.samples = {}  # (x, y) -> rx power, positions are never sampled twice
+
+        try:
+            start_x, start_y = self.get_position()
+            if pattern == ScanPattern.ADAPTIVE:
+                self._climb(start_x, start_y, step, min_step, progress_start=0.0)
+            else:
+                if pattern == ScanPattern.SPIRAL:
+                    points = spiral_points(start_x, start_y, step, radius)
+                elif pattern == ScanPattern.RASTER:
+                    points = raster_points(start_x, start_y, step, radius)
+                else:
+                    raise ValueError(f"Unknown scan pattern: {pattern}")
+                total_points = (2 * (radius // step) + 1) ** 2
+                for index, (x, y) in enumerate(points):
+                    power = self._sample(x, y)
+                    self._set_progress(0.8 * (index + 1) / total_points)
+                    if target_dBm is not None and power >= target_dBm:
+                        break
+                best = self._get_best()
+                self._climb(best["x"], best["y"], max(step // 2, min_step), min_step, progress_start=0.8)
+
+            best = self._get_best()
+            self._move(best["x"], best["y"])  # finish on the best sampled position
+            state = AlignmentState.DONE
+        except AlignmentCancelled:
+            state = AlignmentState.CANCELLED
+        except Exception as e:
+            log.error(f"Alignment failed: {e}")
+            with self.lock:
+                self.status["error"] = str(e)
+            state = AlignmentState.FAILED
+
+        with self.lock:
+            self.status["state"] = state
+            self.status["elapsed"] = self.clock() - self.status["start_time"]
+            if state == AlignmentState.DONE:
+                self.status["progress"] = 1.0
+            status = dict(self.status)
+            status["skipped"] = list(status["skipped"])
+            return status
+
+    def _climb(self, x, y, step, min_step, progress_start):
+        """Hill climb to a local rx power maximum, halving step whenever no neighbour is better"""
+        best_power = self._sample(x, y)
+        direction = None
+        initial_step = step
+        while step >= min_step:
+            directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+            if direction is not None:  # try the direction of the last improvement first
+                directions.remove(direction)
+                directions.insert(0, direction)
+
+            improved = False
+            for dx, dy in directions:
+                nx, ny = self._limit(x + dx * step), self._limit(y + dy * step)
+                if (nx, ny) == (x, y):
+                    continue
+                power = self._sample(nx, ny)
+                if power > best_power:
+                    x, y, best_power, direction = nx, ny, power, (dx, dy)
+                    improved = True
+                    break
+
+            if not improved:
+                step //= 2
+                direction = None
+                done = math.log2(initial_step / max(step, 1)) / max(math.log2(initial_step / min_step) + 1, 1)
+                self._set_progress(progress_start + (1.0 - progress_start) * min(done, 1.0))
+        return x, y, best_power
+
+    def _get_best(self):
+        best = self.status["best"]
+        if best is None:
+            raise Exception("Motors stalled on every sampled position")
+        return best
+
+    def _limit(self, val):
+        return clamp(val, -self.limit, self.limit)
+
+    def _move(self, x, y):
+        """Move to position, return reached position"""
+        if self.cancel_event.is_set():
+            raise AlignmentCancelled()
+        x, y = self.move_to(self._limit(x), self._limit(y))
+        with self.lock:
+            self.status["moves"] += 1
+        return x, y
+
+    def _sample(self, x, y):
+        """Move to position and return rx power measured there, cached per position"""
+        x, y = self._limit(x), self._limit(y)
+        if (x, y) in self.samples:
+            return self.samples[(x, y)]
+
+        try:
+            self._move(x, y)
+        except MoveStalled as e:
+            log.warning(f"Alignment skipped ({x}, {y}): {e}")
+            self.samples[(x, y)] = float("-inf")  # never better than a sampled point, not retried
+            with self.lock:
+                self.status["skipped"].append({"x": x, "y": y, "error": str(e)})
+            return self.samples[(x, y)]
+        power = self.read_power(self.clock())  # first reading taken after the move completed
+        self.samples[(x, y)] = power
+
+        with self.lock:
+            self.status["points"] += 1
+            self.status["current"] = {"x": x, "y": y, "rx_power_dBm": power}
+            best = self.status["best"]
+            if best is None or power > best["rx_power_dBm"]:
+                self.status["best"] = {"x": x, "y": y, "rx_power_dBm": power}
+        return power
+
+    def _set_progress(self, progress):
+        with self.lock:
+            self.status["progress"] = max(self.status["progress"], min(progress, 1.0))
+
+class SimulatedLink():
+    """
+    Simulated motors and rx power map for offline benchmarking of scan strategies.
+    Received power is a gaussian beam centered on the peak, time advances on a simulated clock.
+    """
+    def __init__(self, peak_x=0, peak_y=0, peak_dBm=-3.0, beam_width=1500, noise_dB=0.05,
+                 start_x=0, start_y=0, speed=2000, settle_time=0.1, sample_period=0.2, seed=None):
+        self.peak_x = peak_x
+        self.peak_y = peak_y
+        self.peak_dBm = peak_dBm
+        self.beam_width = beam_width  # motor steps at which power drops to 1/e^0.5 of the peak
+        self.noise_dB = noise_dB
+        self.speed = speed  # motor steps per second
+        self.settle_time = settle_time  # seconds for move completion to be detected
+        self.sample_period = sample_period  # sfp diagnostics update period
+        self.random = random.Random(seed)
+
+        self.x = start_x
+        self.y = start_y
+        self.time = 0.0
+
+    def clock(self):
+        return self.time
+
+    def get_position(self):
+        return self.x, self.y
+
+    def move_to(self, x, y):
+        distance = max(abs(x - self.x), abs(y - self.y))  # axes move at the same time
+        self.time += distance / self.speed + self.settle_time
+        self.x, self.y = x, y
+        return x, y
+
+    def power_at(self, x, y):
+        """Noise free rx power in dBm at position"""
+        r2 = (x - self.peak_x) ** 2 + (y - self.peak_y) ** 2
+        exponent = -r2 / (2 * self.beam_width ** 2)
+        return max(self.peak_dBm + 10 * exponent * math.log10(math.e), NO_SIGNAL_DBM)
+
+    def read_power(self, after):
+        """Return power at current position from the next sfp update after given time"""
+        self.time = (math.floor(max(after, self.time) / self.sample_period) + 1) * self.sample_period
+        power = self.power_at(self.x, self.y)
+        if power > NO_SIGNAL_DBM:
+            power += self.random.gauss(0, self.noise_dB)
+        return round(power, 3)
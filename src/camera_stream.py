@@ -0,0 +1,327 @@
+"""
+Camera frame transport - frames from mjpg-streamer, grabbed continuously from its MJPEG stream
+or as snapshots over a persistent HTTP session, served to local consumers as raw JPEG over HTTP
+and optionally through shared memory
+"""
+
+import time
+import socket
+import struct
+import logging
+import requests
+import urllib.request
+
+from functools import lru_cache
+from collections import deque
+from threading import Thread, Condition, Event, Lock, local
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8
+    shared_memory = None
+
+log = logging.getLogger()
+
+VIDEO_STREAM_PORT = 8080  # mjpg-streamer
+FRAME_SERVER_PORT = 8081
+SNAPSHOT_TIMEOUT = 2  # seconds
+
+STREAM_TIMEOUT = 5  # seconds without data after which the stream is reconnected
+STREAM_RECONNECT_INTERVAL = 1  # seconds
+STREAM_READ_SIZE = 65536
+FRAME_BUFFER_SIZE = 8  # latest frames kept by the grabber
+FRAME_MAX_AGE = 0.5  # seconds, older buffered frames are not returned as a picture
+MAX_FRAME_SIZE = 4 * 1024 * 1024  # parser drops data if a frame grows beyond this
+
+SHARED_FRAME_NAME = "koruza_frame"
+SHARED_FRAME_SIZE = 1024 * 1024  # bytes reserved for one JPEG
+SHARED_FRAME_HEADER = struct.Struct("<QId")  # sequence, jpeg length, timestamp
+
+@lru_cache(maxsize=None)
+def get_local_ip():
+    """Return address of the interface used for outgoing traffic, mjpg-streamer listens on it"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("8.8.8.8", 80))  # no packet is sent, only selects the route
+        return s.getsockname()[0]
+    except OSError:
+        return "127.0.0.1"
+    finally:
+        s.close()
+
+class SnapshotClient():
+    def __init__(self, url=None, timeout=SNAPSHOT_TIMEOUT):
+        """Init snapshot client, every thread keeps its own connection to mjpg-streamer open between snapshots"""
+        self.url = url
+        self.timeout = timeout
+        self.local = local()  # requests.Session is not thread safe
+        self.sessions_lock = Lock()
+        self.sessions = []  # sessions of all threads, closed on close()
+
+    def get_session(self):
+        """Return session of calling thread"""
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+            with self.sessions_lock:
+                self.sessions.append(self.local.session)
+        return self.local.session
+
+    def get_url(self, action="snapshot"):
+        if self.url is not None:
+            return self.url
+        return f"http://{get_local_ip()}:{VIDEO_STREAM_PORT}/?action={action}"
+
+    def get_snapshot(self):
+        """Return JPEG bytes of a new snapshot or None on failure"""
+        try:
+            r = self.get_session().get(self.get_url(), timeout=self.timeout)
+        except requests.RequestException as e:
+            log.error(f"Failed to get camera snapshot: {e}")
+            return None
+        if r.status_code == 200:
+            return r.content
+        return None
+
+    def close(self):
+        with self.sessions_lock:
+            for session in self.sessions:
+                session.close()
+
+class MjpegParser():
+    """
+    Incremental parser of a multipart/x-mixed-replace MJPEG stream as sent by mjpg-streamer.
+    Parts are cut by their Content-Length header when present, otherwise at the next boundary.
+    """
+    def __init__(self, boundary=b"boundarydonotcross"):
+        self.delimiter = b"--" + boundary
+        self.buffer = bytearray()
+        self.length = None  # body length of the current part, None while reading part headers
+        self.dropped_bytes = 0
+
+    def feed(self, data):
+        """Add received data, return list of complete JPEG frames"""
+        self.buffer += data
+        frames = []
+        while True:
+            if self.length is None:
+                end = self.buffer.find(b"\r\n\r\n")
+                if end < 0:
+                    break
+                self.length = -1  # no Content-Length, body ends at next boundary
+                for line in bytes(self.buffer[:end]).split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        self.length = int(value)
+                del self.buffer[:end + 4]
+            elif self.length >= 0:
+                if len(self.buffer) < self.length:
+                    break
+                frames.append(bytes(self.buffer[:self.length]))
+                del self.buffer[:self.length]
+                self.length = None
+            else:
+                end = self.buffer.find(b"\r\n" + self.delimiter)
+                if end < 0:
+                    break
+                frames.append(bytes(self.buffer[:end]))
+                del self.buffer[:end + 2]
+                self.length = None
+
+        if len(self.buffer) > MAX_FRAME_SIZE:
+            self.dropped_bytes += len(self.buffer)
+            self.buffer.clear()
+            self.length = None
+        return frames
+
+class MjpegGrabber():
+    def __init__(self, url=None, buffer_size=FRAME_BUFFER_SIZE, on_frame=None, timeout=STREAM_TIMEOUT):
+        """
+        Init grabber subscribed once to the mjpg-streamer stream, keeps the latest frames in a ring buffer.
+        on_frame(sequence, timestamp, jpeg) is called from the grabber thread for every received frame.
+        """
+        self.url = url
+        self.timeout = timeout
+        self.on_frame = on_frame
+
+        self.frames = deque(maxlen=buffer_size)  # (sequence, timestamp, jpeg), oldest first
+        self.frame_condition = Condition()  # notified on every new frame
+        self.sequence = 0
+
+        self.connected = False
+        self.reconnects = 0
+        self.dropped_bytes = 0
+
+        self.stop_event = Event()
+        self.thread = Thread(target=self._grab_loop, daemon=True)
+        self.thread.start()
+
+    def get_url(self):
+        if self.url is not None:
+            return self.url
+        return f"http://{get_local_ip()}:{VIDEO_STREAM_PORT}/?action=stream"
+
+    def _grab_loop(self):
+        """Read stream and reconnect whenever it breaks"""
+        while not self.stop_event.is_set():
+            try:
+                with urllib.request.urlopen(self.get_url(), timeout=self.timeout) as stream:
+                    boundary = stream.headers.get_param("boundary", "boundarydonotcross")
+                    parser = MjpegParser(boundary.encode())
+                    self.connected = True
+                    log.info("Connected to camera stream")
+                    while not self.stop_event.is_set():
+                        data = stream.read1(STREAM_READ_SIZE)  # returns what has arrived, does not wait for a full block
+                        if not data:
+                            break
+                        for jpeg in parser.feed(data):
+                            self._add_frame(jpeg)
+                        self.dropped_bytes = parser.dropped_bytes
+            except Exception as e:
+                log.debug(f"Camera stream error: {e}")
+            if self.connected:
+                self.reconnects += 1
+            self.connected = False
+            self.stop_event.wait(STREAM_RECONNECT_INTERVAL)
+
+    def _add_frame(self, jpeg):
+        with self.frame_condition:
+            self.sequence += 1
+            frame = (self.sequence, time.time(), jpeg)
+            self.frames.append(frame)
+            self.frame_condition.notify_all()
+        if self.on_frame is not None:
+            self.on_frame(*frame)
+
+    def get_latest(self):
+        """Return latest (sequence, timestamp, jpeg) or None if no frame was received yet"""
+        with self.frame_condition:
+            return self.frames[-1] if self.frames else None
+
+    def wait_for_frame(self, after_sequence=0, timeout=STREAM_TIMEOUT):
+        """
+        Return the first buffered frame with a sequence above after_sequence, waiting for it if needed.
+        Returns the oldest buffered frame if the requested one already left the ring buffer, None on timeout.
+        """
+        with self.frame_condition:
+            if not self.frame_condition.wait_for(lambda: self.sequence > after_sequence, timeout):
+                return None
+            for frame in self.frames:
+                if frame[0] > after_sequence:
+                    return frame
+
+    def get_frame(self, max_age=None, timeout=STREAM_TIMEOUT):
+        """Return latest frame if it is not older than max_age seconds, else wait for the next one"""
+        latest = self.get_latest()
+        if latest is not None and (max_age is None or time.time() - latest[1] <= max_age):
+            return latest
+        return self.wait_for_frame(latest[0] if latest is not None else self.sequence, timeout)
+
+    def get_status(self):
+        """Return stream connection state and frame counters"""
+        latest = self.get_latest()
+        return {
+            "connected": self.connected,
+            "frames": self.sequence,
+            "last_frame_time": latest[1] if latest is not None else None,
+            "reconnects": self.reconnects,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join(self.timeout + STREAM_RECONNECT_INTERVAL)
+
+class SharedFrame():
+    """
+    Latest JPEG frame in a named shared memory block, for local processes reading frames without a socket.
+    Sequence number is odd while a frame is written, readers retry until they read an even, unchanged one.
+    """
+    def __init__(self, name=SHARED_FRAME_NAME, size=SHARED_FRAME_SIZE, create=True):
+        if shared_memory is None:
+            raise RuntimeError("Shared memory requires python 3.8")
+        self.create = create
+        if create:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=SHARED_FRAME_HEADER.size + size)
+            except FileExistsError:  # left over from a previous run
+                self.shm = shared_memory.SharedMemory(name=name)
+            SHARED_FRAME_HEADER.pack_into(self.shm.buf, 0, 0, 0, 0.0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = name
+        self.size = self.shm.size - SHARED_FRAME_HEADER.size
+        self.sequence = 0
+        self.write_lock = Lock()  # the seqlock protects readers only, writers must not interleave
+
+    def write(self, jpeg, timestamp=None):
+        """Publish frame, return False if it does not fit"""
+        if len(jpeg) > self.size:
+            log.warning(f"Frame of {len(jpeg)} B does not fit into shared memory of {self.size} B")
+            return False
+        buf = self.shm.buf
+        with self.write_lock:
+            SHARED_FRAME_HEADER.pack_into(buf, 0, self.sequence + 1, 0, 0.0)  # odd - write in progress
+            buf[SHARED_FRAME_HEADER.size:SHARED_FRAME_HEADER.size + len(jpeg)] = jpeg
+            self.sequence += 2
+            SHARED_FRAME_HEADER.pack_into(buf, 0, self.sequence, len(jpeg), timestamp or time.time())
+        return True
+
+    def read(self, retries=10):
+        """Return (sequence, timestamp, jpeg) of the latest frame, None if there is no frame yet"""
+        buf = self.shm.buf
+        for _ in range(retries):
+            sequence, length, timestamp = SHARED_FRAME_HEADER.unpack_from(buf, 0)
+            if sequence == 0:
+                return None
+            if sequence % 2:
+                time.sleep(0.001)
+                continue
+            jpeg = bytes(buf[SHARED_FRAME_HEADER.size:SHARED_FRAME_HEADER.size + length])
+            if SHARED_FRAME_HEADER.unpack_from(buf, 0)[0] == sequence:
+                return sequence, timestamp, jpeg
+        return None
+
+    def close(self):
+        self.shm.close()
+        if self.create:
+            self.shm.unlink()
+
+class FrameRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for clients pulling frames continuously
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/frame.jpg"):
+            self.send_error(404)
+            return
+        jpeg = self.server.get_frame()
+        if jpeg is None:
+            self.send_error(503, "No camera frame")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(jpeg)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(jpeg)
+
+    def log_message(self, format, *args):
+        log.debug(f"Frame server: {format % args}")
+
+class FrameServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, get_frame, host="localhost", port=FRAME_SERVER_PORT):
+        """Serve frames returned by get_frame() as raw JPEG on http://host:port/frame.jpg"""
+        super().__init__((host, port), FrameRequestHandler)
+        self.get_frame = get_frame
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def get_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/frame.jpg"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
@@ -2,16 +2,21 @@
 Defines and implements actions for TLV protocol used for motor driver communication
 """
 
+import re
 import time
 import serial
 import struct
 import binascii
 import logging
 
+from functools import lru_cache
+from collections import deque
+
 log = logging.getLogger()
 
 # MOVE TO CONSTANTS
 MAX_TLV_COUNT = 25
+MAX_FRAME_SIZE = 1024  # frames longer than this are dropped by FrameReader
 
 ### HELPER FUNCTIONS ###
 def convert_to_bytes(value, num_bytes, signed=False):
@@ -61,6 +66,8 @@ class TlvReply():
 
 """ Contents of the TLV_MOTOR_POSITION TLV """
 class MotorPosition():
+    __slots__ = ("x", "y", "z")
+
     def __init__(self, x=None, y=None, z=None):
         self.x = x  # int32_t type
         self.y = y  # int32_t type
@@ -68,9 +75,11 @@ class MotorPosition():
 
 """ Contents of the TLV_ENCODER_VALUE TLV """
 class EncoderValue():
+    __slots__ = ("x", "y")
+
     def __init__(self, x=None, y=None):
-        self.x = None  # int32_t type
-        self.y = None  # int32_t type
+        self.x = x  # int32_t type
+        self.y = y  # int32_t type
 
 """ Contents of the TLV_VIBRATION_VALUE TLV """
 """ DEPRECATED """
@@ -86,14 +95,18 @@ class VibrationValue():
 
 """ Contents of the TLV_ERROR_REPORT TLV """
 class ErrorReport():
+    __slots__ = ("code",)
+
     def __init__(self, code=None):
-        self.code = None  # uint32_t type
+        self.code = code  # uint32_t type
 
 """ Contents of the TLV_SFP_CALIBRATION TLV """
 class SfpCalibration():
-    def __init__(self, offset_x, offset_y):
-        self.offset_x = None  # uint32_t type
-        self.offset_y = None  # uint32_t type
+    __slots__ = ("offset_x", "offset_y")
+
+    def __init__(self, offset_x=None, offset_y=None):
+        self.offset_x = offset_x  # uint32_t type
+        self.offset_y = offset_y  # uint32_t type
 
 """ Message operations result codes """
 class MessageResult():
@@ -106,19 +119,73 @@ class MessageResult():
     MESSAGE_ERROR_TLV_NOT_FOUND = -6
 
 """ TLV and message classes"""
+TLV_HEADER = struct.Struct(">BH")  # [type: 1 byte] [length: 2 bytes], TLV_HEADER.size == 3
+
+""" Precompiled layouts of TLVs with a fixed size value, header and value are packed in one call """
+TLV_FORMATS = {
+    TlvType.TLV_COMMAND: struct.Struct(">BHB"),
+    TlvType.TLV_REPLY: struct.Struct(">BHB"),
+    TlvType.TLV_CHECKSUM: struct.Struct(">BHI"),
+    TlvType.TLV_MOTOR_POSITION: struct.Struct(">BHiii"),
+    TlvType.TLV_CURRENT_READING: struct.Struct(">BHH"),
+    TlvType.TLV_SFP_CALIBRATION: struct.Struct(">BHII"),
+    TlvType.TLV_ERROR_REPORT: struct.Struct(">BHI"),
+    TlvType.TLV_POWER_READING: struct.Struct(">BHH"),
+    TlvType.TLV_ENCODER_VALUE: struct.Struct(">BHii"),
+}
+
 class Tlv():
-    def __init__(self, type=None, length=None, value=None):
+    def __init__(self, type=None, length=None, value=None, fields=None):
+        """
+        Either value (raw bytes) or fields (values packed with TLV_FORMATS[type]) have to be given.
+        Length can be given as an int or as two big endian bytes, when None it is computed from value or fields.
+        """
+        if length is None:
+            length = TLV_FORMATS[type].size - TLV_HEADER.size if value is None else len(value)
+        elif length.__class__ is not int:
+            length = bytes_to_int(bytearray(length))
         self.type = type
         self.length = length
-        self.value = value
+        self.fields = fields
+        self._value = value
+
+    @property
+    def value(self):
+        """Raw value bytes, packed on first access for tlvs created from fields"""
+        if self._value is None and self.fields is not None:
+            self._value = TLV_FORMATS[self.type].pack(self.type, self.length, *self.fields)[3:]
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self.fields = None
+
+    def encoded_length(self):
+        """Return number of bytes needed to encode tlv"""
+        return self.length + 3
+
+    def encode_into(self, buffer, offset=0):
+        """Encode tlv into a preallocated buffer at offset, return offset after the encoded tlv"""
+        if self.fields is not None:
+            TLV_FORMATS[self.type].pack_into(buffer, offset, self.type, self.length, *self.fields)
+        else:
+            TLV_HEADER.pack_into(buffer, offset, self.type, self.length)
+            buffer[offset + 3:offset + 3 + self.length] = bytes(self._value)
+        return offset + 3 + self.length
 
     def encode(self):
         """Encode tlv to byte string"""
-        encoded = struct.pack("BBB" + "B" * len(self.value), self.type, *self.length, *self.value)
-        return encoded
+        encoded = bytearray(self.length + 3)
+        self.encode_into(encoded)
+        return bytes(encoded)
+
+    def decode(self):
+        """Return decoded tlv value, see decode_tlv"""
+        return decode_tlv(self)
 
     def to_string(self):
-        return f"Tlv type: {self.type}, tlv value: {self.value}"
+        return f"Tlv type: {self.type}, tlv value: {bytes(self.value)}"
 
 """ Representation of a protocol message in bytes """
 class Message():
@@ -129,13 +196,24 @@ class Message():
         """Add tlv object to message. Encode before sending"""
         self.tlvs.append(tlv)
 
-    def encode(self):
-        """Encode all tlvs into byte array"""
-        encoded_msg = b''
+    def encoded_length(self):
+        """Return number of bytes needed to encode all tlvs"""
+        length = 0
+        for tlv in self.tlvs:
+            length += tlv.length + 3
+        return length
+
+    def encode_into(self, buffer, offset=0):
+        """Encode all tlvs into a preallocated buffer at offset, return offset after the last tlv"""
         for tlv in self.tlvs:
-            encoded_msg += tlv.encode()
+            offset = tlv.encode_into(buffer, offset)
+        return offset
 
-        return encoded_msg
+    def encode(self):
+        """Encode all tlvs into byte array"""
+        encoded_msg = bytearray(self.encoded_length())
+        self.encode_into(encoded_msg)
+        return bytes(encoded_msg)
 
 """ Representation of a protocol message in objects (decoded TLVs) """
 class DecodedMessage():
@@ -147,83 +225,96 @@ class DecodedMessage():
         self.tlvs.append(tlv)
 
 """ Create TLV """
-# NOTE: observed weird behaviour with packing bytes in this order or similar: "BHB" should pack 4 bytes but actually packs 5???
+# NOTE: native "BHB" packs 5 bytes because H gets aligned to an even offset - TLV_FORMATS use ">" (big endian, no padding)
 def create_command_tlv(command):
-    tlv = Tlv(TlvType.TLV_COMMAND, [0x00, 0x01], [command])
+    tlv = Tlv(TlvType.TLV_COMMAND, 1, fields=(command,))
     return tlv
 
 def create_reply_tlv(reply):
-    tlv = Tlv(TlvType.TLV_REPLY, [0x00, 0x01], [reply])
+    tlv = Tlv(TlvType.TLV_REPLY, 1, fields=(reply,))
     return tlv
 
 def create_motor_position_tlv(x, y, z):
-    x_bytes = convert_to_bytes(x, 4, signed=True)
-    y_bytes = convert_to_bytes(y, 4, signed=True)
-    z_bytes = convert_to_bytes(z, 4, signed=True)
-    tlv = Tlv(TlvType.TLV_MOTOR_POSITION, [0x00, 0x0C], [*x_bytes, *y_bytes, *z_bytes])
+    tlv = Tlv(TlvType.TLV_MOTOR_POSITION, 12, fields=(x, y, z))
     return tlv
 
 def create_error_report_tlv(report):
-    r_bytes = convert_to_bytes(report, 4)
-    tlv = Tlv(TlvType.TLV_ERROR_REPORT, [0x00, 0x04], [*r_bytes])
+    tlv = Tlv(TlvType.TLV_ERROR_REPORT, 4, fields=(report,))
     return tlv
 
 def create_current_reading_tlv(current):
-    c_bytes = convert_to_bytes(current, 2)
-    tlv = Tlv(TlvType.TLV_CURRENT_READING, [0x00, 0x02], [*c_bytes])
+    tlv = Tlv(TlvType.TLV_CURRENT_READING, 2, fields=(current,))
     return tlv
 
 def create_power_reading_tlv(power):
-    p_bytes = convert_to_bytes(power, 2)
-    tlv = Tlv(TlvType.TLV_POWER_READING, [0x00, 0x02], [*p_bytes])
+    tlv = Tlv(TlvType.TLV_POWER_READING, 2, fields=(power,))
     return tlv
 
 def create_encoder_value_tlv(x, y):
-    x_bytes = convert_to_bytes(x, 4, signed=True)
-    y_bytes = convert_to_bytes(y, 4, signed=True)
-    tlv = Tlv(TlvType.TLV_ENCODER_VALUE, [0x00, 0x08], [*x_bytes, *y_bytes])
+    tlv = Tlv(TlvType.TLV_ENCODER_VALUE, 8, fields=(x, y))
     return tlv
 
 def create_sfp_calibration_tlv(offset_x, offset_y):
-    offset_x_bytes = convert_to_bytes(offset_x, 4)
-    offset_y_bytes = convert_to_bytes(offset_y, 4)
-    tlv = Tlv(TlvType.TLV_SFP_CALIBRATION, [0x00, 0x08], [*offset_x_bytes, *offset_y_bytes])
+    tlv = Tlv(TlvType.TLV_SFP_CALIBRATION, 8, fields=(offset_x, offset_y))
     return tlv
 
 def create_checksum_tlv(message):
-    check_sum = 0
-    tlv_values_appended = b''
+    checksum = 0
     for tlv in message.tlvs:
-        tlv_len = int.from_bytes(bytearray(tlv.length), "big", signed=False)
-        tlv_values_appended += struct.pack("B" * tlv_len,  *tlv.value)
-    checksum = binascii.crc32(tlv_values_appended)
-    checksum_bytes = convert_to_bytes(checksum, 4)
-    tlv = Tlv(TlvType.TLV_CHECKSUM, [0x00, 0x04], [checksum_bytes[0], checksum_bytes[1], checksum_bytes[2], checksum_bytes[3]])
+        checksum = binascii.crc32(tlv.value, checksum)  # crc32 of all tlv values appended, computed without joining them
+    tlv = Tlv(TlvType.TLV_CHECKSUM, 4, fields=(checksum,))
     return tlv
 
+""" Decoders of received TLV values - value layout and the class holding decoded fields, keyed by TLV type """
+TLV_DECODERS = {
+    TlvType.TLV_COMMAND: (struct.Struct(">B"), int),
+    TlvType.TLV_REPLY: (struct.Struct(">B"), int),
+    TlvType.TLV_CHECKSUM: (struct.Struct(">I"), int),
+    TlvType.TLV_MOTOR_POSITION: (struct.Struct(">iii"), MotorPosition),
+    TlvType.TLV_CURRENT_READING: (struct.Struct(">H"), int),
+    TlvType.TLV_SFP_CALIBRATION: (struct.Struct(">II"), SfpCalibration),
+    TlvType.TLV_ERROR_REPORT: (struct.Struct(">I"), ErrorReport),
+    TlvType.TLV_POWER_READING: (struct.Struct(">H"), int),
+    TlvType.TLV_ENCODER_VALUE: (struct.Struct(">ii"), EncoderValue),
+}
+
+def decode_tlv(tlv):
+    """Decode tlv value to int or one of the TLV content classes, values of unknown types are returned undecoded"""
+    decoder = TLV_DECODERS.get(tlv.type)
+    if decoder is None:
+        return tlv.value
+    value_format, value_class = decoder
+    return value_class(*value_format.unpack_from(tlv.value))
+
 """ Parse received TLV """
 def parse_tlv(tlv_bytearray):
     type = tlv_bytearray[0]  #first byte is TLV Type
     length = int.from_bytes(tlv_bytearray[1:3], "big")  #next two bytes are length of value
-    value = struct.unpack("B" * length, tlv_bytearray[3:3+length])
-    tlv = Tlv(type=type, length=length, value=value)  # handle value later when processing tlv
+    value = memoryview(tlv_bytearray)[3:3+length]  # no copy, decode value later with decode_tlv
+    if len(value) != length:
+        raise ValueError(f"Tlv value is {len(value)} bytes long, expected {length}")
+    tlv = Tlv(type=type, length=length, value=value)
     return tlv
 
 # [type: 1 byte] [length: 2 bytes] [value: length bytes] - one TLV
 # [TLV#1] [TLV#2] ...
 """ Parse message consisting of TLV packets """
-def message_parse(message):
+def message_parse(message, verify_checksum=True):
     """
     Parse message containing TLV commands.
     Input is (probably) a byte array coming from the motor driver.
+    With verify_checksum, crc32 of the values preceding the checksum TLV is compared to it,
+    a message without exactly one checksum TLV is a checksum mismatch.
     """
     messages = Message()  # init new message class, parse data into it
+    message = memoryview(message)  # tlvs are parsed from slices of the received message
 
+    checksum = 0
+    checksum_tlvs = 0
     offset = 0
     while offset < len(message):
 
         start_offset = offset
-        unpacked_tlv_type = message[offset:offset+1]  # parse using correct offsets
         offset += 1  # increment offset by 1 (remember, Size is 1 byte in size)
 
         length = int.from_bytes(message[offset:offset+2], "big")  # length is 2 bytes in size
@@ -234,92 +325,188 @@ def message_parse(message):
         try:
             tlv = parse_tlv(tlv_message)
 
-            if unpacked_tlv_type == TlvType.TLV_CHECKSUM:
-                checksum = message_checksum(message[0:start_offset])  # check checksum on message so far
-                if checksum != tlv.value:
+            if tlv.type == TlvType.TLV_CHECKSUM:
+                checksum_tlvs += 1
+                if verify_checksum and (checksum_tlvs > 1 or checksum != tlv.decode()):  # check checksum on message so far
                     return MessageResult.MESSAGE_ERROR_CHECKSUM_MISMATCH, None
+            else:
+                checksum = binascii.crc32(tlv.value, checksum)
 
             messages.add_tlv(tlv)
         except Exception as e:
             log.error(f"During tlv parsing an exception occured: {e}")
-            log.error(f"Failed at parsing: {message}")
+            log.error(f"Failed at parsing: {bytes(message)}")
             return MessageResult.MESSAGE_ERROR_PARSE_ERROR, None
 
+    if verify_checksum and checksum_tlvs != 1:
+        return MessageResult.MESSAGE_ERROR_CHECKSUM_MISMATCH, None
+
     return MessageResult.MESSAGE_SUCCESS, messages  # return value is MessageResult, msg (None if fail)
 
+FRAME_MARKERS = re.compile(b'[\xf1\xf2\xf3]')
+ESCAPED_BYTE = re.compile(b'\xf3(.)', re.DOTALL)  # escape marker and the byte it escapes
+
+def escape(bytes_msg):
+    """Prefix all frame markers in message with 0xf3"""
+    # escape markers are escaped first, so the following replaces can't touch bytes inserted before them
+    return bytes(bytes_msg).replace(b'\xf3', b'\xf3\xf3').replace(b'\xf1', b'\xf3\xf1').replace(b'\xf2', b'\xf3\xf2')
+
+def unescape(payload):
+    """Remove escape characters from payload in a single pass, the byte following 0xf3 is always kept"""
+    return b''.join(ESCAPED_BYTE.split(payload))  # split keeps the captured escaped bytes between the pieces
+
 def build_frame(bytes_msg):
     """Add 0xf1 to beginning of message and 0xf2 to end of message"""
-    insert_indices = []
-    for index, b in enumerate(bytes_msg):
-        # escape all frame markers
-        if b == Marker.START or b == Marker.END or b == Marker.ESCAPE:
-            insert_indices.append(index)
-
-    bytes_msg = bytearray(bytes_msg)  # bytes is immutable, change to bytearray
-    for ind in insert_indices:
-        bytes_msg[ind:ind] = b'\xf3'
-    return b'\xf1' + bytes(bytes_msg) + b'\xf2'
+    return b'\xf1' + escape(bytes_msg) + b'\xf2'
+
+""" Precomputed frames """
+@lru_cache(maxsize=None)
+def command_frame(command):
+    """Return frame containing only the given command and its checksum, built once per command"""
+    msg = Message()
+    msg.add_tlv(create_command_tlv(command))
+    msg.add_tlv(create_checksum_tlv(msg))
+    return build_frame(msg.encode())
+
+class MotorPositionFrame():
+    """Template of a command frame carrying a motor position, only position and checksum are patched per frame"""
+    def __init__(self, command):
+        msg = Message()
+        msg.add_tlv(create_command_tlv(command))
+        msg.add_tlv(create_motor_position_tlv(0, 0, 0))
+        msg.add_tlv(create_checksum_tlv(msg))
+        self.template = msg.encode()
+
+        self.position_offset = msg.tlvs[0].encoded_length() + TLV_HEADER.size
+        self.position_format = TLV_DECODERS[TlvType.TLV_MOTOR_POSITION][0]
+        self.checksum_offset = self.position_offset + self.position_format.size + TLV_HEADER.size
+        self.checksum_format = TLV_DECODERS[TlvType.TLV_CHECKSUM][0]
+        self.command_checksum = binascii.crc32(msg.tlvs[0].value)  # crc32 of command value, continued over position value
+
+    def build(self, x, y, z):
+        """Return frame with given position"""
+        encoded_msg = bytearray(self.template)  # patch a copy, template is shared between threads
+        self.position_format.pack_into(encoded_msg, self.position_offset, x, y, z)
+        position = memoryview(encoded_msg)[self.position_offset:self.position_offset + self.position_format.size]
+        self.checksum_format.pack_into(encoded_msg, self.checksum_offset, binascii.crc32(position, self.command_checksum))
+        return build_frame(encoded_msg)
+
+@lru_cache(maxsize=None)
+def motor_position_frame_template(command):
+    """Return MotorPositionFrame for command, built once per command"""
+    return MotorPositionFrame(command)
+
+def motor_position_frame(command, x, y, z):
+    """Return frame with command and motor position, e.g. COMMAND_MOVE_MOTOR or COMMAND_RESTORE_MOTOR"""
+    return motor_position_frame_template(command).build(x, y, z)
+
+class FrameReader():
+    """
+    Buffered, incremental frame reader.
+    Reads everything waiting on the serial port at once and splits it into frames, starting with 0xf1 and ending with 0xf2.
+    Bytes received after a complete frame are kept for the next read.
+    """
+    def __init__(self, ser, max_frame_size=MAX_FRAME_SIZE):
+        self.ser = ser
+        self.max_frame_size = max_frame_size
+
+        self.frames = deque()  # complete frames waiting to be read
+        self.frame = bytearray()  # frame currently being received
+        self.in_frame = False
+        self.escaped = False
+
+        self.dropped_bytes = 0  # bytes received outside of a frame
+        self.dropped_frames = 0  # truncated or too long frames
+
+    def feed(self, data):
+        """Run received bytes through the deframer, return number of complete frames waiting"""
+        frame = self.frame
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if not self.in_frame:
+                start_index = data.find(b'\xf1', pos)  # resync on next start marker
+                if start_index < 0:
+                    self.dropped_bytes += end - pos
+                    break
+                self.dropped_bytes += start_index - pos
+                frame = bytearray(b'\xf1')
+                self.in_frame = True
+                pos = start_index + 1
+                continue
+
+            if self.escaped:  # escaped byte is always part of the frame
+                frame.append(data[pos])
+                self.escaped = False
+                pos += 1
+            else:
+                marker = FRAME_MARKERS.search(data, pos)
+                if marker is None:
+                    frame += data[pos:]
+                    pos = end
+                else:
+                    marker_index = marker.start()
+                    frame += data[pos:marker_index]
+                    b = data[marker_index]
+                    pos = marker_index + 1
+                    if b == Marker.ESCAPE:
+                        frame.append(b)
+                        self.escaped = True
+                    elif b == Marker.END:  # end of frame if not escaped by '\xf3'
+                        frame.append(b)
+                        self.frames.append(bytes(frame))
+                        frame = bytearray()
+                        self.in_frame = False
+                    else:  # unescaped start marker inside a frame, previous frame was truncated
+                        self.dropped_frames += 1
+                        frame = bytearray(b'\xf1')
+
+            if len(frame) > self.max_frame_size:
+                self.dropped_frames += 1
+                frame = bytearray()
+                self.in_frame = False
+                self.escaped = False
+
+        self.frame = frame
+        return len(self.frames)
+
+    def poll(self):
+        """Read from serial once if no frame is waiting, return next complete frame or None"""
+        if not self.frames:
+            rx = self.ser.read(self.ser.in_waiting or 1)  # block for at least one byte (up to port timeout) if nothing is waiting
+            if rx:
+                self.feed(rx)
+        if self.frames:
+            return self.frames.popleft()
+        return None
+
+    def read_frame(self, timeout=2):
+        """Return next complete frame, read from serial until one is received or timeout expires"""
+        start_time = time.time()
+        while True:
+            frame = self.poll()
+            if frame is not None:
+                return frame
+            if time.time() - start_time > timeout:
+                raise Exception("Serial timed out")
+
+    def clear(self):
+        """Drop complete frames that were not read yet"""
+        self.frames.clear()
+
+    def reset(self):
+        """Drop complete frames and the frame currently being received"""
+        self.frames.clear()
+        self.frame = bytearray()
+        self.in_frame = False
+        self.escaped = False
 
 def read_frame(ser, timeout=2):
-    """Read frame, starting with 0xf1 and ending with 0xf2"""
-    frame = b''  # initialize empty byte
-    start_frame_detected = False
-    prev_char = None
-
-    start_time = time.time()
-
-    while True:
-        rx = ser.read()
-        if rx == b'\xf2' and prev_char != b'\xf3':  # end of frame if not escaped by '\xf3'
-            start_frame_detected = False
-            frame += rx
-            break
-        if rx == b'\xf1' and prev_char != b'\xf3':  # start of new frame
-            start_frame_detected = True
-        if start_frame_detected:
-            frame += rx
-
-        if time.time() - start_time > timeout:
-            raise Exception("Serial timed out")
-
-        prev_char = rx
-    
-    return frame
+    """Read frame, starting with 0xf1 and ending with 0xf2. Bytes following the frame are lost, use FrameReader instead."""
+    return FrameReader(ser).read_frame(timeout)
 
 def clean_frame(frame):
     """Clear markers from frame"""
-    start_index = 0
-    end_index = 0
-    remove_indices = []
-    prev_char = None
-    for index, b in enumerate(frame):
-
-        # clean frame of escape character \xf3
-
-        # clean START markers
-        if b == Marker.START and not prev_char == Marker.END:
-            start_index = index
-        elif b == Marker.START and prev_char == Marker.END:
-            remove_indices.append(index-1)
-        
-        # clean END markers
-        if b == Marker.END and not prev_char == Marker.ESCAPE:
-            end_index = index
-        elif b == Marker.END and prev_char == Marker.ESCAPE:
-            remove_indices.append(index-1)
-
-        # clean ESCAPE markers
-        if b == Marker.ESCAPE and prev_char == Marker.ESCAPE:
-            remove_indices.append(index-1)
-
-        prev_char = b
-
-    frame_byte_array = bytearray(frame)
-    for ind in remove_indices:
-        try:
-            del frame_byte_array[ind]  # remove from byte array
-        except Exception as e:
-            log.error(f"Error removing at index {ind}")
-
-    frame = bytes(frame_byte_array)
-    return frame[start_index+1:end_index - len(remove_indices)]
\ No newline at end of file
+    start_index = frame.find(b'\xf1')
+    end_index = frame.rfind(b'\xf2')  # frames from FrameReader always end with an unescaped end marker
+    return unescape(memoryview(frame)[start_index+1:end_index])
@@ -2,9 +2,11 @@
 Updates local data - used to sync data between modules
 """
 
+import os
 import json
+import atexit
 from pathlib import Path
-from threading import Lock
+from threading import Lock, Thread, Event
 from filelock import FileLock
 
 DATA_FILENAME = "./koruza_v2/koruza_v2_driver/data/data.json"
@@ -12,12 +14,23 @@ CALIBRATION_FILENAME = "./koruza_v2/config/calibration.json"
 FACTORY_DEFAULTS = "./koruza_v2/config/factory_defaults.json"  # file is write protected, login as root and use # chattr +i factory_defaults.json, to restore us chattr -i factory_defaults.json
 CURRENT_CALIBRATION_FILENAME = "./koruza_v2/config/current_calibration.json"
 
+FLUSH_INTERVAL = 10  # seconds between writes of changed motor data to DATA_FILENAME
+
 class DataManager():
-    def __init__(self):
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
         """Init data manager"""
         self.lock = Lock()
+        self.write_lock = Lock()  # keeps data file writes in order, taken before self.lock
 
         self.data = self.load_json_file(DATA_FILENAME)
+        self.dirty = False  # data changed since last write to DATA_FILENAME
+
+        self.flush_interval = flush_interval
+        self.flush_event = Event()
+        self.running = True
+        self.flush_thread = Thread(target=self._flush_loop, daemon=True)
+        self.flush_thread.start()
+        atexit.register(self.close)
 
         print(f"Loading calibration")
         self.calibration = self.load_json_file(CALIBRATION_FILENAME)
@@ -134,15 +147,65 @@ class DataManager():
         self.lock.release()
 
     def update_motors_data(self, key_value_pairs):
-        """Update motors data with given key_value_pairs"""
+        """Update motors data with given key_value_pairs, changes are written to file by the flush thread"""
         self.lock.acquire()
-        with FileLock(DATA_FILENAME + ".lock"):
-            with open(DATA_FILENAME, "w") as data_file:
-                for key, data in key_value_pairs:
-                    self.data["motors"][key] = data
-                    # print(self.motors)
-                json.dump(self.data, data_file, indent=4)
+        changed = False
+        for key, data in key_value_pairs:
+            if self.data["motors"].get(key) != data:
+                self.data["motors"][key] = data
+                changed = True
+                # print(self.motors)
+        if changed:
+            self.dirty = True
         self.lock.release()
+        return changed
+
+    def flush(self):
+        """Write data to file if it changed since last write"""
+        with self.write_lock:
+            self.lock.acquire()
+            if not self.dirty:
+                self.lock.release()
+                return False
+            encoded = json.dumps(self.data, indent=4)
+            self.dirty = False
+            self.lock.release()
+
+            try:
+                self.write_file_atomic(DATA_FILENAME, encoded)  # file is written without holding the data lock
+            except Exception as e:
+                with self.lock:
+                    self.dirty = True  # retry on next flush
+                print(f"Error: {e}")
+                return False
+        return True
+
+    def request_flush(self):
+        """Wake the flush thread to write changed data now, returns without waiting for the write"""
+        self.flush_event.set()
+
+    def close(self):
+        """Stop flush thread and write pending changes"""
+        self.running = False
+        self.flush_event.set()
+        self.flush()
+
+    def _flush_loop(self):
+        """Periodically write changed data to file"""
+        while self.running:
+            self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()  # requests made during the write wake the thread again
+            self.flush()
+
+    def write_file_atomic(self, filename, content):
+        """Write content to temporary file and rename it over filename, so the file is never left half written"""
+        tmp_filename = filename + ".tmp"
+        with FileLock(filename + ".lock"):
+            with open(tmp_filename, "w") as tmp_file:
+                tmp_file.write(content)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_filename, filename)
 
     def get_motor_data(self):
         """Getter for motor data"""
@@ -154,12 +217,11 @@ class DataManager():
     def update_led_data(self, value):
         """Update camera data with given key_value_pairs"""
         self.lock.acquire()
-        with FileLock(DATA_FILENAME + ".lock"):
-            with open(DATA_FILENAME, "w") as data_file:
-                self.data["led"] = value
-                json.dump(self.data, data_file, indent=4)
-                print(f"New led data: {self.data}")
+        self.data["led"] = value
+        self.dirty = True
+        print(f"New led data: {self.data}")
         self.lock.release()
+        self.flush()
 
     def get_led_data(self):
         """Getter for led data"""
@@ -171,12 +233,11 @@ class DataManager():
     def update_zoom_data(self, value):
         """Update camera zoom data with given value"""
         self.lock.acquire()
-        with FileLock(DATA_FILENAME + ".lock"):
-            with open(DATA_FILENAME, "w") as data_file:
-                self.data["zoom"] = value
-                json.dump(self.data, data_file, indent=4)
-                print(f"New zoom data: {self.data}")
+        self.data["zoom"] = value
+        self.dirty = True
+        print(f"New zoom data: {self.data}")
         self.lock.release()
+        self.flush()
 
     def get_zoom_data(self):
         """Getter for zoom data"""
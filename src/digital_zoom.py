@@ -0,0 +1,94 @@
+"""
+Digital zoom - crops camera frames to the configured zoom area in the driver,
+so a zoom change does not restart the video stream service.
+Opt-in with "digital_zoom": true in unit config, the camera then streams full frames and only frames served by the driver are zoomed.
+"""
+
+import io
+import logging
+
+from threading import Lock
+from collections import OrderedDict
+
+try:
+    from PIL import Image
+except ImportError:  # zoom falls back to camera ROI and a service restart
+    Image = None
+
+log = logging.getLogger()
+
+JPEG_QUALITY = 85
+ZOOM_CACHE_SIZE = 4  # zoomed frames kept, keyed on frame sequence and zoom config
+
+def crop_box(x, y, img_p, width, height):
+    """
+    Return (left, top, right, bottom) pixel box of the zoom area with camera config X, Y, IMG_P,
+    same area as the camera ROI: X from the left edge, Y from the bottom edge, IMG_P of the frame size
+    """
+    crop_width = round(img_p * width)
+    crop_height = round(img_p * height)
+    left = min(max(round(x * width), 0), width - crop_width)
+    bottom = min(max(round((1.0 - y) * height), crop_height), height)
+    return left, bottom - crop_height, left + crop_width, bottom
+
+def zoomed_to_frame(x, y, zoom_x, zoom_y, img_p, size):
+    """Convert pixel position in a frame zoomed to area zoom_x, zoom_y, img_p to the full frame, same as focus_on_marker"""
+    return x * img_p + zoom_x * size, (1.0 - zoom_y) * size - (size - y) * img_p
+
+def frame_to_zoomed(x, y, zoom_x, zoom_y, img_p, size):
+    """Convert full frame pixel position to the frame zoomed to area zoom_x, zoom_y, img_p, inverse of zoomed_to_frame"""
+    return (x - zoom_x * size) / img_p, size - ((1.0 - zoom_y) * size - y) / img_p
+
+class DigitalZoom():
+    def __init__(self, x=0, y=0, img_p=1, quality=JPEG_QUALITY, cache_size=ZOOM_CACHE_SIZE):
+        """Init zoom stage with camera config X, Y and IMG_P, IMG_P of 1 passes frames through unchanged"""
+        if Image is None:
+            raise RuntimeError("Digital zoom requires Pillow")
+        self.quality = quality
+        self.cache_size = cache_size
+        self.lock = Lock()
+        self.cache = OrderedDict()  # (sequence, x, y, img_p) -> zoomed jpeg
+        self.config = (0, 0, 1)
+        self.set_config(x, y, img_p)
+
+    def set_config(self, x, y, img_p):
+        """Set zoom area, takes effect on the next frame"""
+        if not 0 < img_p <= 1:
+            raise ValueError(f"IMG_P must be in (0, 1], got {img_p}")
+        with self.lock:
+            self.config = (x, y, img_p)
+
+    def get_config(self):
+        """Return zoom area in the format of camera_util get_camera_config"""
+        x, y, img_p = self.config
+        return {"x": x, "y": y, "img_p": img_p}
+
+    def is_zoomed(self):
+        return self.config[2] < 1
+
+    def apply(self, jpeg, sequence=None):
+        """Return jpeg cropped to the zoom area and scaled back to frame size, frames with a sequence are cached"""
+        config = self.config
+        x, y, img_p = config
+        if jpeg is None or img_p >= 1:
+            return jpeg
+
+        key = (sequence,) + config
+        with self.lock:
+            if sequence is not None and key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        image = Image.open(io.BytesIO(jpeg))
+        width, height = image.size
+        zoomed = image.crop(crop_box(x, y, img_p, width, height)).resize((width, height), Image.BILINEAR)
+        out = io.BytesIO()
+        zoomed.save(out, format="JPEG", quality=self.quality)
+        zoomed_jpeg = out.getvalue()
+
+        if sequence is not None:
+            with self.lock:
+                self.cache[key] = zoomed_jpeg
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return zoomed_jpeg
@@ -1,42 +1,56 @@
 import json
 import serial
-import socket
 import logging
 import requests
 import subprocess
 import logging.handlers
 
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition, Event
 
 from .communication import *
 from .led_control import LedControl
 from .sfp_monitor import SfpMonitor
 from .data_manager import DataManager
 from .gpio_control import GpioControl
-from .motor_control import MotorControl
+from .alignment import AlignmentEngine, ScanPattern, MoveStalled, SCAN_STEP, SCAN_RADIUS, MIN_STEP
+from .tracking import LinkTracker
+from .status_cache import StatusCache
+from .digital_zoom import DigitalZoom, zoomed_to_frame, frame_to_zoomed
+from .spot_detector import SpotDetector
+from .remote_client import RemoteClient, REMOTE_TIMEOUT
+from .camera_stream import SnapshotClient, MjpegGrabber, SharedFrame, FrameServer, FRAME_MAX_AGE, STREAM_TIMEOUT
+from .motor_control import MotorControl, MOVE_TOLERANCE, MOVE_TIMEOUT, clamp
+from .serial_engine import SerialEngine, PRIORITY_HIGH
 
 from ...src.colors import Color
 from ...src.camera_util import *
 from ...src.config_manager import get_config, set_config
 from ...src.constants import DEVICE_MANAGEMENT_PORT
 
-import xmlrpc.client
 
 log = logging.getLogger()
 
+SFP_UPDATE_INTERVAL = 0.2  # seconds between sfp diagnostics updates
+SFP_FAST_UPDATE_INTERVAL = 0.05  # used while link tracking probes rx power
+
+SENSOR_FULL_FRAME = (0, 0, 1)  # camera ROI X, Y, IMG_P while zoom is done by the driver
+VIDEO_STREAM_RESTART = "sudo /bin/systemctl restart video_stream.service"
+CAMERA_FRAME_SIZE = 720  # marker and calibration coordinates are pixels of a 720 x 720 frame
+MIN_MARKER_CONFIDENCE = 0.5  # detected marker is applied to calibration or zoom only above this
+
 class Koruza():
     def __init__(self):
         """Initialize koruza.py wrapper with all drivers"""
         log.info(f"Initialized koruza main")
         self.ser = serial.Serial("/dev/ttyAMA0", baudrate=115200, timeout=2)
-        self.lock = Lock()
+        self.serial_engine = SerialEngine(self.ser)  # owns the port from here on
 
         # Get device configuration
         self.config = get_config()
         log.info(f"Loaded config: {self.config}")
 
-        # Init remote device manager xmlrpc client
-        self.remote_device_manager_client = xmlrpc.client.ServerProxy(f"http://localhost:{DEVICE_MANAGEMENT_PORT}", allow_none=True)
+        # Init remote device manager xmlrpc client, calls time out and can run asynchronously
+        self.remote_client = RemoteClient(f"http://localhost:{DEVICE_MANAGEMENT_PORT}")
 
         # Init config manager
         self.data_manager = DataManager()
@@ -45,11 +59,16 @@ class Koruza():
         self.gpio_control = GpioControl()
         self.gpio_control.sfp_config()
         self.sfp_data = {}  # prepare empty sfp data
+        self.status_cache = StatusCache()  # see get_full_status
+        self.sfp_update = Condition()  # notified on every sfp diagnostics update
+        self.sfp_update_time = 0
+        self.sfp_update_interval = SFP_UPDATE_INTERVAL
+        self.sfp_wakeup = Event()
 
         # Init motor control
         self.motor_control = None
         try:
-            self.motor_control = MotorControl(serial_handler=self.ser, lock=self.lock, data_manager=self.data_manager)  # open serial and start motor driver wrapper
+            self.motor_control = MotorControl(serial_engine=self.serial_engine, data_manager=self.data_manager)  # open serial and start motor driver wrapper
             log.info("Initialized Motor Wrapper")
         except Exception as e:
             log.error(f"Failed to init Motor Driver: {e}")
@@ -70,9 +89,45 @@ class Koruza():
         except Exception as e:
             log.error(f"Failed to init SFP Wrapper: {e}")
 
+        # Init digital zoom if enabled in config, camera then streams full frames and zoom changes do not restart the stream.
+        # Only frames served by the driver are zoomed, clients viewing mjpg-streamer directly see full frames.
+        self.digital_zoom = None
+        if self.config.get("digital_zoom", False):
+            try:
+                self.digital_zoom = DigitalZoom()
+            except Exception as e:
+                log.warning(f"Digital zoom disabled, zoom changes restart video stream: {e}")
+
+        # Init marker detection
+        self.spot_detector = None
+        try:
+            self.spot_detector = SpotDetector()
+        except Exception as e:
+            log.warning(f"Marker detection disabled: {e}")
+
         # Set camera settings to configured calibration
         cam_config = self.get_camera_config()
-        self.update_camera_config(cam_config["X"], cam_config["Y"], cam_config["IMG_P"])
+        self.update_camera_config(x=cam_config["X"], y=cam_config["Y"], img_p=cam_config["IMG_P"])
+
+        # Init alignment engine
+        self.alignment = AlignmentEngine(move_to=self._alignment_move, read_power=self._wait_rx_power, get_position=self.get_motors_position)
+
+        # Init link tracker
+        self.tracker = LinkTracker(move_to=self._alignment_move, read_power=self._wait_rx_power, get_position=self.get_motors_position, set_fast_sampling=self._set_fast_sfp_updates)
+
+        # Init camera frame transport
+        self.snapshot_client = SnapshotClient()
+        self.shared_frame = None
+        try:
+            self.shared_frame = SharedFrame()
+        except Exception as e:
+            log.warning(f"Shared memory frame handoff disabled: {e}")
+        self.frame_grabber = MjpegGrabber(on_frame=self._publish_frame)  # subscribes to the stream once, keeps latest frames
+        self.frame_server = None
+        try:
+            self.frame_server = FrameServer(self.take_picture)
+        except Exception as e:
+            log.error(f"Failed to start frame server: {e}")
 
         # Init ble driver
         self.ble_driver = None
@@ -87,7 +142,23 @@ class Koruza():
     def __del__(self):
         """Destructor"""
         self.running = False
+        self.alignment.cancel()
+        self.tracker.stop()
+        self.sfp_wakeup.set()
         self.sfp_diagnostics_loop.join()
+        if self.sfp_control is not None:
+            self.sfp_control.close()  # sfp loop is stopped, release the shared i2c bus
+        if self.motor_control is not None:
+            self.motor_control.close()  # before the engine, so no status poll waits on it and the last position is flushed
+        self.serial_engine.close()
+        self.data_manager.close()
+        if self.frame_server is not None:
+            self.frame_server.close()
+        self.frame_grabber.close()
+        if self.shared_frame is not None:
+            self.shared_frame.close()
+        self.snapshot_client.close()
+        self.remote_client.close()
 
     def get_unit_id(self):
         """Return device id"""
@@ -152,33 +223,149 @@ class Koruza():
         """Return status of motor"""
         return self.motor_control.get_motors_connected()
 
+    def get_full_status(self, since=None):
+        """
+        Return snapshot of unit status in one call, for dashboards polling many getters.
+        Every section has a timestamp of its last change seen by this method, sections not changed after
+        `since` are left out. Pass timestamp of the previous response as `since` to get only changes.
+        """
+        motors_connected = self.motor_control is not None and self.motor_control.get_motors_connected()
+        sections = {
+            "unit_id": self.get_unit_id(),
+            "sfp_diagnostics": self.sfp_data,
+            "motors_position": self.get_motors_position() if self.motor_control is not None else None,
+            "motor_status": motors_connected,
+            "led": self.get_led_data(),
+            "zoom": self.get_zoom_data(),
+            "calibration": self.get_calibration(),
+        }
+
+        return self.status_cache.update(sections, since)
+
+    def get_motors_moving(self):
+        """Return True while motors are moving after a move command"""
+        return self.motor_control.get_motors_moving()
+
+    def set_motor_poll_intervals(self, moving=None, idle=None):
+        """Set motor status poll interval in seconds while motors are moving and while idle"""
+        self.motor_control.set_poll_intervals(moving, idle)
+
+    def get_motor_command_stats(self):
+        """Return number of requested, sent and merged move commands"""
+        return self.motor_control.get_move_command_stats()
+
+    def get_sfp_i2c_stats(self):
+        """Return sfp i2c transactions of the last update cycle and skipped switch writes"""
+        if self.sfp_control is None:
+            return {}
+        return self.sfp_control.get_i2c_stats()
+
+    def get_serial_metrics(self):
+        """Return motor driver serial queue depth and round trip time metrics"""
+        return self.serial_engine.get_metrics()
+
     def _update_sfp_diagnostics(self):
         """Run in thread to update sfp diagnostics and update LED color"""
         while self.running:
             # TODO handle properly
             # try:
             self.sfp_data = self._get_sfp_data()
+            with self.sfp_update:
+                self.sfp_update_time = time.time()
+                self.sfp_update.notify_all()
             # print(f"Sfp data: {self.sfp_data}")
             rx_power_dBm = self.sfp_data.get("sfp_0", {}).get("diagnostics", {}).get("rx_power_dBm", -40)
             # print(f"Rx_power_dbm: {rx_power_dBm}")
             self.set_led_color(rx_power_dBm)
             # except Exception as e:
             #     log.warning(f"An exception occured when updating sfp diagnostics: {e}")
-            time.sleep(0.2)  # update five times
+            self.sfp_wakeup.wait(self.sfp_update_interval)  # update five times per second, faster while tracking
+            self.sfp_wakeup.clear()
+
+    def _set_fast_sfp_updates(self, enabled):
+        """Raise sfp diagnostics update rate while link tracker is probing"""
+        self.sfp_update_interval = SFP_FAST_UPDATE_INTERVAL if enabled else SFP_UPDATE_INTERVAL
+        if enabled:
+            self.sfp_wakeup.set()
+
+    def _wait_rx_power(self, after, timeout=2):
+        """Block until sfp diagnostics are updated after given timestamp and return rx power of sfp_0"""
+        with self.sfp_update:
+            if not self.sfp_update.wait_for(lambda: self.sfp_update_time > after, timeout):
+                raise Exception("Sfp diagnostics not updated")
+            return self.sfp_data.get("sfp_0", {}).get("diagnostics", {}).get("rx_power_dBm", -40)
+
+    def _alignment_move(self, x, y):
+        """Move motors for alignment engine and return reached position, a stalled move only skips the point"""
+        ret = self.motor_control.move_and_wait(x, y)
+        if ret["status"] == "stalled":
+            raise MoveStalled(f"Move to ({x}, {y}) stalled at ({ret['x']}, {ret['y']})")
+        if ret["status"] != "reached":
+            raise Exception(f"Move to ({x}, {y}) {ret['status']}")
+        return ret["x"], ret["y"]
+
+    def start_alignment(self, pattern=ScanPattern.SPIRAL, step=SCAN_STEP, radius=SCAN_RADIUS, min_step=MIN_STEP, target_dBm=None):
+        """Start automatic alignment in background, pattern is spiral, raster or adaptive"""
+        if self.motor_control is None or self.sfp_control is None or self.tracker.is_running():
+            return False
+        return self.alignment.start(pattern, step, radius, min_step, target_dBm)
+
+    def cancel_alignment(self):
+        """Cancel running automatic alignment"""
+        self.alignment.cancel()
+        return True
 
-    def issue_remote_command(self, command, params):
-        """Issue RPC call to other unit with a RPC client instance"""
-        # make synchronous for now, later this will have to be async for it to work! TODO
-        
+    def get_alignment_status(self):
+        """Return automatic alignment progress and best position found"""
+        return self.alignment.get_status()
+
+    def start_tracking(self, step=None, deadband=None, interval=None):
+        """Start continuous tracking of peak rx power, None keeps current parameter value"""
+        if self.motor_control is None or self.sfp_control is None or self.alignment.is_running():
+            return False
+        self.tracker.configure(step=step, deadband=deadband, interval=interval)
+        return self.tracker.start()
+
+    def stop_tracking(self):
+        """Stop continuous tracking"""
+        self.tracker.stop()
+        return True
+
+    def get_tracking_status(self):
+        """Return tracking parameters and recovered link margin"""
+        return self.tracker.get_status()
+
+    def issue_remote_command(self, command, params, timeout=REMOTE_TIMEOUT):
+        """Issue RPC call to other unit through device manager, return None on error or after timeout seconds"""
+        try:
+            return self.remote_client.call("request_remote", command, params, timeout=timeout)
+        except Exception as e:
+            log.error(f"Failed to get response from remote unit: {e}")
+            return None
+
+    def issue_remote_commands(self, commands, timeout=REMOTE_TIMEOUT):
+        """Issue list of [command, params] to other unit as one forwarded system.multicall, return list of {"result"} or {"error"} dicts"""
         try:
-            # print("Issuing remote command to second unit")
-            response = self.remote_device_manager_client.request_remote(command, params)
-            # print(f"Requested remote done, response: {response}")
-            return response
+            return self.remote_client.batch_forwarded("request_remote", commands, timeout=timeout)
         except Exception as e:
             log.error(f"Failed to get response from remote unit: {e}")
             return None
 
+    def get_link_rx_power(self, timeout=REMOTE_TIMEOUT):
+        """Return local and remote rx power in dBm, remote unit is queried in parallel with the local read"""
+        remote = self.remote_client.call_async("request_remote", "get_sfp_diagnostics", [], timeout=timeout)
+        local_rx_power = self.sfp_data.get("sfp_0", {}).get("diagnostics", {}).get("rx_power_dBm", None)
+        try:
+            remote_rx_power = remote.result().get("sfp_0", {}).get("diagnostics", {}).get("rx_power_dBm", None)
+        except Exception as e:
+            log.error(f"Failed to get remote rx power: {e}")
+            remote_rx_power = None
+        return {"local": local_rx_power, "remote": remote_rx_power}
+
+    def get_remote_metrics(self):
+        """Return remote unit call counts and latencies"""
+        return self.remote_client.get_metrics()
+
     def _get_sfp_data(self):
         self.sfp_control.update_sfp_diagnostics()
         sfp_data = self.sfp_control.get_complete_diagnostics()
@@ -222,6 +409,10 @@ class Koruza():
         """Expose method to move motors to (x, y, z)"""
         self.motor_control.move_motor_to(x, y, 0)
 
+    def move_and_wait(self, x, y, tolerance=MOVE_TOLERANCE, timeout=MOVE_TIMEOUT):
+        """Expose method to move motors to (x, y) and return final position once the move completes"""
+        return self.motor_control.move_and_wait(x, y, tolerance, timeout)
+
     def home(self):
         """Expose method for koruza homing"""
         self.motor_control.home()
@@ -229,48 +420,63 @@ class Koruza():
     def reboot_motor_driver(self):
         """Reboot motor driver."""
         # not implemented on motor end
-        msg = Message()
-        tlv_command = create_command_tlv(TlvCommand.COMMAND_REBOOT)
-        msg.add_tlv(tlv_command)
-        checksum = create_checksum_tlv(msg)
-        msg.add_tlv(checksum)
-        encoded_msg = msg.encode()
-        frame = build_frame(encoded_msg)
-        
+        frame = command_frame(TlvCommand.COMMAND_REBOOT)
 
-        self.lock.acquire()
-        self.ser.write(frame)  # send message over serial
-        self.lock.release()
+        self.serial_engine.send(frame, priority=PRIORITY_HIGH)
         return True
 
     def upgrade_motor_driver(self):
         """Update motor driver MCU firmware"""
-        msg = Message()
-        tlv_command = create_command_tlv(TlvCommand.COMMAND_FIRMWARE_UPGRADE)
-        msg.add_tlv(tlv_command)
-        checksum = create_checksum_tlv(msg)
-        msg.add_tlv(checksum)
-        encoded_msg = msg.encode()
-        frame = build_frame(encoded_msg)
-
-        self.lock.acquire()
-        self.ser.write(frame)  # send message over serial
-        self.lock.release()
+        frame = command_frame(TlvCommand.COMMAND_FIRMWARE_UPGRADE)
+
+        self.serial_engine.send(frame, priority=PRIORITY_HIGH)
         return True
 
-    def take_picture(self):
-        """Take picture and return int array"""
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        LOCALHOST = s.getsockname()[0]
-        s.close()
-        VIDEO_STREAM_SRC = f"http://{LOCALHOST}:8080/?action=snapshot"
-
-        r = requests.get(VIDEO_STREAM_SRC, stream=True)
-        if r.status_code == 200:
-            return r.content  # returning this is by faaaar the fastest method, takes 0.2 seconds for whole call - check commit #cee4070 for some tests
-        else:
+    def take_picture(self, max_age=FRAME_MAX_AGE, zoom=True):
+        """
+        Return JPEG bytes of the latest stream frame not older than max_age seconds, 0 waits for the next frame.
+        Frame is cropped to the configured zoom area unless zoom is False.
+        """
+        if self.frame_grabber.connected:
+            frame = self.frame_grabber.get_frame(max_age)
+            if frame is not None:
+                sequence, _, jpeg = frame
+                return self._zoom(jpeg, sequence) if zoom else jpeg  # returning JPEG bytes is by faaaar the fastest method - check commit #cee4070 for some tests
+
+        jpeg = self.snapshot_client.get_snapshot()  # stream not available, fall back to a snapshot
+        if jpeg is not None and self.shared_frame is not None:
+            self.shared_frame.write(jpeg)
+        return self._zoom(jpeg) if zoom else jpeg
+
+    def _zoom(self, jpeg, sequence=None):
+        """Crop frame to zoom area, frames are already zoomed by the camera without digital zoom"""
+        if self.digital_zoom is None:
+            return jpeg
+        return self.digital_zoom.apply(jpeg, sequence)
+
+    def wait_for_frame(self, after_sequence=0, timeout=STREAM_TIMEOUT):
+        """Return first stream frame with sequence above after_sequence as dict with sequence, timestamp and jpeg"""
+        frame = self.frame_grabber.wait_for_frame(after_sequence, timeout)
+        if frame is None:
             return None
+        sequence, timestamp, jpeg = frame
+        return {"sequence": sequence, "timestamp": timestamp, "jpeg": self._zoom(jpeg, sequence)}
+
+    def get_camera_stream_status(self):
+        """Return camera stream connection state and frame counters"""
+        return self.frame_grabber.get_status()
+
+    def _publish_frame(self, sequence, timestamp, jpeg):
+        """Hand every full resolution stream frame over to local consumers through shared memory"""
+        if self.shared_frame is not None:
+            self.shared_frame.write(jpeg, timestamp)
+
+    def get_frame_endpoint(self):
+        """Return raw JPEG frame URL and shared memory name, frames there skip XML-RPC base64 encoding"""
+        return {
+            "url": self.frame_server.get_url() if self.frame_server is not None else None,
+            "shared_memory": self.shared_frame.name if self.shared_frame is not None else None,
+        }
 
     def hard_reset(self):
         """Power cycle motor driver unit"""
@@ -302,22 +508,74 @@ class Koruza():
         if zoom_factor is not None:
             x, y, img_p = calculate_camera_config(zoom_factor)
         # set new values
+        if self.digital_zoom is not None:
+            self.digital_zoom.set_config(x, y, img_p)  # applied from the next frame on
+            self._set_sensor_config(*SENSOR_FULL_FRAME)  # no-op unless camera was zoomed before
+        else:
+            self._set_sensor_config(x, y, img_p)
+
+    def _set_sensor_config(self, x, y, img_p):
+        """Set camera ROI and restart video stream service, only if ROI changed"""
+        current = get_camera_config()
+        if (current["x"], current["y"], current["img_p"]) == (x, y, img_p):
+            return False
         set_camera_config(x, y, img_p)
 
         # restart video stream service
-        subprocess.call("sudo /bin/systemctl restart video_stream.service".split(" "))
+        subprocess.call(VIDEO_STREAM_RESTART.split(" "))
+        return True
+
+    def _get_zoom_config(self):
+        """Return active zoom area as x, y, img_p dict"""
+        if self.digital_zoom is not None:
+            return self.digital_zoom.get_config()
+        return get_camera_config()
 
     def update_camera_calib(self, cam_config=None):
         """Update camera_config in calibration.json"""
         if cam_config is None:
-            cam_config = get_camera_config()
+            cam_config = self._get_zoom_config()
         self.data_manager.update_camera_config({"X": cam_config["x"], "Y": cam_config["y"], "IMG_P": cam_config["img_p"]})
 
 
     def update_current_camera_calib(self):
-        cam_config = get_camera_config()
+        cam_config = self._get_zoom_config()
         self.data_manager.update_current_camera_config({"X": cam_config["x"], "Y": cam_config["y"], "IMG_P": cam_config["img_p"]})
 
+    def detect_marker(self, update_calibration=False, focus=False, min_confidence=MIN_MARKER_CONFIDENCE):
+        """
+        Detect bright spot or marker on the camera frame and return its position in calibration coordinates
+        with confidence. Above min_confidence the position is optionally stored as calibration offset
+        and the zoom area is centered on it.
+        """
+        if self.spot_detector is None:
+            return None
+        jpeg = self.take_picture(zoom=False)  # full frame with digital zoom, zoomed by the camera without it
+        if jpeg is None:
+            return None
+        spot = self.spot_detector.detect(jpeg)
+        if spot is None:
+            return None
+
+        zoom = self._get_zoom_config()
+        marker_x = spot["x_norm"] * CAMERA_FRAME_SIZE
+        marker_y = spot["y_norm"] * CAMERA_FRAME_SIZE
+        if self.digital_zoom is None:
+            marker_x, marker_y = zoomed_to_frame(marker_x, marker_y, zoom["x"], zoom["y"], zoom["img_p"], CAMERA_FRAME_SIZE)
+        result = {"marker_x": round(marker_x, 2), "marker_y": round(marker_y, 2), "confidence": spot["confidence"], "applied": False}
+        if spot["confidence"] < min_confidence:
+            return result
+
+        if update_calibration:
+            self.update_calibration({"offset_x": round(marker_x), "offset_y": round(marker_y)})
+            result["applied"] = True
+        if focus:
+            # focus_on_marker expects marker in zoomed frame coordinates
+            zoomed_x, zoomed_y = frame_to_zoomed(marker_x, marker_y, zoom["x"], zoom["y"], zoom["img_p"], CAMERA_FRAME_SIZE)
+            result["focus"] = self.focus_on_marker(zoomed_x, zoomed_y, zoom["img_p"], {"X": zoom["x"], "Y": zoom["y"]})
+            result["applied"] = True
+        return result
+
     def focus_on_marker(self, marker_x, marker_y, img_p, cam_config):
         """Focus on marker from given params"""
         # covert to global coordinates
@@ -333,16 +591,10 @@ class Koruza():
             marker_x, marker_y = calculate_marker_pos(x, y, img_p)
 
         # set new values
-        set_camera_config(clamped_x, clamped_y, img_p)
-
-        # restart video stream service
-        subprocess.call("sudo /bin/systemctl restart video_stream.service".split(" "))
+        self.update_camera_config(x=clamped_x, y=clamped_y, img_p=img_p)
 
         return marker_x, marker_y
 
-def clamp(n, smallest, largest): 
-    return max(smallest, min(n, largest))
-
     # def calibration_forward_transform(self):
     #     """Calibration forward transform"""
     #     self.status["camera_calibration"]["offset_x"] = self.status["camera_calibration"]["global_offset_x"] - \
@@ -1,23 +1,39 @@
 import time
 import serial
 import math 
+import asyncio
 import logging
 import json
+import functools
 
 from .communication import *
-from threading import Thread, Lock
+from .serial_engine import PRIORITY_HIGH, PRIORITY_LOW
+from threading import Thread, Lock, Event, Condition
 
 log = logging.getLogger()
 
+POLL_INTERVAL_MOVING = 0.04  # status poll interval after a move/home command, until position settles
+POLL_INTERVAL_IDLE = 1.0  # status poll interval while motors stand still
+SETTLE_POLLS = 3  # number of consecutive polls with unchanged position after which motion is complete
+MIN_MOVING_TIME = 0.5  # motors may not start moving immediately after command, stay in moving state at least this long
+
+MOVE_TOLERANCE = 10  # steps from target at which move_and_wait considers the target reached
+MOVE_TIMEOUT = 30  # seconds
+STALL_TIME = 1.0  # seconds without position change after which move_and_wait considers motors stalled
+MOTOR_LIMIT = 15000  # motors are limited to +-MOTOR_LIMIT steps
+
+COMMAND_INTERVAL = 0.05  # minimum seconds between move commands, newer targets replace the pending one
+
+def clamp(n, smallest, largest):
+    return max(smallest, min(n, largest))
+
 class MotorControl():
-    def __init__(self, serial_handler, lock, data_manager):
-        """Initialize motor wrapper"""
+    def __init__(self, serial_engine, data_manager, poll_interval_moving=POLL_INTERVAL_MOVING, poll_interval_idle=POLL_INTERVAL_IDLE, command_interval=COMMAND_INTERVAL):
+        """Initialize motor wrapper, all serial traffic goes through the given SerialEngine"""
 
         self.data_manager = data_manager
 
-        self.ser = None
-        self.ser = serial_handler
-        self.lock = lock
+        self.serial_engine = serial_engine
 
         self.motor_wrapper_running = False
 
@@ -32,6 +48,25 @@ class MotorControl():
 
         self.motors_connected = False  # set to true when first data is read
 
+        self.rejected_frames = 0  # replies dropped because of a checksum mismatch
+
+        self.poll_interval_moving = poll_interval_moving
+        self.poll_interval_idle = poll_interval_idle
+        self.moving = False  # set on move/home command, cleared when reported position stops changing
+        self.motion_start = 0
+        self.unchanged_polls = 0
+        self.motion_event = Event()  # wakes status loop when a move command is sent
+        self.status_condition = Condition()  # notified after every status update
+
+        self.command_interval = command_interval
+        self.command_condition = Condition()  # guards move targets, notified on every new target
+        self.target = None  # last requested absolute target (x, y, z), base for relative moves while moving
+        self.pending_target = None  # requested target not yet sent to the driver
+        self.last_command_time = 0
+        self.move_requests = 0
+        self.moves_sent = 0
+        self.moves_merged = 0  # targets replaced by a newer one before they were sent
+
         time.sleep(1)
         self.restore_motor(self.position_x, self.position_y, 0)  # restore motor on init - restore to previous stored position in koruza.py - restore to 0,0,0 here
         time.sleep(0.5)
@@ -39,47 +74,133 @@ class MotorControl():
         self.motor_data_thread = Thread(target=self.motor_status_loop, daemon=True)
         self.motor_data_thread.start()
 
+        self.move_command_thread = Thread(target=self.move_command_loop, daemon=True)
+        self.move_command_thread.start()
+
     def __del__(self):
-        try:
-            if self.ser:
-                self.ser.close()
-                self.ser = None
-        except Exception as e:
-            log.error(f"Error when trying to close serial: {e}")
+        if hasattr(self, "move_command_thread"):  # init completed
+            self.close()
+
+    def close(self):
+        """Stop status and move command loops and wait for them, the last status update is done when this returns"""
+        self.motor_loop_running = False
+        self.motion_event.set()  # wake idle status loop
+        with self.command_condition:
+            self.command_condition.notify()
+        for thread in (self.motor_data_thread, self.move_command_thread):
+            if thread.is_alive():
+                thread.join()
 
     def motor_status_loop(self):
-        """Periodically read motor values"""
+        """Periodically read motor values, fast while motors are moving and slow while idle"""
         while True:
             if self.motor_loop_running:
+                previous_position = (self.position_x, self.position_y, self.position_z)
                 ret = self.get_motor_status()
                 if ret is None:
                     self.motors_connected = False
+                elif ret:
+                    self.update_motion_state(previous_position != (self.position_x, self.position_y, self.position_z))
+                with self.status_condition:
+                    self.status_condition.notify_all()
             else:
                 break
-            time.sleep(0.2)
+
+            interval = self.poll_interval_moving if self.moving else self.poll_interval_idle
+            if self.motion_event.wait(interval):  # move command interrupts idle wait
+                self.motion_event.clear()
+
+    def move_command_loop(self):
+        """Send the latest requested target to the driver, at most once per command interval"""
+        while self.motor_loop_running:
+            with self.command_condition:
+                if self.pending_target is None:
+                    self.command_condition.wait(self.poll_interval_idle)
+                    continue
+                wait = self.last_command_time + self.command_interval - time.time()
+                if wait > 0:
+                    self.command_condition.wait(wait)  # newer targets may replace pending one meanwhile
+                    continue
+                x, y, z = self.pending_target
+                self.pending_target = None
+                self.last_command_time = time.time()
+                self.moves_sent += 1
+
+                # queued under the lock, so a target dropped by clear_targets can not be sent after homing or restore
+                frame = motor_position_frame(TlvCommand.COMMAND_MOVE_MOTOR, x, y, z)
+                self.serial_engine.send(frame, priority=PRIORITY_HIGH)  # sent ahead of queued status polls
+
+    def queue_move(self, x, y, z):
+        """Set new absolute target, replacing a pending one that was not sent yet"""
+        with self.command_condition:
+            self.move_requests += 1
+            if self.pending_target is not None:
+                self.moves_merged += 1
+            self.target = (x, y, z)
+            self.pending_target = self.target
+            self.command_condition.notify()
+        self.start_motion()
+
+    def clear_targets(self):
+        """Drop pending target before a command that moves motors on its own, a move already taken by the command loop is queued before this returns"""
+        with self.command_condition:
+            self.target = None
+            self.pending_target = None
+
+    def get_move_command_stats(self):
+        """Return number of requested, sent and merged move commands"""
+        with self.command_condition:
+            return {
+                "move_requests": self.move_requests,
+                "moves_sent": self.moves_sent,
+                "moves_merged": self.moves_merged,
+                "pending": self.pending_target is not None,
+            }
+
+    def update_motion_state(self, position_changed):
+        """Track whether motors are still moving from reported positions"""
+        if not self.moving:
+            return
+
+        if position_changed:
+            self.unchanged_polls = 0
+        else:
+            self.unchanged_polls += 1
+
+        if self.unchanged_polls >= SETTLE_POLLS and time.time() - self.motion_start > MIN_MOVING_TIME:
+            self.moving = False
+            log.debug("Motors stopped moving")
+            self.data_manager.request_flush()  # persist final position without waiting for the flush interval, written by the flush thread
+
+    def start_motion(self):
+        """Switch status loop to fast polling after a move command"""
+        self.motion_start = time.time()
+        self.unchanged_polls = 0
+        self.moving = True
+        self.motion_event.set()
+
+    def set_poll_intervals(self, moving=None, idle=None):
+        """Set status poll interval in seconds for moving and idle state"""
+        if moving is not None:
+            self.poll_interval_moving = moving
+        if idle is not None:
+            self.poll_interval_idle = idle
+
+    def get_motors_moving(self):
+        """Return True while motors are moving after a move command"""
+        return self.moving
 
     # NOTE: this has to run periodically to get last motor position and move accordingly
     def get_motor_status(self):
         """Get motor status and update state"""
 
-        msg = Message()
-        tlv_command = create_command_tlv(TlvCommand.COMMAND_GET_STATUS)
-        msg.add_tlv(tlv_command)
-        tlv_checksum = create_checksum_tlv(msg)
-        msg.add_tlv(tlv_checksum)
-        encoded_msg = msg.encode()
-        frame = build_frame(encoded_msg)
-
+        frame = command_frame(TlvCommand.COMMAND_GET_STATUS)  # built once, identical for every request
 
-        self.lock.acquire()
-        self.ser.write(frame)  # send message over serial
         try:
-            response = read_frame(self.ser)  # read response
+            response = self.serial_engine.request(frame, priority=PRIORITY_LOW)  # queued behind moves, blocks until reply
             # print(f"Read response: {response}")
-            self.lock.release()
         except Exception as e:
             log.error(f"Error when reading frame: {e}")
-            self.lock.release()
             return None  # return None if serial timed out - no motor connected
 
         if not self.motors_connected:
@@ -89,33 +210,37 @@ class MotorControl():
         
         response_clean = clean_frame(response)
 
-        self.lock.acquire()
         try:
-            parsed = message_parse(response_clean)
+            parsed = message_parse(response_clean, verify_checksum=True)
+            if parsed[0] == MessageResult.MESSAGE_ERROR_CHECKSUM_MISMATCH:
+                self.rejected_frames += 1
+                log.warning(f"Checksum mismatch in motor response, rejected {self.rejected_frames} responses so far")
+                return False  # corrupted reply, keep last known position
+
             if parsed[0] == MessageResult.MESSAGE_SUCCESS:
                 message = parsed[1]
                 for tlv in message.tlvs:
                     # print(f"Tlv type: {tlv.type}")
                     # print(f"Tlv value: {tlv.value}")
                     if tlv.type == TlvType.TLV_MOTOR_POSITION:  # get data from reply
-                        self.position_x = bytes_to_int(bytearray(tlv.value[0:4]), signed=True)
-                        self.position_y = bytes_to_int(bytearray(tlv.value[4:8]), signed=True)
-                        self.position_z = bytes_to_int(bytearray(tlv.value[8:12]), signed=True)
+                        position = tlv.decode()
+                        self.position_x = position.x
+                        self.position_y = position.y
+                        self.position_z = position.z
 
                         self.data_manager.update_motors_data([("last_x", self.position_x), ("last_y", self.position_y)])
                 
                     if tlv.type == TlvType.TLV_ENCODER_VALUE:  # get data from reply
-                        self.encoder_x = bytes_to_int(bytearray(tlv.value[0:4]), signed=True)
-                        self.encoder_y = bytes_to_int(bytearray(tlv.value[4:8]), signed=True)
+                        encoder = tlv.decode()
+                        self.encoder_x = encoder.x
+                        self.encoder_y = encoder.y
 
                         # print(f"Encoder x: {self.encoder_x}, encoder y: {self.encoder_y}")
             
-            self.lock.release()
             return True  # return True if success
 
         except Exception as e:
             log.error(f"Error parsing motor response: {e}")
-            self.lock.release()  # release lock after completion/failure
             return False  # return False if message received but failed to parse
 
 
@@ -131,19 +256,11 @@ class MotorControl():
 
         log.info(f"Restoring motor position")
 
-        msg = Message()
-        tlv_command = create_command_tlv(TlvCommand.COMMAND_RESTORE_MOTOR)
-        msg.add_tlv(tlv_command)
-        motor_position = create_motor_position_tlv(pos_x, pos_y, pos_z)
-        msg.add_tlv(motor_position)
-        checksum = create_checksum_tlv(msg)
-        msg.add_tlv(checksum)
-        encoded_msg = msg.encode()
-        frame = build_frame(encoded_msg)
-
-        self.lock.acquire()
-        self.ser.write(frame)  # send message over serial
-        self.lock.release()
+        self.clear_targets()
+        frame = motor_position_frame(TlvCommand.COMMAND_RESTORE_MOTOR, pos_x, pos_y, pos_z)
+
+        self.serial_engine.send(frame, priority=PRIORITY_HIGH)  # sent ahead of queued status polls
+        self.start_motion()
         return True
         
 
@@ -156,54 +273,73 @@ class MotorControl():
         x = self.limit_motor_movement(x)
         y = self.limit_motor_movement(y)
         z = self.limit_motor_movement(z)
-        msg = Message()
-        tlv_command = create_command_tlv(TlvCommand.COMMAND_MOVE_MOTOR)
-        msg.add_tlv(tlv_command)
-        motor_position = create_motor_position_tlv(x, y, z)
-        msg.add_tlv(motor_position)
-        checksum = create_checksum_tlv(msg)
-        msg.add_tlv(checksum)
-        encoded_msg = msg.encode()
-        frame = build_frame(encoded_msg)
-
-        self.lock.acquire()
-        self.ser.write(frame)  # send message over serial
-        self.lock.release()
+
+        self.queue_move(x, y, z)
         return True
 
 
     def move_motor(self, x, y, z):
-        """Move motor relative to current position"""
+        """Move motor relative to current position, or to the last target while motors are still moving"""
 
         if not self.motors_connected:
             return False
 
         log.info("Moving motors")
 
-        x = self.position_x + x
-        y = self.position_y + y
-        z = self.position_z + z
+        with self.command_condition:
+            if self.moving and self.target is not None:
+                base_x, base_y, base_z = self.target  # reported position lags behind a burst of moves
+            else:
+                base_x, base_y, base_z = self.position_x, self.position_y, self.position_z
 
-        x = self.limit_motor_movement(x)
-        y = self.limit_motor_movement(y)
-        z = self.limit_motor_movement(z)
+            x = self.limit_motor_movement(base_x + x)
+            y = self.limit_motor_movement(base_y + y)
+            z = self.limit_motor_movement(base_z + z)
 
-        msg = Message()
-        tlv_command = create_command_tlv(TlvCommand.COMMAND_MOVE_MOTOR)
-        msg.add_tlv(tlv_command)
-        motor_position = create_motor_position_tlv(x, y, z)
-        msg.add_tlv(motor_position)
-        checksum = create_checksum_tlv(msg)
-        msg.add_tlv(checksum)
-        encoded_msg = msg.encode()
-        frame = build_frame(encoded_msg)
-
-        self.lock.acquire()
-        self.ser.write(frame)  # send message over serial
-        self.lock.release()
+            self.queue_move(x, y, z)
         return True
 
 
+    def move_and_wait(self, x, y, tolerance=MOVE_TOLERANCE, timeout=MOVE_TIMEOUT, stall_time=STALL_TIME):
+        """
+        Move motors to (x, y) and block until the reported position is within tolerance of target,
+        motors stall or timeout expires. Return dict with status, final position and elapsed time.
+        Status is one of "reached", "stalled", "timeout" or "not_connected".
+        """
+        start = time.time()
+        if not self.move_motor_to(x, y, 0):
+            return {"status": "not_connected", "x": self.position_x, "y": self.position_y, "elapsed": 0.0}
+
+        target_x = self.limit_motor_movement(x)
+        target_y = self.limit_motor_movement(y)
+
+        last_position = None
+        last_change = start
+        with self.status_condition:
+            while True:
+                now = time.time()
+                position = (self.position_x, self.position_y)
+                if abs(position[0] - target_x) <= tolerance and abs(position[1] - target_y) <= tolerance:
+                    status = "reached"
+                    break
+                if position != last_position:
+                    last_position = position
+                    last_change = now
+                elif now - last_change > stall_time and now - start > MIN_MOVING_TIME:
+                    status = "stalled"
+                    break
+                if now - start > timeout:
+                    status = "timeout"
+                    break
+                self.status_condition.wait(min(stall_time, timeout - (now - start)))  # woken on every status update
+
+        return {"status": status, "x": self.position_x, "y": self.position_y, "elapsed": time.time() - start}
+
+    async def move_and_wait_async(self, x, y, tolerance=MOVE_TOLERANCE, timeout=MOVE_TIMEOUT, stall_time=STALL_TIME):
+        """Asyncio equivalent of move_and_wait, waits in the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.move_and_wait, x, y, tolerance, timeout, stall_time))
+
     def home(self):
         """Home to center"""
 
@@ -212,17 +348,11 @@ class MotorControl():
 
         log.info("Homing")
 
-        msg = Message()
-        cmd_home_motor = create_command_tlv(TlvCommand.COMMAND_HOMING)
-        msg.add_tlv(cmd_home_motor)
-        checksum = create_checksum_tlv(msg)
-        msg.add_tlv(checksum)
-        encoded_msg = msg.encode()
-        frame = build_frame(encoded_msg)
-
-        self.lock.acquire()
-        self.ser.write(frame)  # send message over serial
-        self.lock.release()
+        self.clear_targets()
+        frame = command_frame(TlvCommand.COMMAND_HOMING)
+
+        self.serial_engine.send(frame, priority=PRIORITY_HIGH)  # sent ahead of queued status polls
+        self.start_motion()
         return True
 
     def get_motors_connected(self):
@@ -230,8 +360,8 @@ class MotorControl():
         return self.motors_connected
 
     def limit_motor_movement(self, val):
-        if val > 15000:
-            return 15000
-        if val < -15000:
-            return -15000
+        if val > MOTOR_LIMIT:
+            return MOTOR_LIMIT
+        if val < -MOTOR_LIMIT:
+            return -MOTOR_LIMIT
         return val
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Remote unit RPC client - calls to the device manager with per-call timeouts over kept-alive connections,
+asynchronous calls in a worker pool, batching of several calls into one round trip to the device manager and
+forwarding a batch to the remote unit as one system.multicall
+"""
+
+import time
+import socket
+import logging
+import xmlrpc.client
+
+from threading import Lock, local
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger()
+
+REMOTE_TIMEOUT = 5  # seconds
+REMOTE_WORKERS = 4  # asynchronous calls running at the same time
+
+class TimeoutTransport(xmlrpc.client.Transport):
+    """XML-RPC transport with a socket timeout, the HTTP/1.1 connection is reused between calls"""
+    def __init__(self, timeout=REMOTE_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)  # returns the open connection if there is one
+        connection.timeout = self.timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(self.timeout)
+        return connection
+
+class RemoteClient():
+    def __init__(self, url, timeout=REMOTE_TIMEOUT, workers=REMOTE_WORKERS):
+        """Init client of XML-RPC server at url, every thread gets its own kept-alive connection"""
+        self.url = url
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="remote")
+        self.local = local()
+        self.transports = []  # all thread transports, closed on close()
+
+        self.metrics_lock = Lock()
+        self.method_metrics = {}  # method name -> {"calls", "errors", "timeouts", "total_latency", "max_latency", "last_latency"}
+
+    def _get_proxy(self, timeout):
+        """Return proxy of calling thread with given timeout"""
+        if not hasattr(self.local, "proxy"):
+            self.local.transport = TimeoutTransport(timeout)
+            self.local.proxy = xmlrpc.client.ServerProxy(self.url, transport=self.local.transport, allow_none=True)
+            with self.metrics_lock:
+                self.transports.append(self.local.transport)
+        self.local.transport.timeout = timeout
+        return self.local.proxy
+
+    def call(self, method, *params, timeout=None):
+        """Call remote method in calling thread and return its result, raises on error or timeout"""
+        proxy = self._get_proxy(timeout or self.timeout)
+        start = time.perf_counter()
+        try:
+            result = getattr(proxy, method)(*params)
+        except Exception as e:
+            self._record(method, time.perf_counter() - start, e)
+            self.local.transport.close()  # connection state is unknown after an error, reconnect on next call
+            raise
+        self._record(method, time.perf_counter() - start)
+        return result
+
+    def call_async(self, method, *params, timeout=None):
+        """Call remote method in the worker pool, return Future of its result, wrap with asyncio.wrap_future in coroutines"""
+        return self.executor.submit(self.call, method, *params, timeout=timeout)
+
+    def batch(self, calls, timeout=None):
+        """
+        Call list of (method, params) in one round trip with system.multicall, or one by one over the same
+        connection when the server does not support it. Return list of {"result": value} or {"error": message} in call order.
+        """
+        proxy = self._get_proxy(timeout or self.timeout)
+        multicall = xmlrpc.client.MultiCall(proxy)
+        for method, params in calls:
+            getattr(multicall, method)(*params)
+
+        start = time.perf_counter()
+        try:
+            results = multicall()
+        except xmlrpc.client.Fault as e:
+            self._record("system.multicall", time.perf_counter() - start, e)
+            log.debug(f"Multicall not supported by remote server, calling one by one: {e}")
+            return [self._batch_result(lambda method=method, params=params: self.call(method, *params, timeout=timeout)) for method, params in calls]
+        except Exception as e:
+            self._record("system.multicall", time.perf_counter() - start, e)
+            self.local.transport.close()
+            raise
+        self._record("system.multicall", time.perf_counter() - start)
+        return [self._batch_result(lambda i=i: results[i]) for i in range(len(calls))]  # MultiCallIterator raises failed calls on access
+
+    def batch_forwarded(self, forward_method, calls, timeout=None):
+        """
+        Call list of (method, params) on the unit behind forward_method, e.g. request_remote, with one forwarded
+        system.multicall, so the batch is one round trip to that unit too. When the forwarded multicall is not
+        supported, every call is forwarded on its own in one batch. Return list like batch.
+        """
+        multicall = [{"methodName": method, "params": list(params)} for method, params in calls]
+        try:
+            results = self.call(forward_method, "system.multicall", [multicall], timeout=timeout)
+            if not isinstance(results, list) or len(results) != len(calls):
+                raise ValueError(f"Unexpected forwarded multicall response: {results}")
+        except (xmlrpc.client.Fault, ValueError) as e:
+            log.debug(f"Forwarded multicall not supported, forwarding calls one by one: {e}")
+            return self.batch([(forward_method, (method, list(params))) for method, params in calls], timeout=timeout)
+        return [{"result": result[0]} if isinstance(result, list) else {"error": result.get("faultString", str(result))} for result in results]  # fault structs for failed calls
+
+    def _batch_result(self, get_result):
+        try:
+            return {"result": get_result()}
+        except Exception as e:
+            return {"error": str(e)}
+
+    def batch_async(self, calls, timeout=None):
+        """Run batch in the worker pool, return Future of its results"""
+        return self.executor.submit(self.batch, calls, timeout=timeout)
+
+    def _record(self, method, latency, error=None):
+        with self.metrics_lock:
+            metrics = self.method_metrics.setdefault(method, {"calls": 0, "errors": 0, "timeouts": 0, "total_latency": 0.0, "max_latency": 0.0, "last_latency": None})
+            metrics["calls"] += 1
+            if error is not None:
+                metrics["errors"] += 1
+                if isinstance(error, socket.timeout):
+                    metrics["timeouts"] += 1
+            metrics["total_latency"] += latency
+            metrics["max_latency"] = max(metrics["max_latency"], latency)
+            metrics["last_latency"] = latency
+
+    def get_metrics(self):
+        """Return per method call, error and timeout counts with average, max and last latency in seconds"""
+        with self.metrics_lock:
+            return {
+                method: {
+                    "calls": metrics["calls"],
+                    "errors": metrics["errors"],
+                    "timeouts": metrics["timeouts"],
+                    "avg_latency": metrics["total_latency"] / metrics["calls"],
+                    "max_latency": metrics["max_latency"],
+                    "last_latency": metrics["last_latency"],
+                }
+                for method, metrics in self.method_metrics.items()
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self.metrics_lock:
+            for transport in self.transports:
+                transport.close()
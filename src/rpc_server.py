@@ -0,0 +1,234 @@
+"""
+XML-RPC server handling requests concurrently in a bounded thread pool.
+Slow methods (camera, systemctl, remote unit and network calls) are handed over to a separate, smaller pool
+as soon as their request is read, so they never hold a main worker and fast getters and motor commands stay responsive.
+"""
+
+import io
+import re
+import time
+import logging
+import xmlrpc.client
+
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+log = logging.getLogger()
+
+RPC_WORKERS = 16  # requests handled at the same time
+SLOW_WORKERS = 2  # slow method calls running at the same time
+SLOW_QUEUE = 8  # slow calls waiting for a slow worker, further slow calls are rejected with a fault
+
+SLOW_METHODS = (
+    "take_picture",
+    "wait_for_frame",
+    "update_camera_config",
+    "focus_on_marker",
+    "detect_marker",
+    "issue_remote_command",
+    "issue_remote_commands",
+    "get_link_rx_power",
+    "update_unit",
+    "move_and_wait",
+    "cancel_alignment",
+    "stop_tracking",
+)
+
+METHOD_NAME = re.compile(rb"<methodName>\s*([^<\s]+)\s*</methodName>")
+MULTICALL_METHOD_NAME = re.compile(rb"<name>methodName</name>\s*<value>\s*(?:<string>)?\s*([^<\s]+)")  # calls inside system.multicall
+
+class RequestHandler(SimpleXMLRPCRequestHandler):
+    # Restrict to a particular path.
+    rpc_paths = ('/RPC2',)
+
+    def handle(self):
+        """Handle requests of the connection until it is closed or handed over to the slow pool"""
+        self.close_connection = True
+        self.slow_body = None
+        self.detached = self._serve()
+
+    def _serve(self):
+        """Serve requests, return True if the connection was handed over to another thread"""
+        self.handle_one_request()
+        while True:
+            if self.slow_body is not None:
+                body, self.slow_body = self.slow_body, None
+                self.server.slow_executor.submit(self._run_slow, body)
+                return True
+            if self.close_connection:
+                return False
+            self.handle_one_request()
+
+    def _run_slow(self, body):
+        """Handle slow request in the slow pool, then hand the connection back to the main pool"""
+        try:
+            try:
+                self._post(body)
+                self.wfile.flush()  # wfile is buffered, handle_one_request flushes it for requests handled in place
+            finally:
+                self.server.release_slow()
+            if self.close_connection:
+                self._close()
+            else:
+                self.server.executor.submit(self._resume)
+        except Exception:
+            self.server.handle_error(self.request, self.client_address)
+            self._close()
+
+    def _resume(self):
+        try:
+            if not self._serve():
+                self._close()
+        except Exception:
+            self.server.handle_error(self.request, self.client_address)
+            self._close()
+
+    def _close(self):
+        try:
+            super().finish()
+        finally:
+            self.server.shutdown_request(self.request)
+
+    def finish(self):
+        if not self.detached:
+            super().finish()
+
+    def do_POST(self):
+        """Read request body, hand slow calls over to the slow pool, dispatch the rest in this worker"""
+        length = self.headers["content-length"]
+        if not self.is_rpc_path_valid() or length is None:
+            super().do_POST()
+            return
+        body = self.rfile.read(int(length))
+        if self.server.is_slow_request(body):
+            if self.server.reserve_slow():
+                self.slow_body = body
+                return
+            self._send_fault(xmlrpc.client.Fault(1, "Server busy, too many slow calls waiting"))
+            return
+        self._post(body)
+
+    def _post(self, body):
+        """Run SimpleXMLRPCRequestHandler.do_POST on an already read body"""
+        rfile = self.rfile
+        self.rfile = io.BytesIO(body)
+        try:
+            super().do_POST()
+        finally:
+            self.rfile = rfile
+
+    def _send_fault(self, fault):
+        response = xmlrpc.client.dumps(fault, methodresponse=True, allow_none=self.server.allow_none, encoding=self.server.encoding).encode(self.server.encoding, "xmlcharrefreplace")
+        self.send_response(200)
+        self.send_header("Content-type", "text/xml")
+        self.send_header("Content-length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+class PooledXMLRPCServer(SimpleXMLRPCServer):
+    def __init__(self, addr, workers=RPC_WORKERS, slow_workers=SLOW_WORKERS, slow_queue=SLOW_QUEUE, slow_methods=SLOW_METHODS, requestHandler=RequestHandler, **kwargs):
+        """
+        Init server, every request is handled by one of `workers` pool threads.
+        Methods in `slow_methods` run in a separate pool of `slow_workers` threads with at most `slow_queue` calls waiting.
+        """
+        super().__init__(addr, requestHandler=requestHandler, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rpc")
+        self.slow_executor = ThreadPoolExecutor(max_workers=slow_workers, thread_name_prefix="rpc-slow")
+        self.slow_limit = slow_workers + slow_queue
+        self.slow_pending = 0  # slow calls running or waiting in the slow pool
+        self.slow_rejected = 0
+        self.slow_methods = set(slow_methods)
+        self.slow_names = {name.encode() for name in slow_methods}
+
+        self.metrics_lock = Lock()
+        self.method_metrics = {}  # method name -> {"calls", "errors", "total_time", "max_time"}
+
+    def is_slow_request(self, body):
+        """Return True if request body calls a slow method, directly or inside system.multicall"""
+        match = METHOD_NAME.search(body)
+        if match is None:
+            return False
+        if match.group(1) == b"system.multicall":
+            return any(name in self.slow_names for name in MULTICALL_METHOD_NAME.findall(body))
+        return match.group(1) in self.slow_names
+
+    def reserve_slow(self):
+        """Reserve place in the slow pool, return False if it is full"""
+        with self.metrics_lock:
+            if self.slow_pending >= self.slow_limit:
+                self.slow_rejected += 1
+                return False
+            self.slow_pending += 1
+            return True
+
+    def release_slow(self):
+        with self.metrics_lock:
+            self.slow_pending -= 1
+
+    def process_request(self, request, client_address):
+        """Hand connection over to the worker pool and return to accepting new ones"""
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Same as socketserver.ThreadingMixIn, run in a pool thread, connections handed over to the slow pool are closed there"""
+        handler = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+        if handler is None or not getattr(handler, "detached", False):
+            self.shutdown_request(request)
+
+    def _dispatch(self, method, params):
+        """Dispatch method and record its call time"""
+        start = time.perf_counter()
+        error = False
+        try:
+            return super()._dispatch(method, params)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._record(method, time.perf_counter() - start, error)
+
+    def _record(self, method, elapsed, error):
+        with self.metrics_lock:
+            metrics = self.method_metrics.setdefault(method, {"calls": 0, "errors": 0, "total_time": 0.0, "max_time": 0.0})
+            metrics["calls"] += 1
+            metrics["errors"] += error
+            metrics["total_time"] += elapsed
+            metrics["max_time"] = max(metrics["max_time"], elapsed)
+
+    def get_rpc_metrics(self):
+        """Return per method call count, errors, average and max time in seconds"""
+        with self.metrics_lock:
+            return {
+                method: {
+                    "calls": metrics["calls"],
+                    "errors": metrics["errors"],
+                    "avg_time": metrics["total_time"] / metrics["calls"],
+                    "max_time": metrics["max_time"],
+                }
+                for method, metrics in self.method_metrics.items()
+            }
+
+    def get_slow_lane_status(self):
+        """Return slow calls running or waiting and slow calls rejected because the slow pool was full"""
+        with self.metrics_lock:
+            return {"pending": self.slow_pending, "rejected": self.slow_rejected}
+
+    def server_close(self):
+        super().server_close()
+        self.slow_executor.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+
+def create_server(instance, addr=("localhost", 8000), **kwargs):
+    """Return pooled server exposing instance methods, system.* introspection and multicall, and server metrics"""
+    server = PooledXMLRPCServer(addr, allow_none=True, logRequests=False, **kwargs)
+    server.register_introspection_functions()
+    server.register_multicall_functions()
+    server.register_function(server.get_rpc_metrics)
+    server.register_function(server.get_slow_lane_status)
+    server.register_instance(instance)
+    return server
@@ -0,0 +1,260 @@
+"""
+Single owner of the motor driver serial port.
+Frames are written by one writer thread in priority order and replies are read by one reader thread,
+callers get a future resolved with the reply frame.
+"""
+
+import time
+import queue
+import concurrent.futures
+import logging
+import itertools
+
+from collections import deque
+from concurrent.futures import Future
+from threading import Thread, Lock, Event
+
+from .communication import FrameReader
+
+log = logging.getLogger()
+
+PRIORITY_HIGH = 0  # moves, homing, restore - jump ahead of queued status polls
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # periodic status polls
+
+REPLY_TIMEOUT = 2  # seconds to wait for a reply before the request fails
+READ_TIMEOUT = 0.05  # serial read timeout of the reader thread, bounds how late timed out requests are failed
+QUEUE_TIMEOUT = 2  # seconds a blocking request may wait in queue before it is written, on top of the reply timeout
+
+class SerialEngine():
+    def __init__(self, ser, reply_timeout=REPLY_TIMEOUT):
+        """
+        Take ownership of an open serial port and start writer and reader threads.
+        No one else should read from or write to the port after this.
+        """
+        self.ser = ser
+        self.ser.timeout = READ_TIMEOUT
+        self.reply_timeout = reply_timeout
+
+        self.frame_reader = FrameReader(self.ser)
+
+        self.requests = queue.PriorityQueue()
+        self.sequence = itertools.count()  # keeps requests with the same priority in FIFO order
+
+        self.pending = deque()  # (future, sent timestamp, deadline) of written requests waiting for a reply
+        self.expired = 0  # requests timed out since the last request was written, their reply may still arrive
+        self.drop_request = None  # Event set by the reader after it dropped received data, see _drop_late_replies
+        self.pending_lock = Lock()
+
+        self.metrics_lock = Lock()
+        self.metrics = {
+            "frames_sent": 0,
+            "replies_received": 0,
+            "reply_timeouts": 0,
+            "write_errors": 0,
+            "unsolicited_frames": 0,  # frames received while no request was waiting for a reply
+            "late_replies": 0,  # replies to timed out requests, dropped
+            "max_queue_depth": 0,
+            "max_queue_wait": 0.0,  # seconds between submit and write
+            "last_rtt": None,  # seconds between write and reply
+            "max_rtt": None,
+            "rtt_sum": 0.0,
+        }
+
+        self.running = True
+
+        self.writer_thread = Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+        self.reader_thread = Thread(target=self._reader_loop, daemon=True)
+        self.reader_thread.start()
+
+    def close(self):
+        """Stop threads, fail pending requests and close serial"""
+        self.running = False
+        self.writer_thread.join()
+        self.reader_thread.join()
+
+        with self.pending_lock:
+            while self.pending:
+                future, _, _ = self.pending.popleft()
+                future.set_exception(Exception("Serial engine closed"))
+
+        while True:  # requests queued after the writer stopped would never be written
+            try:
+                future = self.requests.get_nowait()[5]
+            except queue.Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_exception(Exception("Serial engine closed"))
+
+        try:
+            self.ser.close()
+        except Exception as e:
+            log.error(f"Error when trying to close serial: {e}")
+
+    def submit(self, frame, priority=PRIORITY_NORMAL, expect_reply=True, timeout=None):
+        """
+        Queue frame for sending and return a Future.
+        The future resolves to the reply frame, or to None when no reply is expected.
+        """
+        future = Future()
+        if timeout is None:
+            timeout = self.reply_timeout
+        self.requests.put((priority, next(self.sequence), frame, expect_reply, timeout, future, time.time()))
+
+        depth = self.requests.qsize()
+        with self.metrics_lock:
+            if depth > self.metrics["max_queue_depth"]:
+                self.metrics["max_queue_depth"] = depth
+        return future
+
+    def send(self, frame, priority=PRIORITY_HIGH):
+        """Queue frame without waiting for a reply (fire and forget)"""
+        return self.submit(frame, priority=priority, expect_reply=False)
+
+    def request(self, frame, priority=PRIORITY_LOW, timeout=None):
+        """
+        Send frame and block until reply is received, raise an exception on timeout.
+        Waits at most QUEUE_TIMEOUT plus timeout seconds, also when the engine is closed or the writer is stuck.
+        """
+        if timeout is None:
+            timeout = self.reply_timeout
+        future = self.submit(frame, priority=priority, expect_reply=True, timeout=timeout)
+        try:
+            return future.result(QUEUE_TIMEOUT + timeout)  # reader thread fails a written request after timeout
+        except concurrent.futures.TimeoutError:
+            future.cancel()  # not written yet, writer skips it
+            raise Exception("Serial request timed out in queue")
+
+    def get_metrics(self):
+        """Return queue depth and round trip time metrics"""
+        with self.metrics_lock:
+            metrics = dict(self.metrics)
+        rtt_sum = metrics.pop("rtt_sum")
+        metrics["avg_rtt"] = rtt_sum / metrics["replies_received"] if metrics["replies_received"] else None
+        metrics["queue_depth"] = self.requests.qsize()
+        with self.pending_lock:
+            metrics["pending_replies"] = len(self.pending)
+        return metrics
+
+    def _writer_loop(self):
+        """Write queued frames in priority order"""
+        while self.running:
+            try:
+                priority, _, frame, expect_reply, timeout, future, queued = self.requests.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled by caller while queued
+
+            if expect_reply:
+                self._drop_late_replies()
+
+            sent = time.time()
+            if expect_reply:  # register before writing, reply can arrive before write returns
+                with self.pending_lock:
+                    self.pending.append((future, sent, sent + timeout))
+
+            try:
+                self.ser.write(frame)
+            except Exception as e:
+                log.error(f"Error when writing frame: {e}")
+                with self.metrics_lock:
+                    self.metrics["write_errors"] += 1
+                if expect_reply:
+                    with self.pending_lock:
+                        try:
+                            self.pending.remove((future, sent, sent + timeout))
+                        except ValueError:
+                            pass  # already failed by reader
+                if not future.done():
+                    future.set_exception(e)
+                continue
+
+            with self.metrics_lock:
+                self.metrics["frames_sent"] += 1
+                if sent - queued > self.metrics["max_queue_wait"]:
+                    self.metrics["max_queue_wait"] = sent - queued
+
+            if not expect_reply:
+                future.set_result(None)
+
+    def _drop_late_replies(self):
+        """
+        Have the reader drop everything received for timed out requests before the next request is written.
+        A late reply still on its way after this is handed to the next request, the reply of that request is then
+        received with no request waiting and dropped, so pairing recovers after one request.
+        """
+        with self.pending_lock:
+            if not self.expired:
+                return
+            self.expired = 0
+            self.drop_request = Event()
+            dropped = self.drop_request
+        dropped.wait(4 * READ_TIMEOUT)  # reader drops between two reads
+
+    def _drop_received(self):
+        """Drop frames received but not handed out yet and unread serial input"""
+        late = len(self.frame_reader.frames)
+        self.frame_reader.reset()
+        try:
+            self.ser.reset_input_buffer()
+        except Exception as e:
+            log.error(f"Error when clearing serial input: {e}")
+        with self.metrics_lock:
+            self.metrics["late_replies"] += late
+
+    def _reader_loop(self):
+        """Read frames and hand them to the oldest request waiting for a reply"""
+        while self.running:
+            with self.pending_lock:
+                dropped, self.drop_request = self.drop_request, None
+            if dropped is not None:
+                self._drop_received()
+                dropped.set()
+
+            try:
+                frame = self.frame_reader.poll()
+            except Exception as e:
+                log.error(f"Error when reading frame: {e}")
+                time.sleep(READ_TIMEOUT)
+                continue
+
+            received = time.time()
+            self._expire_pending(received)
+
+            if frame is None:
+                continue
+
+            with self.pending_lock:
+                entry = self.pending.popleft() if self.pending else None
+                late = entry is None and self.expired > 0
+
+            if entry is None:
+                with self.metrics_lock:
+                    self.metrics["late_replies" if late else "unsolicited_frames"] += 1  # frames of timed out requests are late replies
+                continue
+
+            future, sent, _ = entry
+            rtt = received - sent
+            with self.metrics_lock:
+                self.metrics["replies_received"] += 1
+                self.metrics["last_rtt"] = rtt
+                self.metrics["rtt_sum"] += rtt
+                if self.metrics["max_rtt"] is None or rtt > self.metrics["max_rtt"]:
+                    self.metrics["max_rtt"] = rtt
+            future.set_result(frame)
+
+    def _expire_pending(self, now):
+        """Fail requests whose reply did not arrive in time, their late replies are dropped before the next request is written"""
+        expired = []
+        with self.pending_lock:
+            while self.pending and self.pending[0][2] < now:
+                expired.append(self.pending.popleft())
+            self.expired += len(expired)
+
+        for future, _, _ in expired:
+            with self.metrics_lock:
+                self.metrics["reply_timeouts"] += 1
+            future.set_exception(Exception("Serial timed out"))
@@ -29,15 +29,21 @@ class SfpMonitor():
         self.data = {
             "sfp_0": {
                 "module_info": {},
-                "diagnostics": {}
+                "diagnostics": {},
+                "thresholds": {},
+                "flags": {}
             },
             "sfp_1": {
                 "module_info": {},
-                "diagnostics": {}
+                "diagnostics": {},
+                "thresholds": {},
+                "flags": {}
             }
         }
 
         self.init_timestamp = time.time()
+        self.cycle_transactions = 0  # i2c transactions of the last update_sfp_diagnostics call
+        self.cycles = 0
 
         try:
             self.switch = Pca9546a(Pca9546a_address)
@@ -53,69 +59,106 @@ class SfpMonitor():
         """Initialize wrapper"""
         if self.switch is not None:
             self.init_timestamp = time.time()
-            self.switch.select_channel(val=SFP_CAMERA_line)
-            try:
-                self.sfp_0 = Sfp()
-                self.data["sfp_0"]["module_info"] = self.sfp_0.get_module_info()
-                log.info("Initialized sfp 0")
-            except Exception as e:
-                self.data["sfp_0"]["module_info"] = {}
-                log.error(f"Error when initializing sfp 0: {e}")
-
-            self.switch.select_channel(val=SFP_OUT_line)
-            try:
-                self.sfp_1 = Sfp()
-                self.data["sfp_1"]["module_info"] = self.sfp_1.get_module_info()
-                log.info("Initialized sfp 1")
-            except Exception as e:
-                self.data["sfp_1"]["module_info"] = {}
-                log.error(f"Error when initializing sfp 1: {e}")
+            for module_select, line in self._channel_order():
+                with self.switch.channel(line):
+                    try:
+                        self._init_sfp(module_select)
+                        log.info(f"Initialized sfp {module_select}")
+                    except Exception as e:
+                        log.error(f"Error when initializing sfp {module_select}: {e}")
 
             print(self.data)
 
+    def _channel_order(self):
+        """Return (module_select, switch line) of both sfp's, starting with the currently selected line to save a switch write"""
+        lines = [(SFP_CAMERA, SFP_CAMERA_line), (SFP_OUT, SFP_OUT_line)]
+        return sorted(lines, key=lambda item: item[1] != self.switch.selected)
+
+    def _init_sfp(self, module_select):
+        """Init sfp driver on selected line and store its module info, raises if there is no working module"""
+        name = f"sfp_{module_select}"
+        try:
+            sfp = Sfp()
+        except Exception:
+            self.data[name]["module_info"] = {}
+            self.data[name]["thresholds"] = {}
+            raise
+        setattr(self, name, sfp)
+        self.data[name]["module_info"] = sfp.get_module_info()
+        self.data[name]["thresholds"] = sfp.get_thresholds() or {}
+
+    def _update_sfp(self, module_select):
+        """Read diagnostics of initialized sfp on selected line"""
+        name = f"sfp_{module_select}"
+        sfp = getattr(self, name)
+        try:
+            self.data[name]["diagnostics"] = sfp.get_diagnostics()
+            self.data[name]["flags"] = sfp.get_flags()
+        except Exception as e:
+            self.data[name]["diagnostics"] = {}
+            self.data[name]["flags"] = {}
+            log.debug(f"Error when getting sfp {module_select} diagnostics: {e}")
+        try:
+            self.data[name]["module_info"] = sfp.get_module_info()
+            self.data[name]["thresholds"] = sfp.get_thresholds() or {}
+        except Exception as e:
+            self.data[name]["module_info"] = {}
+            self.data[name]["thresholds"] = {}
+            log.debug(f"Error when getting sfp {module_select} module info: {e}")
+
+    def _count_transactions(self):
+        """Return i2c transactions on the bus shared by the switch and both sfp's"""
+        if self.switch.i2c_bus is None:
+            return 0
+        return self.switch.i2c_bus.transactions
+
     def update_sfp_diagnostics(self):
-        """Get data from both sfp's"""
+        """
+        Get data from both sfp's. All reads of one sfp, including re-init of a missing module,
+        are done in one switch window, the switch is only written when the line changes.
+        """
         if self.switch is not None:
-            if self.sfp_0:
-                self.switch.select_channel(val=SFP_CAMERA_line)
-                try:
-                    self.data["sfp_0"]["diagnostics"] = self.sfp_0.get_diagnostics()
-                except Exception as e:
-                    self.data["sfp_0"]["diagnostics"] = {}
-                    log.debug(f"Error when getting sfp 0 diagnostics: {e}")
-                try:
-                    self.data["sfp_0"]["module_info"] = self.sfp_0.get_module_info()
-                except Exception as e:
-                    self.data["sfp_0"]["module_info"] = {}
-                    log.debug(f"Error when getting sfp 0 module info: {e}")
-
-            if self.sfp_1:
-                self.switch.select_channel(val=SFP_OUT_line)
-                try:
-                    self.data["sfp_1"]["diagnostics"] = self.sfp_1.get_diagnostics()
-                except Exception as e:
-                    self.data["sfp_1"]["diagnostics"] = {}
-                    log.debug(f"Error when getting sfp 1 diagnostics: {e}")
-                try:
-                    self.data["sfp_1"]["module_info"] = self.sfp_1.get_module_info()
-                except Exception as e:
-                    self.data["sfp_1"]["module_info"] = {}
-                    log.debug(f"Error when getting sfp 1 module info: {e}")
-            
-            if time.time() - self.init_timestamp > RE_INIT_INTERVAL:
+            start = self._count_transactions()
+
+            re_init = time.time() - self.init_timestamp > RE_INIT_INTERVAL
+            if re_init:
                 self.init_timestamp = time.time()
-                if not self.sfp_0:
-                    self.switch.select_channel(val=SFP_CAMERA_line)
-                    try:
-                        self.sfp_0 = Sfp()
-                    except Exception as e:
-                        log.debug(f"Error when trying to re-initialize sfp 0: {e}")
-                if not self.sfp_1:
-                    self.switch.select_channel(val=SFP_OUT_line)
-                    try:
-                        self.sfp_1 = Sfp()
-                    except Exception as e:
-                        log.debug(f"Error when trying to re-initialize sfp 1: {e}")
+
+            for module_select, line in self._channel_order():
+                initialized = bool(getattr(self, f"sfp_{module_select}"))
+                if not initialized and not re_init:
+                    continue
+                with self.switch.channel(line):
+                    if initialized:
+                        self._update_sfp(module_select)
+                    else:
+                        try:
+                            self._init_sfp(module_select)
+                        except Exception as e:
+                            log.debug(f"Error when trying to re-initialize sfp {module_select}: {e}")
+
+            self.cycle_transactions = self._count_transactions() - start
+            self.cycles += 1
+
+    def get_i2c_stats(self):
+        """Return i2c transactions of the last update cycle, number of cycles and switch stats"""
+        if self.switch is None:
+            return {}
+        return {
+            "cycle_transactions": self.cycle_transactions,
+            "cycles": self.cycles,
+            "switch": self.switch.get_stats(),
+        }
+
+    def close(self):
+        """Release i2c bus of sfp drivers and switch"""
+        for sfp in (self.sfp_0, self.sfp_1):
+            if sfp:
+                sfp.close()
+        self.sfp_0 = None
+        self.sfp_1 = None
+        if self.switch is not None:
+            self.switch.close()
 
     def get_module_info(self, module_select):
         """Return module info of selected module"""
@@ -126,5 +169,5 @@ class SfpMonitor():
         return self.data[f"sfp_{module_select}"]["diagnostics"]
 
     def get_complete_diagnostics(self):
-        """Return both sets of diagnostics"""
+        """Return both sets of diagnostics with thresholds and threshold crossing flags"""
         return self.data
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Laser spot / marker detection - finds the centroid of the brightest spot on a camera frame
+with thresholded image moments on a downscaled grayscale decode
+"""
+
+import io
+import time
+import logging
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+log = logging.getLogger()
+
+DETECT_SIZE = 180  # frames are decoded at the smallest JPEG scale (1/2, 1/4, 1/8) still at least this large
+THRESHOLD_FRACTION = 0.5  # pixels brighter than background + fraction * (peak - background) belong to the spot
+MIN_CONTRAST = 20  # grey levels between peak and background below which there is no spot
+FULL_CONTRAST = 100  # contrast at which contrast part of confidence reaches 1
+
+class SpotDetector():
+    def __init__(self, detect_size=DETECT_SIZE, threshold_fraction=THRESHOLD_FRACTION, min_contrast=MIN_CONTRAST):
+        if Image is None:
+            raise RuntimeError("Spot detection requires Pillow")
+        self.detect_size = detect_size
+        self.threshold_fraction = threshold_fraction
+        self.min_contrast = min_contrast
+
+    def decode(self, jpeg):
+        """Return downscaled grayscale float array and the scale back to full frame pixels"""
+        image = Image.open(io.BytesIO(jpeg))
+        width, height = image.size
+        image.draft("L", (self.detect_size, self.detect_size))  # DCT scaling during decode, much faster than resize
+        image = image.convert("L")
+        return np.asarray(image, dtype=np.float32), width / image.size[0], (width, height)
+
+    def detect(self, jpeg):
+        """
+        Detect spot on JPEG frame, return dict with sub-pixel centroid in full frame pixels ("x", "y"),
+        normalized centroid ("x_norm", "y_norm"), spot "radius" in pixels, "confidence" from 0 to 1 and
+        detection time in seconds. Return None if frame has no spot.
+        """
+        start = time.perf_counter()
+        gray, scale, (width, height) = self.decode(jpeg)
+        spot = find_spot(gray, self.threshold_fraction, self.min_contrast)
+        if spot is None:
+            return None
+        x, y, radius, confidence = spot
+        x = (x + 0.5) * scale - 0.5  # pixel centers of the downscaled frame to full frame pixels
+        y = (y + 0.5) * scale - 0.5
+        return {
+            "x": round(x, 2),
+            "y": round(y, 2),
+            "x_norm": round((x + 0.5) / width, 5),
+            "y_norm": round((y + 0.5) / height, 5),
+            "radius": round(radius * scale, 2),
+            "confidence": confidence,
+            "elapsed": time.perf_counter() - start,
+        }
+
+def find_spot(gray, threshold_fraction=THRESHOLD_FRACTION, min_contrast=MIN_CONTRAST):
+    """
+    Return (x, y, radius, confidence) of the bright spot centroid in array pixels, None without a spot.
+    Confidence is the product of contrast against background and compactness of the thresholded area -
+    a single round spot scores 1, scattered bright pixels or several spots score low.
+    """
+    background = float(np.median(gray[::4, ::4]))  # subsampled median, robust to the spot itself
+    peak = float(gray.max())
+    contrast = peak - background
+    if contrast < min_contrast:
+        return None
+
+    weights = gray - (background + threshold_fraction * contrast)
+    np.maximum(weights, 0, out=weights)
+    mass = float(weights.sum())
+
+    # first moments from row and column projections
+    cols = weights.sum(axis=0)
+    rows = weights.sum(axis=1)
+    xs = np.arange(cols.size, dtype=np.float32)
+    ys = np.arange(rows.size, dtype=np.float32)
+    x = float(cols @ xs) / mass
+    y = float(rows @ ys) / mass
+
+    # second central moments give spread of the spot
+    variance = float(cols @ (xs - x) ** 2 + rows @ (ys - y) ** 2) / mass
+    area = int(np.count_nonzero(weights))
+    compactness = min(area / (2 * np.pi * max(variance, 0.25)), 1.0)  # equals 1 for a uniform disk
+    confidence = round(min(contrast / FULL_CONTRAST, 1.0) * compactness, 3)
+    return x, y, float(np.sqrt(area / np.pi)), confidence
@@ -0,0 +1,36 @@
+"""
+Status sections of the unit with the time of their last change, so pollers can ask only for sections
+changed after their previous poll instead of receiving the full status every time
+"""
+
+import copy
+import time
+
+from threading import Lock
+
+class StatusCache():
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.lock = Lock()
+        self.sections = {}  # section name -> (value, timestamp of last change)
+        self.timestamp = 0  # timestamp of the last update, strictly increasing
+
+    def update(self, sections, since=None):
+        """
+        Store current section values and return status with a timestamp, change time of every section and
+        values of sections changed after `since`. Pass timestamp of the previous response as `since` to get only changes.
+        """
+        with self.lock:
+            # strictly increasing, a change in the same clock tick as the previous response must still be newer than it
+            self.timestamp = max(self.clock(), self.timestamp + 1e-6)
+            for name, value in sections.items():
+                value = copy.deepcopy(value)  # sources are updated in place
+                cached = self.sections.get(name)
+                if cached is None or cached[0] != value:
+                    self.sections[name] = (value, self.timestamp)
+
+            return {
+                "timestamp": self.timestamp,
+                "changed": {name: changed for name, (_, changed) in self.sections.items()},
+                "sections": {name: value for name, (value, changed) in self.sections.items() if since is None or changed > since},
+            }
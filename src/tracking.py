@@ -0,0 +1,186 @@
+"""
+Continuous link tracking - keeps an aligned link on peak rx power with small dithered moves around the current position
+"""
+
+import time
+import logging
+
+from threading import Thread, Lock, Event
+
+from .motor_control import MOTOR_LIMIT, clamp
+
+log = logging.getLogger()
+
+TRACK_STEP = 50  # motor steps of a single dither probe
+TRACK_DEADBAND = 0.2  # dB, probe must improve rx power by more than this to be followed
+TRACK_INTERVAL = 5.0  # minimum seconds between two tracking cycles, limits move rate
+TRACK_SAMPLES = 3  # rx power samples averaged at every probed position
+
+class LinkTracker():
+    def __init__(self, move_to, read_power, get_position, set_fast_sampling=None, clock=time.time,
+                 step=TRACK_STEP, deadband=TRACK_DEADBAND, interval=TRACK_INTERVAL, samples=TRACK_SAMPLES):
+        """
+        Init link tracker on top of given motor and power callables:
+            - move_to(x, y) moves motors, blocks until the move completes and returns reached (x, y)
+            - read_power(after) returns rx power in dBm measured after timestamp `after`
+            - get_position() returns current (x, y)
+            - set_fast_sampling(enabled) optionally raises rx power update rate while probing
+        """
+        self.move_to = move_to
+        self.read_power = read_power
+        self.get_position = get_position
+        self.set_fast_sampling = set_fast_sampling
+        self.clock = clock
+
+        self.step = step
+        self.deadband = deadband
+        self.interval = interval
+        self.samples = samples
+
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+        self.direction = [0, 0]  # gradient sign per axis in the last cycle, probed first in the next cycle
+
+        self.stats = self._new_stats()
+
+    def _new_stats(self):
+        return {
+            "running": False,
+            "cycles": 0,
+            "probes": 0,  # probe moves, including returns to center
+            "steps": 0,  # cycles that moved along the gradient
+            "recovered_dB": 0.0,  # sum of rx power gained by gradient steps
+            "start_power": None,
+            "last_power": None,
+            "last_cycle_time": None,
+            "position": None,
+            "error": None,
+        }
+
+    def configure(self, step=None, deadband=None, interval=None, samples=None):
+        """Update tracking parameters, None keeps current value"""
+        if step is not None:
+            self.step = int(step)
+        if deadband is not None:
+            self.deadband = deadband
+        if interval is not None:
+            self.interval = interval
+        if samples is not None:
+            self.samples = max(int(samples), 1)
+
+    def start(self):
+        """Start tracking in background thread, return False if already running"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            self.stop_event.clear()
+            self.direction = [0, 0]
+            self.stats = self._new_stats()
+            self.stats["running"] = True
+            self.thread = Thread(target=self._tracking_loop, daemon=True)
+            self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop tracking, waits for the running cycle to complete"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def get_status(self):
+        """Return tracking parameters and recovered link margin stats"""
+        with self.lock:
+            status = dict(self.stats)
+        status.update({"step": self.step, "deadband": self.deadband, "interval": self.interval, "samples": self.samples})
+        return status
+
+    def _tracking_loop(self):
+        """Run tracking cycles until stopped, at most one per interval"""
+        while not self.stop_event.is_set():
+            start = self.clock()
+            try:
+                self.run_cycle()
+            except Exception as e:
+                log.error(f"Tracking cycle failed: {e}")
+                with self.lock:
+                    self.stats["error"] = str(e)
+            self.stop_event.wait(max(self.interval - (self.clock() - start), 0))
+
+        with self.lock:
+            self.stats["running"] = False
+
+    def run_cycle(self):
+        """
+        Run one dither cycle: measure center, then probe one step to each side along x and y.
+        A side that beats center by more than deadband gives the gradient sign on that axis,
+        motors finish one step along the gradient or back on center if there is none.
+        Return rx power at the final position.
+        """
+        if self.set_fast_sampling is not None:
+            self.set_fast_sampling(True)
+        try:
+            x, y = self.get_position()
+            center = self._measure()
+            power = center
+
+            gradient = [0, 0]
+            at = (x, y)  # last commanded position
+            for axis in range(2):
+                signs = [1, -1]
+                if self.direction[axis] == -1:  # drift usually continues in the same direction
+                    signs.reverse()
+                for sign in signs:
+                    if self.stop_event.is_set():
+                        break
+                    probe = [x, y]
+                    probe[axis] = clamp(probe[axis] + sign * self.step, -MOTOR_LIMIT, MOTOR_LIMIT)
+                    if probe == [x, y]:
+                        continue
+                    at = self._probe(*probe)
+                    probe_power = self._measure()
+                    if probe_power - center > self.deadband:
+                        gradient[axis] = sign
+                        power = probe_power
+                        break
+
+            target = (clamp(x + gradient[0] * self.step, -MOTOR_LIMIT, MOTOR_LIMIT),
+                      clamp(y + gradient[1] * self.step, -MOTOR_LIMIT, MOTOR_LIMIT))
+            if target != at:
+                self._probe(*target)
+                if all(gradient):  # diagonal step was not probed
+                    power = self._measure()
+            self.direction = gradient
+        finally:
+            if self.set_fast_sampling is not None:
+                self.set_fast_sampling(False)
+
+        with self.lock:
+            self.stats["cycles"] += 1
+            if self.stats["start_power"] is None:
+                self.stats["start_power"] = center
+            if any(gradient):
+                self.stats["steps"] += 1
+                self.stats["recovered_dB"] = round(self.stats["recovered_dB"] + power - center, 3)
+            self.stats["last_power"] = power
+            self.stats["last_cycle_time"] = self.clock()
+            self.stats["position"] = self.get_position()
+        return power
+
+    def _probe(self, x, y):
+        self.move_to(x, y)
+        with self.lock:
+            self.stats["probes"] += 1
+        return x, y
+
+    def _measure(self):
+        """Average fresh rx power samples at current position"""
+        total = 0
+        after = self.clock()
+        for _ in range(self.samples):
+            total += self.read_power(after)
+            after = self.clock()
+        return total / self.samples
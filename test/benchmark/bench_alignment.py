@@ -0,0 +1,45 @@
+import random
+import statistics
+
+from ...src.alignment import *
+
+"""
+Run benchmark with `python3 -m koruza_v2.koruza_v2_driver.test.benchmark.bench_alignment`
+
+Compares scan patterns of the alignment engine on a simulated link with the beam peak at random offsets.
+No hardware is needed, time-to-acquire is measured on the simulated clock.
+"""
+
+RUNS = 20
+MAX_OFFSET = 4000  # beam peak is placed up to this many steps from the start position
+SEED = 1
+
+def run_pattern(pattern, peak_x, peak_y, seed, **kwargs):
+    """Align on a simulated link and return final status and distance from peak"""
+    link = SimulatedLink(peak_x=peak_x, peak_y=peak_y, seed=seed)
+    engine = AlignmentEngine(link.move_to, link.read_power, link.get_position, clock=link.clock)
+    status = engine.run(pattern, **kwargs)
+    best = status["best"]
+    error = ((best["x"] - peak_x) ** 2 + (best["y"] - peak_y) ** 2) ** 0.5
+    return status, error, link.peak_dBm - link.power_at(best["x"], best["y"])
+
+def report(name, pattern, peaks, **kwargs):
+    """Run pattern against all peaks and print mean cost and accuracy"""
+    results = [run_pattern(pattern, x, y, seed, **kwargs) for seed, (x, y) in enumerate(peaks)]
+    elapsed = [status["elapsed"] for status, _, _ in results]
+    points = [status["points"] for status, _, _ in results]
+    errors = [error for _, error, _ in results]
+    loss = [loss for _, _, loss in results]
+    print(f"{name:<28} time: {statistics.mean(elapsed):7.1f} s (max {max(elapsed):6.1f})    points: {statistics.mean(points):6.1f}    "
+          f"error: {statistics.mean(errors):6.1f} steps    loss: {statistics.mean(loss):5.2f} dB")
+
+if __name__ == "__main__":
+    rng = random.Random(SEED)
+    peaks = [(rng.randint(-MAX_OFFSET, MAX_OFFSET), rng.randint(-MAX_OFFSET, MAX_OFFSET)) for _ in range(RUNS)]
+
+    print("=== ALIGNMENT BENCHMARK ===")
+    report("spiral", ScanPattern.SPIRAL, peaks)
+    report("spiral, stop at -10 dBm", ScanPattern.SPIRAL, peaks, target_dBm=-10)
+    report("raster", ScanPattern.RASTER, peaks)
+    report("spiral, step 1000", ScanPattern.SPIRAL, peaks, step=1000)
+    report("adaptive, step 2000", ScanPattern.ADAPTIVE, peaks, step=2000)
@@ -0,0 +1,193 @@
+import os
+import time
+import serial
+import struct
+import timeit
+import binascii
+
+from ...src.communication import *
+
+"""
+Run benchmark with `python3 -m koruza_v2.koruza_v2_driver.test.benchmark.bench_communication`
+
+Compares the original per-byte TLV encoder and frame reader with the current implementation.
+No hardware is needed, frames are read from pyserial's loop:// URL.
+"""
+
+NUMBER = 2000
+REPEAT = 5
+READ_FRAMES = 2000
+LOOP_BUFFER_SIZE = 4096
+
+### ORIGINAL ENCODER, kept here as reference ###
+class LegacyTlv():
+    def __init__(self, type=None, length=None, value=None):
+        self.type = type
+        self.length = length
+        self.value = value
+
+    def encode(self):
+        return struct.pack("BBB" + "B" * len(self.value), self.type, *self.length, *self.value)
+
+class LegacyMessage():
+    def __init__(self):
+        self.tlvs = []
+
+    def add_tlv(self, tlv):
+        self.tlvs.append(tlv)
+
+    def encode(self):
+        encoded_msg = b''
+        for tlv in self.tlvs:
+            encoded_msg += tlv.encode()
+        return encoded_msg
+
+def legacy_create_command_tlv(command):
+    return LegacyTlv(TlvType.TLV_COMMAND, [0x00, 0x01], [command])
+
+def legacy_create_motor_position_tlv(x, y, z):
+    x_bytes = convert_to_bytes(x, 4, signed=True)
+    y_bytes = convert_to_bytes(y, 4, signed=True)
+    z_bytes = convert_to_bytes(z, 4, signed=True)
+    return LegacyTlv(TlvType.TLV_MOTOR_POSITION, [0x00, 0x0C], [*x_bytes, *y_bytes, *z_bytes])
+
+def legacy_create_checksum_tlv(message):
+    tlv_values_appended = b''
+    for tlv in message.tlvs:
+        tlv_len = int.from_bytes(bytearray(tlv.length), "big", signed=False)
+        tlv_values_appended += struct.pack("B" * tlv_len,  *tlv.value)
+    checksum = binascii.crc32(tlv_values_appended)
+    checksum_bytes = convert_to_bytes(checksum, 4)
+    return LegacyTlv(TlvType.TLV_CHECKSUM, [0x00, 0x04], [checksum_bytes[0], checksum_bytes[1], checksum_bytes[2], checksum_bytes[3]])
+
+def legacy_build_frame(bytes_msg):
+    insert_indices = []
+    for index, b in enumerate(bytes_msg):
+        if b == Marker.START or b == Marker.END or b == Marker.ESCAPE:
+            insert_indices.append(index)
+    bytes_msg = bytearray(bytes_msg)
+    for ind in insert_indices:
+        bytes_msg[ind:ind] = b'\xf3'
+    return b'\xf1' + bytes(bytes_msg) + b'\xf2'
+
+def legacy_read_frame(ser, timeout=2):
+    frame = b''
+    start_frame_detected = False
+    prev_char = None
+    start_time = time.time()
+    while True:
+        rx = ser.read()
+        if rx == b'\xf2' and prev_char != b'\xf3':
+            start_frame_detected = False
+            frame += rx
+            break
+        if rx == b'\xf1' and prev_char != b'\xf3':
+            start_frame_detected = True
+        if start_frame_detected:
+            frame += rx
+        if time.time() - start_time > timeout:
+            raise Exception("Serial timed out")
+        prev_char = rx
+    return frame
+
+def legacy_clean_frame(frame):
+    start_index = 0
+    end_index = 0
+    remove_indices = []
+    prev_char = None
+    for index, b in enumerate(frame):
+        if b == Marker.START and not prev_char == Marker.END:
+            start_index = index
+        elif b == Marker.START and prev_char == Marker.END:
+            remove_indices.append(index-1)
+        if b == Marker.END and not prev_char == Marker.ESCAPE:
+            end_index = index
+        elif b == Marker.END and prev_char == Marker.ESCAPE:
+            remove_indices.append(index-1)
+        if b == Marker.ESCAPE and prev_char == Marker.ESCAPE:
+            remove_indices.append(index-1)
+        prev_char = b
+    frame_byte_array = bytearray(frame)
+    for ind in remove_indices:
+        try:
+            del frame_byte_array[ind]
+        except Exception as e:
+            pass
+    frame = bytes(frame_byte_array)
+    return frame[start_index+1:end_index - len(remove_indices)]
+
+def legacy_status_frame():
+    msg = LegacyMessage()
+    msg.add_tlv(legacy_create_command_tlv(TlvCommand.COMMAND_GET_STATUS))
+    msg.add_tlv(legacy_create_checksum_tlv(msg))
+    return legacy_build_frame(msg.encode())
+
+def legacy_move_frame(x, y, z):
+    msg = LegacyMessage()
+    msg.add_tlv(legacy_create_command_tlv(TlvCommand.COMMAND_MOVE_MOTOR))
+    msg.add_tlv(legacy_create_motor_position_tlv(x, y, z))
+    msg.add_tlv(legacy_create_checksum_tlv(msg))
+    return legacy_build_frame(msg.encode())
+
+### CURRENT ENCODER ###
+def status_frame():
+    msg = Message()
+    msg.add_tlv(create_command_tlv(TlvCommand.COMMAND_GET_STATUS))
+    msg.add_tlv(create_checksum_tlv(msg))
+    return build_frame(msg.encode())
+
+def move_frame(x, y, z):
+    msg = Message()
+    msg.add_tlv(create_command_tlv(TlvCommand.COMMAND_MOVE_MOTOR))
+    msg.add_tlv(create_motor_position_tlv(x, y, z))
+    msg.add_tlv(create_checksum_tlv(msg))
+    return build_frame(msg.encode())
+
+def report(name, legacy, current):
+    """Time both functions and print cost per frame"""
+    legacy_us = min(timeit.repeat(legacy, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e6
+    current_us = min(timeit.repeat(current, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e6
+    print(f"{name:<24} before: {legacy_us:8.2f} us/frame    after: {current_us:8.2f} us/frame    speedup: {legacy_us / current_us:5.2f}x")
+
+def report_read(name, read):
+    """Write frames to loopback in batches, time reading them back and print throughput"""
+    ser = serial.serial_for_url("loop://", timeout=1)
+    frame = legacy_move_frame(-5794, 2936, 0)
+    batch = LOOP_BUFFER_SIZE // len(frame)  # loop:// blocks writes when its buffer is full
+    elapsed = 0
+    for _ in range(READ_FRAMES // batch):
+        ser.write(frame * batch)
+        start = time.perf_counter()
+        for _ in range(batch):
+            assert read(ser) == frame
+        elapsed += time.perf_counter() - start
+    ser.close()
+    frames = READ_FRAMES // batch * batch
+    print(f"{name:<24} {frames / elapsed:10.0f} frames/s    {len(frame) * frames / elapsed / 1024:8.1f} KiB/s")
+
+if __name__ == "__main__":
+    assert legacy_status_frame() == status_frame()
+    assert legacy_move_frame(-5794, 2936, 0) == move_frame(-5794, 2936, 0)
+
+    print("=== TLV ENCODE BENCHMARK ===")
+    report("status frame", legacy_status_frame, status_frame)
+    report("move frame", lambda: legacy_move_frame(-5794, 2936, 0), lambda: move_frame(-5794, 2936, 0))
+
+    print("=== FRAME CACHE BENCHMARK ===")
+    report("status loop request", legacy_status_frame, lambda: command_frame(TlvCommand.COMMAND_GET_STATUS))
+    report("move request", lambda: legacy_move_frame(-5794, 2936, 0), lambda: motor_position_frame(TlvCommand.COMMAND_MOVE_MOTOR, -5794, 2936, 0))
+
+    print("=== FRAME READ BENCHMARK ===")
+    report_read("byte-at-a-time read", legacy_read_frame)
+    reader = FrameReader(None)
+    def buffered_read(ser):
+        reader.ser = ser
+        return reader.read_frame()
+    report_read("FrameReader", buffered_read)
+
+    print("=== ESCAPE BENCHMARK ===")
+    for size in [1024, 2048, 4096]:
+        payload = os.urandom(size)
+        frame = build_frame(payload)
+        report(f"build_frame {size} B", lambda: legacy_build_frame(payload), lambda: build_frame(payload))
+        report(f"clean_frame {size} B", lambda: legacy_clean_frame(frame), lambda: clean_frame(frame))
@@ -0,0 +1,55 @@
+import time
+import random
+import numpy as np
+
+from ...hardware.ddm import *
+
+"""
+Run benchmark with `python3 -m koruza_v2.koruza_v2_driver.test.benchmark.bench_ddm`
+
+Times decoding of one SFP diagnostics block per call, as done by Sfp.get_diagnostics on every poll,
+against the previous per-bit loop and NumPy scalar conversion (temperature and optical power only), and the vectorized dBm conversion of a history buffer.
+"""
+
+BLOCKS = 20000
+HISTORY_LENGTH = 100000
+SEED = 1
+
+def legacy_decode(block):
+    """Previous Sfp.get_diagnostics conversion"""
+    temp_h = float(np.int8(block[0]))
+    temp_l = 0
+    for bit in range(0, 8):
+        temp_l += (block[1] & (1 << bit)) / 256
+    diagnostics = {"temp": temp_h + temp_l}
+    for name, offset in (("tx_power", 6), ("rx_power", 8)):
+        mW = float(np.uint16((block[offset] << 8) | block[offset + 1]) / 10000)
+        diagnostics[name] = mW
+        diagnostics[name + "_dBm"] = -40.0 if mW == 0.0 else float(round(10 * np.log10(mW), 3))
+    return diagnostics
+
+def timed(name, decode, blocks):
+    start = time.perf_counter()
+    for block in blocks:
+        decode(block)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>12}: {elapsed / len(blocks) * 1e6:8.2f} us per call")
+    return elapsed
+
+if __name__ == "__main__":
+    rng = random.Random(SEED)
+    blocks = [[rng.randrange(0, 128)] + [rng.randrange(256) for _ in range(9)] for _ in range(BLOCKS)]  # positive temperatures, np.int8 rejects values over 127
+
+    for block in blocks[:1000]:
+        diagnostics = decode_diagnostics(block)
+        assert {key: diagnostics[key] for key in legacy_decode(block)} == legacy_decode(block)
+
+    legacy = timed("legacy", legacy_decode, blocks)
+    new = timed("ddm", decode_diagnostics, blocks)
+    print(f"speedup: {legacy / new:.1f}x")
+
+    history = np.random.default_rng(SEED).integers(0, 1 << 16, HISTORY_LENGTH)
+    start = time.perf_counter()
+    raw_to_dBm_array(history)
+    elapsed = time.perf_counter() - start
+    print(f"history of {HISTORY_LENGTH} values: {elapsed * 1e3:.2f} ms")
@@ -0,0 +1,81 @@
+import time
+import statistics
+import xmlrpc.client
+
+from threading import Thread
+from xmlrpc.server import SimpleXMLRPCServer
+
+from ...src.rpc_server import *
+
+"""
+Run benchmark with `python3 -m koruza_v2.koruza_v2_driver.test.benchmark.bench_rpc_server`
+
+Load test of the single threaded SimpleXMLRPCServer and the pooled server with concurrent clients
+mixing fast getters with slow calls. Slow calls sleep like a snapshot request or a service restart.
+"""
+
+CLIENTS = 8
+DURATION = 5  # seconds of load per server
+SLOW_EVERY = 5  # every n-th call of a client is slow
+SLOW_TIME = 0.3
+FAST_TIME = 0.001
+
+class FakeKoruza():
+    """Stand-in for Koruza with one slow and two fast methods"""
+    def get_sfp_diagnostics(self):
+        time.sleep(FAST_TIME)
+        return {"sfp_0": {"diagnostics": {"rx_power_dBm": -3.0}}}
+
+    def move_motors(self, x, y):
+        time.sleep(FAST_TIME)
+        return True
+
+    def take_picture(self):
+        time.sleep(SLOW_TIME)
+        return xmlrpc.client.Binary(bytes(50000))
+
+def client(url, deadline, latencies, index):
+    proxy = xmlrpc.client.ServerProxy(url, allow_none=True)
+    calls = 0
+    while time.time() < deadline:
+        calls += 1
+        if (calls + index) % SLOW_EVERY == 0:
+            method, args = "take_picture", ()
+        elif calls % 2:
+            method, args = "get_sfp_diagnostics", ()
+        else:
+            method, args = "move_motors", (10, 0)
+        start = time.perf_counter()
+        getattr(proxy, method)(*args)
+        latencies.setdefault(method, []).append(time.perf_counter() - start)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+def run_load(name, server):
+    server.register_instance(FakeKoruza())
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://localhost:{server.server_address[1]}/RPC2"
+
+    latencies = [{} for _ in range(CLIENTS)]
+    deadline = time.time() + DURATION
+    clients = [Thread(target=client, args=(url, deadline, latencies[i], i)) for i in range(CLIENTS)]
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    server.shutdown()
+    server.server_close()
+
+    print(f"--- {name}, {CLIENTS} clients ---")
+    for method in ["get_sfp_diagnostics", "move_motors", "take_picture"]:
+        values = [v for client_latencies in latencies for v in client_latencies.get(method, [])]
+        print(f"{method:<22} calls: {len(values):5d}    p50: {percentile(values, 50) * 1000:8.1f} ms    "
+              f"p99: {percentile(values, 99) * 1000:8.1f} ms    mean: {statistics.mean(values) * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    print("=== RPC SERVER LOAD BENCHMARK ===")
+    run_load("SimpleXMLRPCServer", SimpleXMLRPCServer(("localhost", 0), allow_none=True, logRequests=False))
+    run_load("PooledXMLRPCServer", PooledXMLRPCServer(("localhost", 0), allow_none=True, logRequests=False))
@@ -0,0 +1,57 @@
+import io
+import time
+import random
+import statistics
+import numpy as np
+
+from PIL import Image
+
+from ...src.spot_detector import *
+
+"""
+Run benchmark with `python3 -m koruza_v2.koruza_v2_driver.test.benchmark.bench_spot_detector`
+
+Times spot detection on a set of synthetic 720 x 720 camera frames with a laser spot at a random position,
+background gradient and sensor noise, and reports centroid error against the true spot center.
+Decoding at full resolution is shown for comparison with the downscaled decode.
+"""
+
+IMAGES = 50
+FRAME_SIZE = 720
+SEED = 1
+
+def make_frame(rng, size=FRAME_SIZE):
+    """Return (jpeg, x, y) of a frame with a gaussian spot at a random sub-pixel position"""
+    x = rng.uniform(50, size - 50)
+    y = rng.uniform(50, size - 50)
+    sigma = rng.uniform(4, 15)
+    ys, xs = np.mgrid[0:size, 0:size].astype(np.float32)
+    background = 30 + 40 * xs / size  # uneven illumination
+    spot = rng.uniform(120, 220) * np.exp(-((xs - x) ** 2 + (ys - y) ** 2) / (2 * sigma ** 2))
+    noise = np.random.default_rng(rng.randrange(1 << 30)).normal(0, 4, (size, size))
+    frame = np.clip(background + spot + noise, 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(frame).convert("RGB").save(out, format="JPEG", quality=85)
+    return out.getvalue(), x, y
+
+def report(name, detector, frames):
+    times = []
+    errors = []
+    confidences = []
+    for jpeg, x, y in frames:
+        start = time.perf_counter()
+        spot = detector.detect(jpeg)
+        times.append(time.perf_counter() - start)
+        errors.append(((spot["x"] - x) ** 2 + (spot["y"] - y) ** 2) ** 0.5)
+        confidences.append(spot["confidence"])
+    print(f"{name:<26} mean: {statistics.mean(times) * 1000:6.1f} ms    max: {max(times) * 1000:6.1f} ms    "
+          f"error mean: {statistics.mean(errors):5.2f} px    max: {max(errors):5.2f} px    confidence min: {min(confidences):.2f}")
+
+if __name__ == "__main__":
+    rng = random.Random(SEED)
+    frames = [make_frame(rng) for _ in range(IMAGES)]
+
+    print(f"=== SPOT DETECTOR BENCHMARK, {IMAGES} frames ===")
+    report("full resolution decode", SpotDetector(detect_size=FRAME_SIZE), frames)
+    report(f"downscaled to {DETECT_SIZE} px", SpotDetector(), frames)
+    report("downscaled to 90 px", SpotDetector(detect_size=90), frames)
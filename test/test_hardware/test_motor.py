@@ -2,19 +2,17 @@ import time
 import struct
 import serial
 
-from threading import Lock
-
 from ...src.data_manager import DataManager
 from ...src.motor_control import MotorControl
+from ...src.serial_engine import SerialEngine
 
 """
 Run tests with `sudo python3 -m koruza_v2.koruza_v2_driver.test.test_hardware.test_motor`
 """
 
-lock = Lock()
 data_manager = DataManager()
 ser = serial.Serial("/dev/ttyAMA0", baudrate=115200, timeout=2)
-motor_driver = MotorControl(ser, lock, data_manager)
+motor_driver = MotorControl(SerialEngine(ser), data_manager)
 
 print("=== STARTING MOTOR TEST ===")
 print("Observe the rotational axis of the motors when performing this test and follow instructions presented below.")
@@ -31,7 +31,7 @@ class TestSFPDriver(unittest.TestCase):
         """
 
         ret = self.driver.get_diagnostics()
-        expected_keys = ["temp", "tx_power_dBm", "tx_power", "rx_power_dBm", "rx_power"]
+        expected_keys = ["temp", "tx_power_dBm", "tx_power", "rx_power_dBm", "rx_power", "vcc", "tx_bias"]
 
         for key, value in ret.items():
             if key not in expected_keys:
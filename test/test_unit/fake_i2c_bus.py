@@ -0,0 +1,113 @@
+import ctypes
+import struct
+
+"""
+Simulated I2C bus with SFP EEPROMs behind an optional PCA9546A switch, used by the SFP unit tests.
+"""
+
+I2C_M_RD = 0x0001  # read flag of i2c_rdwr messages
+
+def make_sfp_id_page(manufacturer="IRNAS", revision="1.0", serial_num="KRZ000001", sfp_type=3, connector=7,
+                     bitrate=13, wavelength=1310, diag_settings=0x68, valid_checksum=True):
+    """Return 256 byte A0h EEPROM with given module info and checksum at register 63"""
+    page = bytearray(256)
+    page[0] = sfp_type
+    page[2] = connector
+    page[12] = bitrate
+    page[20:36] = manufacturer.ljust(16).encode()
+    page[56:60] = revision.ljust(4).encode()
+    page[60] = wavelength >> 8
+    page[61] = wavelength & 0xFF
+    page[68:84] = serial_num.ljust(16).encode()
+    page[92] = diag_settings
+    page[63] = (sum(page[:63]) + (0 if valid_checksum else 1)) & 0xFF
+    page[95] = sum(page[64:95]) & 0xFF
+    return page
+
+def make_sfp_diag_page(diagnostics=(0x1A40, 0x8000, 0x1000, 0x1388, 0), thresholds=None, calibration=None):
+    """
+    Return 256 byte A2h EEPROM with raw (temp, vcc, tx_bias, tx_power, rx_power) diagnostics at register 96,
+    thresholds as raw (high alarm, low alarm, high warning, low warning) of each measurement and external calibration constants
+    """
+    page = bytearray(256)
+    if thresholds is None:
+        thresholds = ((0x5500, -0x0A00, 0x5000, -0x0500), (0x8CA0, 0x7530, 0x8A30, 0x79E0), (0x3A98, 0x0000, 0x3200, 0x0200),
+                      (0x3DE8, 0x07D0, 0x30D4, 0x09C4), (0x3DE8, 0x0032, 0x30D4, 0x0064))
+    page[0:40] = struct.pack(">hhhh" + "H" * 16, *[value for measurement in thresholds for value in measurement])
+    if calibration is not None:
+        page[56:92] = struct.pack(">fffff" + "Hh" * 4, *calibration)
+    page[96:106] = struct.pack(">hHHHH", *diagnostics)
+    return page
+
+class FakeI2cBus():
+    """
+    SMBus-like object, devices map I2C address to 256 byte register contents.
+    With a switch, lines map switch line bits to devices visible only while the line is selected.
+    """
+    def __init__(self, devices, rdwr=True, switch_address=None, lines=None):
+        self.devices = devices
+        self.rdwr = rdwr  # adapter supports combined i2c_rdwr transactions
+        self.switch_address = switch_address
+        self.lines = lines or {}
+        self.selected = 0
+        self.transactions = 0
+        self.switch_writes = 0
+        self.closed = False
+
+    def _get_device(self, address):
+        if address in self.devices:
+            return self.devices[address]
+        for line, devices in self.lines.items():
+            if self.selected & line and address in devices:
+                return devices[address]
+        return None
+
+    def _device(self, address):
+        self.transactions += 1
+        device = self._get_device(address)
+        if device is None:
+            raise OSError(121, "Remote I/O error")
+        return device
+
+    def read_byte(self, address):
+        if address == self.switch_address:
+            self.transactions += 1
+            return self.selected
+        return self._device(address)[0]
+
+    def write_byte(self, address, value):
+        if address == self.switch_address:
+            self.transactions += 1
+            self.switch_writes += 1
+            self.selected = value
+            return
+        self._device(address)[0] = value
+
+    def read_byte_data(self, address, register):
+        return self._device(address)[register]
+
+    def read_word_data(self, address, register):
+        device = self._device(address)
+        return device[register] | device[register + 1] << 8  # SMBus words are little endian
+
+    def read_i2c_block_data(self, address, register, length):
+        if length > 32:
+            raise ValueError("Desired block length over 32 bytes")
+        return list(self._device(address)[register:register + length])
+
+    def i2c_rdwr(self, *messages):
+        if not self.rdwr:
+            raise OSError(95, "Operation not supported")
+        self.transactions += 1
+        register = 0
+        for message in messages:
+            device = self._get_device(message.addr)
+            if device is None:
+                raise OSError(121, "Remote I/O error")
+            if message.flags & I2C_M_RD:
+                ctypes.memmove(message.buf, bytes(device[register:register + message.len]), message.len)
+            else:
+                register = bytes(message)[0]
+
+    def close(self):
+        self.closed = True
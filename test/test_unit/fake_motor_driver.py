@@ -0,0 +1,115 @@
+import time
+
+from threading import Lock, Condition
+
+from ...src.communication import *
+
+"""
+Simulated KORUZA Move Driver and data manager used by the motor control unit tests.
+"""
+
+class FakeMotorDriver():
+    """Serial-like object replying to status requests like the motor driver firmware, motors move at a constant speed"""
+    def __init__(self, x=0, y=0, speed=20000):
+        self.timeout = 2
+        self.speed = speed  # steps per second
+
+        self.lock = Lock()
+        self.rx = Condition(self.lock)
+        self.rx_buffer = bytearray()
+        self.frame_reader = FrameReader(None)
+
+        self.position = [x, y, 0]
+        self.start = [x, y, 0]
+        self.target = [x, y, 0]
+        self.move_time = time.time()
+
+        self.commands = []  # received commands, in order
+        self.lost_replies = 0  # number of next status replies that are lost on the line
+
+    @property
+    def in_waiting(self):
+        with self.lock:
+            return len(self.rx_buffer)
+
+    def read(self, size=1):
+        with self.rx:
+            if not self.rx_buffer:
+                self.rx.wait(self.timeout)
+            data = bytes(self.rx_buffer[:size])
+            del self.rx_buffer[:size]
+            return data
+
+    def write(self, frame):
+        self.frame_reader.feed(frame)
+        while self.frame_reader.frames:
+            result, message = message_parse(clean_frame(self.frame_reader.frames.popleft()))
+            tlvs = {tlv.type: tlv.decode() for tlv in message.tlvs}
+            command = tlvs[TlvType.TLV_COMMAND]
+            self.commands.append(command)
+
+            if command == TlvCommand.COMMAND_GET_STATUS and self.lost_replies:
+                self.lost_replies -= 1
+            elif command == TlvCommand.COMMAND_GET_STATUS:
+                self.reply_status()
+            elif command == TlvCommand.COMMAND_MOVE_MOTOR:
+                position = tlvs[TlvType.TLV_MOTOR_POSITION]
+                self.move_to(position.x, position.y, position.z)
+            elif command == TlvCommand.COMMAND_RESTORE_MOTOR:
+                position = tlvs[TlvType.TLV_MOTOR_POSITION]
+                self.position = [position.x, position.y, position.z]
+                self.move_to(*self.position)
+            elif command == TlvCommand.COMMAND_HOMING:
+                self.move_to(0, 0, 0)
+        return len(frame)
+
+    def reset_input_buffer(self):
+        with self.rx:
+            self.rx_buffer.clear()
+
+    def close(self):
+        pass
+
+    def move_to(self, x, y, z):
+        self.update_position()
+        self.start = list(self.position)
+        self.target = [x, y, z]
+        self.move_time = time.time()
+
+    def update_position(self):
+        """Move every axis towards target with constant speed"""
+        travelled = (time.time() - self.move_time) * self.speed
+        for axis in range(3):
+            distance = self.target[axis] - self.start[axis]
+            if abs(distance) <= travelled:
+                self.position[axis] = self.target[axis]
+            else:
+                self.position[axis] = self.start[axis] + int(travelled if distance > 0 else -travelled)
+
+    def status_requests(self):
+        return self.commands.count(TlvCommand.COMMAND_GET_STATUS)
+
+    def reply_status(self):
+        self.update_position()
+        msg = Message()
+        msg.add_tlv(create_reply_tlv(TlvReply.REPLY_STATUS_REPORT))
+        msg.add_tlv(create_motor_position_tlv(*self.position))
+        msg.add_tlv(create_checksum_tlv(msg))
+        with self.rx:
+            self.rx_buffer += build_frame(msg.encode())
+            self.rx.notify_all()
+
+class FakeDataManager():
+    """Keeps motor data in memory"""
+    def __init__(self, x=0, y=0):
+        self.data = {"motors": {"last_x": x, "last_y": y}, "led": True, "zoom": False}
+        self.motor_updates = 0
+        self.flushes = 0
+
+    def update_motors_data(self, key_value_pairs):
+        self.motor_updates += 1
+        for key, data in key_value_pairs:
+            self.data["motors"][key] = data
+
+    def request_flush(self):
+        self.flushes += 1
@@ -0,0 +1,101 @@
+import time
+import unittest
+
+from ...src.alignment import *
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_alignment`
+
+No hardware is needed - motors and rx power are simulated by SimulatedLink.
+"""
+
+class TestAlignment(unittest.TestCase):
+
+    def align(self, pattern, peak_x, peak_y, **kwargs):
+        """Run alignment on a simulated link, return final status and link"""
+        link = SimulatedLink(peak_x=peak_x, peak_y=peak_y, noise_dB=0, seed=0)
+        engine = AlignmentEngine(link.move_to, link.read_power, link.get_position, clock=link.clock)
+        return engine.run(pattern, **kwargs), link
+
+    def test_scan_patterns(self):
+        """
+        Test every scan pattern with the peak away from the start position.
+        Expected result is a best position within one minimum step of the peak, motors finish there.
+        """
+        for pattern in [ScanPattern.SPIRAL, ScanPattern.RASTER, ScanPattern.ADAPTIVE]:
+            with self.subTest(pattern=pattern):
+                status, link = self.align(pattern, 2300, -1700, step=500, radius=3000, min_step=50)
+                self.assertEqual(status["state"], AlignmentState.DONE)
+                self.assertEqual(status["progress"], 1.0)
+                self.assertLessEqual(abs(status["best"]["x"] - 2300), 50)
+                self.assertLessEqual(abs(status["best"]["y"] + 1700), 50)
+                self.assertEqual(link.get_position(), (status["best"]["x"], status["best"]["y"]))
+
+    def test_motor_limits(self):
+        """
+        Test scan with the peak outside motor limits.
+        Expected result is a best position on the limit, no move outside of it.
+        """
+        link = SimulatedLink(peak_x=20000, peak_y=0, start_x=14000, noise_dB=0)
+        targets = []
+        def move_to(x, y):
+            targets.append((x, y))
+            return link.move_to(x, y)
+        engine = AlignmentEngine(move_to, link.read_power, link.get_position, clock=link.clock)
+        status = engine.run(ScanPattern.SPIRAL, step=500, radius=2000)
+        self.assertEqual(status["best"]["x"], MOTOR_LIMIT)
+        self.assertTrue(all(abs(x) <= MOTOR_LIMIT and abs(y) <= MOTOR_LIMIT for x, y in targets))
+
+    def test_stalled_points(self):
+        """
+        Test scan with motors stalling on some points.
+        Expected result is the scan finishing on the peak, stalled points recorded as skipped and never sampled.
+        """
+        link = SimulatedLink(peak_x=1000, peak_y=1000, noise_dB=0)
+        stalled = {(500, -500), (-1000, 0)}
+        def move_to(x, y):
+            if (x, y) in stalled:
+                raise MoveStalled(f"Move to ({x}, {y}) stalled")
+            return link.move_to(x, y)
+        engine = AlignmentEngine(move_to, link.read_power, link.get_position, clock=link.clock)
+        status = engine.run(ScanPattern.SPIRAL, step=500, radius=2000)
+        self.assertEqual(status["state"], AlignmentState.DONE)
+        self.assertEqual(sorted((point["x"], point["y"]) for point in status["skipped"]), sorted(stalled))
+        self.assertEqual((status["best"]["x"], status["best"]["y"]), (1000, 1000))
+
+    def test_target_power(self):
+        """
+        Test spiral scan with a target power.
+        Expected behaviour is fewer sampled points than a full scan.
+        """
+        full, _ = self.align(ScanPattern.SPIRAL, 1000, 1000)
+        early, _ = self.align(ScanPattern.SPIRAL, 1000, 1000, target_dBm=-10)
+        self.assertLess(early["points"], full["points"])
+        self.assertGreater(early["best"]["rx_power_dBm"], -4)
+
+    def test_cancel(self):
+        """
+        Test cancelling alignment running in background.
+        Expected state is "cancelled" and a new alignment can be started.
+        """
+        link = SimulatedLink()
+        def slow_move(x, y):
+            time.sleep(0.01)
+            return link.move_to(x, y)
+        engine = AlignmentEngine(slow_move, link.read_power, link.get_position)
+
+        self.assertTrue(engine.start(ScanPattern.RASTER))
+        self.assertFalse(engine.start(ScanPattern.RASTER))
+        time.sleep(0.1)
+        self.assertTrue(engine.is_running())
+
+        engine.cancel()
+        status = engine.get_status()
+        self.assertEqual(status["state"], AlignmentState.CANCELLED)
+        self.assertGreater(status["points"], 0)
+        self.assertLess(status["progress"], 1.0)
+        self.assertTrue(engine.start(ScanPattern.ADAPTIVE))
+        engine.cancel()
+
+if __name__ == '__main__':
+    unittest.main()
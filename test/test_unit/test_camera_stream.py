@@ -0,0 +1,217 @@
+import os
+import time
+import unittest
+import urllib.request
+
+from threading import Thread
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from ...src.camera_stream import *
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_camera_stream`
+
+No camera is needed - mjpg-streamer snapshots and stream are served by a stand-in HTTP server on localhost.
+"""
+
+JPEG = b"\xff\xd8" + os.urandom(20000) + b"\xff\xd9"
+BOUNDARY = b"boundarydonotcross"
+STREAM_FRAME_INTERVAL = 0.02
+
+def stream_part(jpeg, content_length=True):
+    """Return one multipart part like mjpg-streamer sends it"""
+    headers = b"Content-Type: image/jpeg\r\n"
+    if content_length:
+        headers += b"Content-Length: %d\r\n" % len(jpeg)
+    return b"--" + BOUNDARY + b"\r\n" + headers + b"X-Timestamp: 0.0\r\n\r\n" + jpeg + b"\r\n"
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests += 1
+        if "stream" in self.path:
+            self.send_stream()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(JPEG)))
+        self.end_headers()
+        self.wfile.write(JPEG)
+
+    def send_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace;boundary=" + BOUNDARY.decode())
+        self.send_header("Connection", "close")
+        self.end_headers()
+        index = 0
+        try:
+            while not self.server.stopped:
+                index += 1
+                self.wfile.write(stream_part(JPEG[:-2] + index.to_bytes(4, "big") + JPEG[-2:]))
+                time.sleep(STREAM_FRAME_INTERVAL)
+        except OSError:
+            pass
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+class ConnectionCountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("localhost", 0), SnapshotHandler)
+        self.requests = 0
+        self.connections = 0
+        self.stopped = False
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+class TestCameraStream(unittest.TestCase):
+
+    def setUp(self):
+        self.streamer = ConnectionCountingServer()
+        Thread(target=self.streamer.serve_forever, daemon=True).start()
+        self.client = SnapshotClient(url=f"http://localhost:{self.streamer.server_address[1]}/?action=snapshot")
+
+    def tearDown(self):
+        self.client.close()
+        self.streamer.stopped = True
+        self.streamer.shutdown()
+        self.streamer.server_close()
+
+    def test_persistent_session(self):
+        """
+        Test repeated snapshots.
+        Expected behaviour is one connection to mjpg-streamer for all snapshots.
+        """
+        for _ in range(10):
+            self.assertEqual(self.client.get_snapshot(), JPEG)
+        self.assertEqual(self.streamer.requests, 10)
+        self.assertEqual(self.streamer.connections, 1)
+
+    def test_session_per_thread(self):
+        """
+        Test snapshots from several threads at once.
+        Expected behaviour is a separate kept-alive connection for every thread.
+        """
+        results = []
+        def take_snapshots():
+            for _ in range(5):
+                results.append(self.client.get_snapshot())
+        threads = [Thread(target=take_snapshots) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [JPEG] * 20)
+        self.assertEqual(self.streamer.connections, 4)
+
+    def test_shared_frame_writers(self):
+        """
+        Test shared memory frame written from two threads while a third one reads.
+        Expected behaviour is every read frame equal to one of the written frames.
+        """
+        if shared_memory is None:
+            self.skipTest("Shared memory requires python 3.8")
+        frames = [bytes([i]) * 50000 for i in (1, 2)]
+        shared = SharedFrame(name=f"koruza_test_{os.getpid()}", size=len(frames[0]))
+        stop = False
+        def write(jpeg):
+            while not stop:
+                shared.write(jpeg)
+        writers = [Thread(target=write, args=(frame,)) for frame in frames]
+        for writer in writers:
+            writer.start()
+        try:
+            for _ in range(2000):
+                frame = shared.read()
+                if frame is not None:
+                    self.assertIn(frame[2], frames)
+        finally:
+            stop = True
+            for writer in writers:
+                writer.join()
+            shared.close()
+
+    def test_frame_server(self):
+        """
+        Test raw frame endpoint.
+        Expected value is the unencoded JPEG with image/jpeg content type.
+        """
+        server = FrameServer(self.client.get_snapshot, port=0)
+        try:
+            with urllib.request.urlopen(server.get_url()) as r:
+                self.assertEqual(r.headers["Content-Type"], "image/jpeg")
+                self.assertEqual(r.read(), JPEG)
+        finally:
+            server.close()
+
+    def test_mjpeg_parser(self):
+        """
+        Test parsing a stream received in chunks of every size, with and without Content-Length.
+        Expected values are all frames, unchanged and in order, also when they contain a boundary-like sequence.
+        """
+        frames = [JPEG[:100 * i] + b"\r\n--" + bytes([i]) for i in range(1, 6)]
+        for content_length in [True, False]:
+            stream = b"".join(stream_part(frame, content_length) for frame in frames) + b"--" + BOUNDARY
+            for chunk_size in [1, 7, 100, len(stream)]:
+                with self.subTest(content_length=content_length, chunk_size=chunk_size):
+                    parser = MjpegParser(BOUNDARY)
+                    parsed = []
+                    for i in range(0, len(stream), chunk_size):
+                        parsed += parser.feed(stream[i:i + chunk_size])
+                    self.assertEqual(parsed, frames)
+
+    def test_grabber(self):
+        """
+        Test grabbing frames from the stream.
+        Expected behaviour is one stream connection, increasing sequence numbers and fresh frames on request.
+        """
+        received = []
+        grabber = MjpegGrabber(url=f"http://localhost:{self.streamer.server_address[1]}/?action=stream", on_frame=lambda *frame: received.append(frame[0]))
+        try:
+            first = grabber.wait_for_frame(0, timeout=2)
+            self.assertEqual(first[0], 1)
+            self.assertEqual(len(first[2]), len(JPEG) + 4)
+
+            second = grabber.wait_for_frame(first[0], timeout=2)
+            self.assertGreater(second[0], first[0])
+            self.assertGreater(second[1], first[1])
+
+            time.sleep(STREAM_FRAME_INTERVAL * 3)
+            latest = grabber.get_latest()
+            self.assertIs(grabber.get_frame(max_age=1), latest)
+            self.assertGreater(grabber.get_frame(max_age=0)[0], latest[0])
+
+            status = grabber.get_status()
+            self.assertTrue(status["connected"])
+            self.assertEqual(status["reconnects"], 0)
+            self.assertEqual(self.streamer.requests, 1)
+            self.assertEqual(received, list(range(1, len(received) + 1)))
+        finally:
+            grabber.close()
+
+    @unittest.skipIf(shared_memory is None, "Shared memory requires python 3.8")
+    def test_shared_frame(self):
+        """
+        Test shared memory handoff to a reader attached by name.
+        Expected value is the latest written frame with an increasing sequence number.
+        """
+        writer = SharedFrame(name=f"koruza_test_{os.getpid()}", size=len(JPEG))
+        reader = SharedFrame(name=writer.name, create=False)
+        try:
+            self.assertIsNone(reader.read())
+            self.assertTrue(writer.write(b"first"))
+            self.assertTrue(writer.write(JPEG, timestamp=123.0))
+            self.assertEqual(reader.read(), (4, 123.0, JPEG))
+            self.assertFalse(writer.write(JPEG + b"too long"))
+        finally:
+            reader.close()
+            writer.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,290 @@
+import random
+import serial
+import unittest
+
+from ...src.communication import *
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_communication`
+
+No hardware is needed - these tests cover the TLV protocol used for motor driver communication.
+"""
+
+def build_message(*tlvs):
+    """Build message from given tlvs and append checksum tlv"""
+    msg = Message()
+    for tlv in tlvs:
+        msg.add_tlv(tlv)
+    msg.add_tlv(create_checksum_tlv(msg))
+    return msg
+
+class TestTlvEncoding(unittest.TestCase):
+
+    """Encoder tests"""
+    def test_status_frame(self):
+        """
+        Test encoding of the status request frame.
+        Expected value is the frame produced by the original per-byte encoder.
+        """
+        msg = build_message(create_command_tlv(TlvCommand.COMMAND_GET_STATUS))
+        frame = build_frame(msg.encode())
+        self.assertEqual(frame.hex(), "f101000101030004a505df1bf2")
+
+    def test_move_frame(self):
+        """
+        Test encoding of move frames with signed motor positions.
+        Expected value is the frame produced by the original per-byte encoder.
+        """
+        frames = [
+            ((-5794, 2936, 0), "f10100010204000cffffe95e00000b78000000000300049108f694f2"),
+            ((-15000, 15000, -1), "f10100010204000cffffc56800003a98ffffffff030004a00b9fa6f2"),
+        ]
+        for position, expected in frames:
+            with self.subTest(position=position):
+                msg = build_message(create_command_tlv(TlvCommand.COMMAND_MOVE_MOTOR), create_motor_position_tlv(*position))
+                self.assertEqual(build_frame(msg.encode()).hex(), expected)
+
+    def test_fields_match_raw_value(self):
+        """
+        Test that tlvs packed from fields encode the same as tlvs created from raw value bytes.
+        """
+        tlvs = [
+            create_reply_tlv(TlvReply.REPLY_STATUS_REPORT),
+            create_error_report_tlv(0xdeadbeef),
+            create_current_reading_tlv(1234),
+            create_power_reading_tlv(65535),
+            create_encoder_value_tlv(-1, 2**31 - 1),
+            create_sfp_calibration_tlv(280, 528),
+        ]
+        for tlv in tlvs:
+            with self.subTest(type=tlv.type):
+                raw_tlv = Tlv(tlv.type, [0x00, tlv.length], list(tlv.value))
+                self.assertEqual(tlv.encode(), raw_tlv.encode())
+
+    def test_length_omitted(self):
+        """
+        Test tlvs created without a length.
+        Expected length is computed from the value or from the fields layout, encoding matches a tlv with given length.
+        """
+        tlv = create_motor_position_tlv(100, -200, 0)
+        self.assertEqual(Tlv(tlv.type, fields=tlv.fields).encode(), tlv.encode())
+        self.assertEqual(Tlv(tlv.type, value=tlv.value).encode(), tlv.encode())
+        self.assertEqual(Tlv(TlvType.TLV_NET_HELLO, value=b"hello").length, 5)
+
+    def test_encode_into_offset(self):
+        """
+        Test encoding into a larger preallocated buffer at an offset.
+        Expected return value is the offset after the encoded message.
+        """
+        msg = build_message(create_command_tlv(TlvCommand.COMMAND_HOMING))
+        buffer = bytearray(4 + msg.encoded_length())
+        end = msg.encode_into(buffer, 4)
+        self.assertEqual(end, len(buffer))
+        self.assertEqual(bytes(buffer[4:]), msg.encode())
+
+class TestTlvDecoding(unittest.TestCase):
+
+    """Decoder registry tests"""
+    def test_status_reply(self):
+        """
+        Test parsing and decoding of a status reply with motor position and encoder values.
+        Expected values are typed objects holding the encoded values.
+        """
+        msg = build_message(
+            create_reply_tlv(TlvReply.REPLY_STATUS_REPORT),
+            create_motor_position_tlv(-3597, 242, -1),
+            create_encoder_value_tlv(-15000, 15000),
+        )
+        result, parsed = message_parse(clean_frame(build_frame(msg.encode())))
+        self.assertEqual(result, MessageResult.MESSAGE_SUCCESS)
+
+        reply, position, encoder, checksum = [tlv.decode() for tlv in parsed.tlvs]
+        self.assertEqual(reply, TlvReply.REPLY_STATUS_REPORT)
+        self.assertIsInstance(position, MotorPosition)
+        self.assertEqual((position.x, position.y, position.z), (-3597, 242, -1))
+        self.assertIsInstance(encoder, EncoderValue)
+        self.assertEqual((encoder.x, encoder.y), (-15000, 15000))
+        self.assertEqual(checksum, msg.tlvs[-1].fields[0])
+
+    def test_other_types(self):
+        """
+        Test decoding of error report and sfp calibration tlvs.
+        """
+        error, calibration = [parse_tlv(tlv.encode()).decode() for tlv in [create_error_report_tlv(7), create_sfp_calibration_tlv(280, 528)]]
+        self.assertEqual(error.code, 7)
+        self.assertEqual((calibration.offset_x, calibration.offset_y), (280, 528))
+
+    def test_unknown_type(self):
+        """
+        Test decoding of a tlv type without decoder.
+        Expected value is the undecoded value as a memoryview of the received bytes.
+        """
+        tlv = parse_tlv(bytes([TlvType.TLV_NET_HELLO, 0x00, 0x03, 0x01, 0x02, 0x03]))
+        value = tlv.decode()
+        self.assertIsInstance(value, memoryview)
+        self.assertEqual(bytes(value), b'\x01\x02\x03')
+
+    def test_truncated_tlv(self):
+        """
+        Test parsing of a message with the last tlv shorter than its length.
+        Expected return value is MESSAGE_ERROR_PARSE_ERROR.
+        """
+        encoded = create_motor_position_tlv(1, 2, 3).encode()
+        self.assertEqual(message_parse(encoded[:-1])[0], MessageResult.MESSAGE_ERROR_PARSE_ERROR)
+
+class TestChecksum(unittest.TestCase):
+
+    def setUp(self):
+        self.encoded = build_message(create_reply_tlv(TlvReply.REPLY_STATUS_REPORT), create_motor_position_tlv(-5794, 2936, 0)).encode()
+
+    """Checksum verification tests"""
+    def test_valid_checksum(self):
+        """
+        Test parsing of a message with a valid checksum.
+        Expected return value is MESSAGE_SUCCESS.
+        """
+        self.assertEqual(message_parse(self.encoded)[0], MessageResult.MESSAGE_SUCCESS)
+
+    def test_corrupted_value(self):
+        """
+        Test parsing of messages with every single value bit flipped.
+        Expected return value is MESSAGE_ERROR_CHECKSUM_MISMATCH, or MESSAGE_SUCCESS when verification is disabled.
+        """
+        value_offsets = [3] + list(range(7, 19))  # reply value and motor position value
+        for offset in value_offsets:
+            for bit in range(8):
+                corrupted = bytearray(self.encoded)
+                corrupted[offset] ^= 1 << bit
+                with self.subTest(offset=offset, bit=bit):
+                    self.assertEqual(message_parse(corrupted)[0], MessageResult.MESSAGE_ERROR_CHECKSUM_MISMATCH)
+                    self.assertEqual(message_parse(corrupted, verify_checksum=False)[0], MessageResult.MESSAGE_SUCCESS)
+
+    def test_missing_checksum(self):
+        """
+        Test parsing of messages without a checksum TLV, with a corrupted checksum type and with two checksums.
+        Expected return value is MESSAGE_ERROR_CHECKSUM_MISMATCH, or MESSAGE_SUCCESS when verification is disabled.
+        """
+        without_checksum = self.encoded[:-7]
+        corrupted_type = bytearray(self.encoded)
+        corrupted_type[-7] ^= 0x01
+        two_checksums = self.encoded + self.encoded[-7:]
+        for message in [without_checksum, bytes(corrupted_type), two_checksums]:
+            with self.subTest(message=message):
+                self.assertEqual(message_parse(message)[0], MessageResult.MESSAGE_ERROR_CHECKSUM_MISMATCH)
+                self.assertEqual(message_parse(message, verify_checksum=False)[0], MessageResult.MESSAGE_SUCCESS)
+
+class TestEscaping(unittest.TestCase):
+
+    """Escape and unescape round trip tests"""
+    def test_escaped_position(self):
+        """
+        Test frame with several escaped markers in the motor position and checksum.
+        Expected value is every marker prefixed with 0xf3 and the original message after cleaning the frame.
+        """
+        msg = build_message(create_command_tlv(TlvCommand.COMMAND_RESTORE_MOTOR), create_motor_position_tlv(-3597, 242, 0)).encode()
+        frame = build_frame(msg)
+        self.assertEqual(frame.hex(), "f10100010704000cfffff3f1f3f3000000f3f2000000000300043c24b9d0f2")
+        self.assertEqual(clean_frame(frame), msg)
+
+    def test_random_round_trip(self):
+        """
+        Test unescape(escape(x)) == x for random payloads, with and without a high density of frame markers.
+        Expected value is the original payload, the framed payload is read as exactly one frame.
+        """
+        rng = random.Random(1234)
+        alphabets = [range(256), [0x00, 0xf1, 0xf2, 0xf3]]
+        for alphabet in alphabets:
+            for length in [0, 1, 2, 3, 17, 1024, 4096]:
+                payload = bytes(rng.choice(alphabet) for _ in range(length))
+                with self.subTest(length=length, alphabet=len(alphabet)):
+                    escaped = escape(payload)
+                    self.assertEqual(unescape(escaped), payload)
+                    self.assertEqual(clean_frame(build_frame(payload)), payload)
+                    reader = FrameReader(None)
+                    reader.feed(build_frame(payload))
+                    self.assertEqual(len(reader.frames), 1, "Escaped payload must not contain an unescaped end marker")
+
+class TestFrameCache(unittest.TestCase):
+
+    """Precomputed frame tests"""
+    def test_command_frames(self):
+        """
+        Test cached constant command frames.
+        Expected value is the frame built from a new message, the same object is returned on every call.
+        """
+        for command in [TlvCommand.COMMAND_GET_STATUS, TlvCommand.COMMAND_HOMING, TlvCommand.COMMAND_REBOOT, TlvCommand.COMMAND_FIRMWARE_UPGRADE]:
+            with self.subTest(command=command):
+                expected = build_frame(build_message(create_command_tlv(command)).encode())
+                self.assertEqual(command_frame(command), expected)
+                self.assertIs(command_frame(command), command_frame(command))
+
+    def test_motor_position_frames(self):
+        """
+        Test motor position frames patched into a template, including positions with escaped bytes.
+        Expected value is the frame built from a new message.
+        """
+        positions = [(0, 0, 0), (-5794, 2936, 0), (-3597, 242, -1), (15000, -15000, 2**31 - 1)]
+        for command in [TlvCommand.COMMAND_MOVE_MOTOR, TlvCommand.COMMAND_RESTORE_MOTOR]:
+            for position in positions:
+                with self.subTest(command=command, position=position):
+                    expected = build_frame(build_message(create_command_tlv(command), create_motor_position_tlv(*position)).encode())
+                    self.assertEqual(motor_position_frame(command, *position), expected)
+
+class TestFrameReader(unittest.TestCase):
+
+    def setUp(self):
+        self.status = build_frame(build_message(create_command_tlv(TlvCommand.COMMAND_GET_STATUS)).encode())
+        self.escaped = b'\xf1\x01\xf3\xf2\x02\xf3\xf3\xf3\xf1\xf2'  # escaped end, escape and start marker inside frame
+
+    """Deframer tests"""
+    def test_split_chunks(self):
+        """
+        Test feeding two frames split at every possible position.
+        Expected value is both frames, unchanged.
+        """
+        stream = self.status + self.escaped
+        for split in range(len(stream) + 1):
+            with self.subTest(split=split):
+                reader = FrameReader(None)
+                reader.feed(stream[:split])
+                reader.feed(stream[split:])
+                self.assertEqual(list(reader.frames), [self.status, self.escaped])
+
+    def test_resync_after_garbage(self):
+        """
+        Test garbage and a truncated frame in front of a good frame.
+        Expected value is only the good frame, garbage and truncated frame are counted as dropped.
+        """
+        reader = FrameReader(None)
+        reader.feed(b'\x00\x13\xf2\xf3' + b'\xf1\x01\x00' + self.status)
+        self.assertEqual(list(reader.frames), [self.status])
+        self.assertEqual(reader.dropped_bytes, 4)
+        self.assertEqual(reader.dropped_frames, 1)
+
+    def test_max_frame_size(self):
+        """
+        Test frame without end marker longer than max_frame_size.
+        Expected value is the following frame only.
+        """
+        reader = FrameReader(None, max_frame_size=16)
+        reader.feed(b'\xf1' + b'\x00' * 32 + self.status)
+        self.assertEqual(list(reader.frames), [self.status])
+
+    def test_read_frame_keeps_leftover(self):
+        """
+        Test reading frames from pyserial loopback when several frames arrive at once.
+        Expected value is every frame, in order.
+        """
+        ser = serial.serial_for_url("loop://", timeout=0.1)
+        reader = FrameReader(ser)
+        ser.write(self.status + self.escaped + self.status[:5])
+        self.assertEqual(reader.read_frame(timeout=1), self.status)
+        self.assertEqual(reader.read_frame(timeout=1), self.escaped)
+        ser.write(self.status[5:])
+        self.assertEqual(reader.read_frame(timeout=1), self.status)
+        with self.assertRaises(Exception):
+            reader.read_frame(timeout=0.2)
+        ser.close()
+
+if __name__ == '__main__':
+    unittest.main()
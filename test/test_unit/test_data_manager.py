@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+from ...src import data_manager
+from ...src.data_manager import DataManager
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_data_manager`
+
+No hardware is needed - data and calibration files are created in a temporary directory.
+"""
+
+class TestMotorDataWriteBehind(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        files = {
+            "DATA_FILENAME": {"motors": {"last_x": 0, "last_y": 0}, "led": True, "zoom": False},
+            "CALIBRATION_FILENAME": {"calibration": {"offset_x": 280, "offset_y": 528}, "camera_config": {"X": 0, "Y": 0, "IMG_P": 1}},
+        }
+        self.patches = []
+        for name, content in files.items():
+            filename = os.path.join(self.directory, name.lower() + ".json")
+            with open(filename, "w") as f:
+                json.dump(content, f)
+            self.patches.append(mock.patch.object(data_manager, name, filename))
+        self.patches.append(mock.patch.object(data_manager, "CURRENT_CALIBRATION_FILENAME", os.path.join(self.directory, "current_calibration.json")))
+        for patch in self.patches:
+            patch.start()
+
+        self.data_file = data_manager.DATA_FILENAME
+        self.manager = DataManager(flush_interval=3600)  # flush only when forced
+
+    def tearDown(self):
+        self.manager.close()
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.directory)
+
+    def read_data_file(self):
+        with open(self.data_file) as f:
+            return json.load(f)
+
+    def test_coalesced_updates(self):
+        """
+        Test many motor updates between two flushes.
+        Expected behaviour is no file write before flush, one write with the latest values after it.
+        """
+        mtime = os.stat(self.data_file).st_mtime_ns
+        for x in range(100):
+            self.manager.update_motors_data([("last_x", x), ("last_y", -x)])
+        self.assertEqual(os.stat(self.data_file).st_mtime_ns, mtime)
+
+        self.assertTrue(self.manager.flush())
+        self.assertEqual(self.read_data_file()["motors"], {"last_x": 99, "last_y": -99})
+        self.assertFalse(os.path.exists(self.data_file + ".tmp"))
+
+    def test_unchanged_values(self):
+        """
+        Test motor update with unchanged values.
+        Expected return value is False and nothing is written on flush.
+        """
+        self.assertFalse(self.manager.update_motors_data([("last_x", 0), ("last_y", 0)]))
+        self.assertFalse(self.manager.flush())
+
+    def test_request_flush(self):
+        """
+        Test flush requested from another thread.
+        Expected behaviour is an immediate return, the flush thread writes the updated position.
+        """
+        self.manager.update_motors_data([("last_x", 42), ("last_y", 0)])
+        self.manager.request_flush()
+        for _ in range(100):
+            if self.read_data_file()["motors"]["last_x"] == 42:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.read_data_file()["motors"]["last_x"], 42)
+        self.assertFalse(self.manager.dirty)
+
+    def test_failed_write(self):
+        """
+        Test flush when writing the data file fails.
+        Expected behaviour is data kept dirty and written by the next flush.
+        """
+        self.manager.update_motors_data([("last_x", 7), ("last_y", 0)])
+        with mock.patch.object(self.manager, "write_file_atomic", side_effect=OSError("disk full")):
+            self.assertFalse(self.manager.flush())
+        self.assertTrue(self.manager.dirty)
+        self.assertTrue(self.manager.flush())
+        self.assertEqual(self.read_data_file()["motors"]["last_x"], 7)
+
+    def test_flush_on_close(self):
+        """
+        Test pending motor update when data manager is closed.
+        Expected value is the updated position in the data file.
+        """
+        self.manager.update_motors_data([("last_x", 1234), ("last_y", 0)])
+        self.manager.close()
+        self.assertEqual(self.read_data_file()["motors"]["last_x"], 1234)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import struct
+import unittest
+import numpy as np
+
+from ...hardware.ddm import *
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_ddm`
+
+No hardware is needed - diagnostics blocks are built in the tests.
+"""
+
+def legacy_temp(msb, lsb):
+    """Previous Sfp.get_diagnostics temperature conversion, int8 taken as a view so negative values do not overflow"""
+    temp_h = float(np.array([msb], dtype=np.uint8).view(np.int8)[0])
+    temp_l = 0
+    for bit in range(0, 8):
+        temp_l += (lsb & (1 << bit)) / 256
+    return temp_h + temp_l
+
+def legacy_power(raw):
+    """Previous Sfp.get_diagnostics power conversion, returns (mW, dBm)"""
+    mW = float(np.uint16(raw) / 10000)
+    if mW == 0.0:
+        return mW, -40.0
+    return mW, float(round(10 * np.log10(mW), 3))
+
+class TestDdm(unittest.TestCase):
+
+    def test_power_matches_legacy(self):
+        """
+        Test conversion of every raw power value.
+        Expected values are exactly the same mW and dBm as the previous conversion.
+        """
+        for raw in range(1 << 16):
+            self.assertEqual((raw_to_mW(raw), raw_to_dBm(raw)), legacy_power(raw), raw)
+
+    def test_temp_matches_legacy(self):
+        """
+        Test conversion of every raw temperature value.
+        Expected values are exactly the same as the previous conversion, including negative temperatures.
+        """
+        for msb in range(256):
+            for lsb in range(256):
+                raw = struct.unpack(">h", bytes([msb, lsb]))[0]
+                self.assertEqual(raw_to_temp(raw), legacy_temp(msb, lsb), (msb, lsb))
+
+    def test_decode_diagnostics(self):
+        """
+        Test decode of a diagnostics block.
+        Expected values are the same as converting each field separately.
+        """
+        block = [0xF6, 0x80, 0x80, 0x00, 0x10, 0x00, 0x13, 0x88, 0x00, 0x00]
+        self.assertEqual(decode_diagnostics(block), {
+            "temp": -9.5,
+            "vcc": 3.2768,
+            "tx_bias": 8.192,
+            "tx_power_dBm": -3.01,
+            "rx_power_dBm": -40.0,
+            "tx_power": 0.5,
+            "rx_power": 0.0,
+        })
+
+    def test_check_thresholds(self):
+        """
+        Test threshold crossing of each level.
+        Expected values are the most severe crossed threshold of each measurement.
+        """
+        thresholds = {
+            "high_alarm": {"temp": 80, "vcc": 3.6, "tx_bias": 60, "tx_power": 2, "rx_power": 2},
+            "low_alarm": {"temp": -10, "vcc": 3.0, "tx_bias": 1, "tx_power": 0.1, "rx_power": 0.01},
+            "high_warning": {"temp": 70, "vcc": 3.5, "tx_bias": 50, "tx_power": 1.5, "rx_power": 1.5},
+            "low_warning": {"temp": 0, "vcc": 3.1, "tx_bias": 2, "tx_power": 0.2, "rx_power": 0.02},
+        }
+        diagnostics = {"temp": 85, "vcc": 3.55, "tx_bias": 10, "tx_power": 0.15, "rx_power": 0.001}
+        self.assertEqual(check_thresholds(diagnostics, thresholds), {
+            "temp": "high_alarm",
+            "vcc": "high_warning",
+            "tx_bias": "ok",
+            "tx_power": "low_warning",
+            "rx_power": "low_alarm",
+        })
+
+    def test_vectorized(self):
+        """
+        Test conversion of a history buffer of raw power values.
+        Expected values are the same as converting one by one.
+        """
+        raw = np.random.default_rng(1).integers(0, 1 << 16, 1000)
+        self.assertEqual(raw_to_dBm_array(raw).tolist(), [raw_to_dBm(int(value)) for value in raw])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import io
+import unittest
+
+from ...src.digital_zoom import *
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_digital_zoom`
+
+No camera is needed - frames are generated with Pillow.
+"""
+
+def make_frame(width=720, height=720):
+    """Return JPEG with a white square in the top left quarter of the frame"""
+    image = Image.new("L", (width, height), 0)
+    image.paste(255, (0, 0, width // 2, height // 2))
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+def decode(jpeg):
+    return Image.open(io.BytesIO(jpeg))
+
+class TestZoomCoordinates(unittest.TestCase):
+
+    def test_zoomed_to_frame(self):
+        """
+        Test conversion of a marker position between zoomed and full frame.
+        Expected values match the focus_on_marker conversion, converting back returns the zoomed position.
+        """
+        for zoom_x, zoom_y, img_p in [(0, 0, 1), (0.25, 0.5, 0.5), (0.1, 0.7, 0.25)]:
+            with self.subTest(zoom=(zoom_x, zoom_y, img_p)):
+                x, y = zoomed_to_frame(360, 180, zoom_x, zoom_y, img_p, 720)
+                self.assertAlmostEqual(x, 360 * img_p + zoom_x * 720)
+                self.assertAlmostEqual(y, (1.0 - zoom_y) * 720 - (720 - 180) * img_p)
+                back = frame_to_zoomed(x, y, zoom_x, zoom_y, img_p, 720)
+                self.assertAlmostEqual(back[0], 360)
+                self.assertAlmostEqual(back[1], 180)
+
+@unittest.skipIf(Image is None, "Digital zoom requires Pillow")
+class TestDigitalZoom(unittest.TestCase):
+
+    def test_crop_box(self):
+        """
+        Test zoom area for camera configs used by focus_on_marker.
+        Expected box is measured from the bottom edge for Y and stays inside the frame.
+        """
+        self.assertEqual(crop_box(0, 0, 1, 720, 720), (0, 0, 720, 720))
+        self.assertEqual(crop_box(0, 0.5, 0.5, 720, 720), (0, 0, 360, 360))
+        self.assertEqual(crop_box(0.25, 0.25, 0.5, 720, 720), (180, 180, 540, 540))
+        self.assertEqual(crop_box(0.9, 0, 0.5, 720, 720), (360, 360, 720, 720))
+
+    def test_zoom(self):
+        """
+        Test zoom into the top left quarter of the frame.
+        Expected frame has the original size and is white all over.
+        """
+        zoom = DigitalZoom(x=0, y=0.5, img_p=0.5)
+        zoomed = decode(zoom.apply(make_frame()))
+        self.assertEqual(zoomed.size, (720, 720))
+        self.assertGreater(min(zoomed.getextrema()), 200)
+
+    def test_passthrough(self):
+        """
+        Test frame without zoom.
+        Expected value is the unchanged JPEG.
+        """
+        frame = make_frame()
+        self.assertIs(DigitalZoom().apply(frame), frame)
+
+    def test_cache(self):
+        """
+        Test repeated zoom of the same frame sequence and a config change.
+        Expected behaviour is the cached frame for the same sequence and config, a new frame after config change.
+        """
+        zoom = DigitalZoom(x=0, y=0.5, img_p=0.5)
+        frame = make_frame()
+        first = zoom.apply(frame, sequence=1)
+        self.assertIs(zoom.apply(frame, sequence=1), first)
+
+        zoom.set_config(0.5, 0.5, 0.5)  # top right quarter is black
+        self.assertLess(max(decode(zoom.apply(frame, sequence=1)).getextrema()), 50)
+
+        with self.assertRaises(ValueError):
+            zoom.set_config(0, 0, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import time
+import random
+import asyncio
+import unittest
+
+from unittest import mock
+
+from ...src import motor_control
+from ...src.motor_control import MotorControl
+from ...src.communication import TlvCommand
+from ...src.serial_engine import SerialEngine
+from .fake_motor_driver import FakeMotorDriver, FakeDataManager
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_motor_control`
+
+No hardware is needed - motor driver firmware is simulated by FakeMotorDriver.
+"""
+
+class TestMotorControl(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = FakeMotorDriver(speed=20000)
+        self.engine = SerialEngine(self.driver)
+        self.data_manager = FakeDataManager()
+        self.motor_control = MotorControl(self.engine, self.data_manager, poll_interval_moving=0.02, poll_interval_idle=0.5)
+        self.wait_for(lambda: self.motor_control.motors_connected and not self.motor_control.moving, 3)
+
+    def tearDown(self):
+        self.motor_control.close()
+        self.engine.close()
+
+    def wait_for(self, condition, timeout):
+        """Wait until condition is True, fail on timeout"""
+        start = time.time()
+        while not condition():
+            if time.time() - start > timeout:
+                self.fail("Timed out waiting for condition")
+            time.sleep(0.01)
+
+    """Adaptive status polling tests"""
+    def test_idle_polling(self):
+        """
+        Test status poll rate while motors stand still.
+        Expected number of status requests in one second is about 1 / poll_interval_idle.
+        """
+        requests = self.driver.status_requests()
+        time.sleep(1.1)
+        self.assertLessEqual(self.driver.status_requests() - requests, 3)
+
+    def test_moving_polling(self):
+        """
+        Test status polling during and after a move.
+        Expected behaviour is fast polling until the position settles on target, then idle polling again.
+        """
+        requests = self.driver.status_requests()
+        self.assertTrue(self.motor_control.move_motor_to(10000, -5000, 0))
+        self.assertTrue(self.motor_control.get_motors_moving())
+
+        self.wait_for(lambda: not self.motor_control.moving, 3)
+        self.assertEqual((self.motor_control.position_x, self.motor_control.position_y), (10000, -5000))
+        self.assertGreater(self.driver.status_requests() - requests, 10, "Position must be polled fast while moving")
+
+        requests = self.driver.status_requests()
+        time.sleep(1.1)
+        self.assertLessEqual(self.driver.status_requests() - requests, 3)
+
+    def test_lost_status_reply(self):
+        """
+        Test one status reply lost by the driver with the default reply timeout.
+        Expected behaviour is motors reported disconnected after the timeout and connected again on the next poll.
+        """
+        self.driver.lost_replies = 1
+        self.wait_for(lambda: not self.motor_control.motors_connected, 4)
+        self.wait_for(lambda: self.motor_control.motors_connected, 2)
+        self.assertEqual(self.engine.get_metrics()["reply_timeouts"], 1)
+
+    """Move command coalescing tests"""
+    def test_relative_move_burst(self):
+        """
+        Test a burst of relative moves faster than status polling.
+        Expected behaviour is every move added to the last target and fewer frames sent than requested.
+        """
+        sent = self.driver.commands.count(TlvCommand.COMMAND_MOVE_MOTOR)
+        for _ in range(50):
+            self.assertTrue(self.motor_control.move_motor(100, -50, 0))
+            time.sleep(0.002)
+
+        self.wait_for(lambda: not self.motor_control.moving, 3)
+        self.assertEqual((self.motor_control.position_x, self.motor_control.position_y), (5000, -2500))
+
+        stats = self.motor_control.get_move_command_stats()
+        self.assertEqual(stats["move_requests"], 50)
+        self.assertEqual(stats["moves_sent"] + stats["moves_merged"], 50)
+        self.assertGreater(stats["moves_merged"], 0)
+        self.assertEqual(self.driver.commands.count(TlvCommand.COMMAND_MOVE_MOTOR) - sent, stats["moves_sent"])
+
+    def test_cleared_target_not_sent(self):
+        """
+        Test clearing targets while the command loop is sending a move, with slow frame encoding to widen the race.
+        Expected behaviour is no move frame queued after clear_targets returns.
+        """
+        encode = motor_control.motor_position_frame
+        def slow_encode(*args):
+            time.sleep(0.005)
+            return encode(*args)
+
+        sent = []
+        send = self.engine.send
+        def record_send(frame, priority):
+            sent.append(frame)
+            return send(frame, priority=priority)
+
+        rng = random.Random(1)
+        with mock.patch.object(motor_control, "motor_position_frame", slow_encode), mock.patch.object(self.engine, "send", record_send):
+            for i in range(30):
+                self.motor_control.queue_move(i * 10, 0, 0)
+                time.sleep(rng.uniform(0, 0.01))
+                self.motor_control.clear_targets()
+                count = len(sent)
+                time.sleep(0.03)
+                self.assertEqual(len(sent), count, "Cleared target was sent")
+
+    def test_command_rate(self):
+        """
+        Test absolute moves requested in a tight loop.
+        Expected behaviour is at most one move frame per command interval, the last target is reached.
+        """
+        start = time.time()
+        for x in range(0, 2000, 10):
+            self.motor_control.move_motor_to(x, 0, 0)
+        self.wait_for(lambda: not self.motor_control.moving, 3)
+        self.assertEqual(self.motor_control.position_x, 1990)
+
+        sent = self.motor_control.get_move_command_stats()["moves_sent"]
+        self.assertLessEqual(sent, (time.time() - start) / self.motor_control.command_interval + 1)
+
+    """Move and wait tests"""
+    def test_move_and_wait_reached(self):
+        """
+        Test blocking move to a target.
+        Expected status is "reached" with the final position at target, about as soon as motors get there.
+        """
+        ret = self.motor_control.move_and_wait(8000, 4000, tolerance=0, timeout=5)
+        self.assertEqual(ret["status"], "reached")
+        self.assertEqual((ret["x"], ret["y"]), (8000, 4000))
+        self.assertLess(ret["elapsed"], 8000 / self.driver.speed + 0.2)
+
+    def test_move_and_wait_async(self):
+        """
+        Test asyncio move, clamped to motor limits.
+        Expected status is "reached" at the limited target.
+        """
+        ret = asyncio.run(self.motor_control.move_and_wait_async(20000, 0, timeout=5))
+        self.assertEqual(ret["status"], "reached")
+        self.assertEqual(ret["x"], 15000)
+
+    def test_move_and_wait_stalled(self):
+        """
+        Test move when motors do not move.
+        Expected status is "stalled" after stall_time.
+        """
+        self.driver.speed = 0
+        ret = self.motor_control.move_and_wait(1000, 0, timeout=5, stall_time=0.3)
+        self.assertEqual(ret["status"], "stalled")
+        self.assertLess(ret["elapsed"], 2)
+
+    def test_move_and_wait_timeout(self):
+        """
+        Test move that takes longer than timeout.
+        Expected status is "timeout" with a position between start and target.
+        """
+        ret = self.motor_control.move_and_wait(-15000, 0, timeout=0.3)
+        self.assertEqual(ret["status"], "timeout")
+        self.assertTrue(-15000 < ret["x"] < 0)
+
+if __name__ == '__main__':
+    unittest.main()
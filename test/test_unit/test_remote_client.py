@@ -0,0 +1,163 @@
+import time
+import socket
+import unittest
+
+from threading import Thread
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+from ...src.remote_client import *
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_remote_client`
+
+No second unit is needed - the device manager is replaced by a stand-in XML-RPC peer on localhost.
+"""
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+class StandInPeer(SimpleXMLRPCServer):
+    """Device manager stand-in, request_remote runs commands of a fake remote unit and counts connections"""
+    daemon_threads = True
+
+    def __init__(self, multicall=True, forward_multicall=True):
+        super().__init__(("localhost", 0), requestHandler=KeepAliveRequestHandler, allow_none=True, logRequests=False)
+        self.connections = 0
+        self.forward_multicall = forward_multicall  # remote unit answers system.multicall
+        self.remote_requests = 0  # requests sent on to the remote unit
+        self.register_function(self.request_remote)
+        if multicall:
+            self.register_multicall_functions()
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        Thread(target=super().process_request, args=(request, client_address), daemon=True).start()  # one thread per connection
+
+    def request_remote(self, command, params):
+        self.remote_requests += 1
+        if command == "system.multicall" and self.forward_multicall:
+            return [self.remote_call(call["methodName"], call["params"]) for call in params[0]]
+        return self.run_command(command, params)
+
+    def remote_call(self, command, params):
+        """Run one call of a forwarded multicall, failed calls are returned as fault structs like system.multicall does"""
+        try:
+            return [self.run_command(command, params)]
+        except Exception as e:
+            return {"faultCode": 1, "faultString": f"{type(e)}:{e}"}
+
+    def run_command(self, command, params):
+        if command == "get_sfp_diagnostics":
+            return {"sfp_0": {"diagnostics": {"rx_power_dBm": -5.5}}}
+        if command == "sleep":
+            time.sleep(params[0])
+            return params[0]
+        raise ValueError(f"Unknown command {command}")
+
+    def get_url(self):
+        return f"http://localhost:{self.server_address[1]}/RPC2"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+class TestRemoteClient(unittest.TestCase):
+
+    def setUp(self):
+        self.peer = StandInPeer()
+        self.client = RemoteClient(self.peer.get_url(), timeout=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.peer.close()
+
+    def test_keep_alive(self):
+        """
+        Test repeated calls from one thread.
+        Expected behaviour is one connection for all calls, latency recorded for every call.
+        """
+        for _ in range(10):
+            self.assertEqual(self.client.call("request_remote", "sleep", [0]), 0)
+        self.assertEqual(self.peer.connections, 1)
+        self.assertEqual(self.client.get_metrics()["request_remote"]["calls"], 10)
+
+    def test_timeout(self):
+        """
+        Test call to a peer slower than the call timeout.
+        Expected behaviour is a timeout exception after the timeout, counted in metrics.
+        """
+        start = time.time()
+        with self.assertRaises(socket.timeout):
+            self.client.call("request_remote", "sleep", [1], timeout=0.2)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(self.client.get_metrics()["request_remote"]["timeouts"], 1)
+        self.assertEqual(self.client.call("request_remote", "sleep", [0]), 0)  # reconnects after timeout
+
+    def test_parallel(self):
+        """
+        Test asynchronous calls.
+        Expected behaviour is calls running at the same time.
+        """
+        start = time.time()
+        futures = [self.client.call_async("request_remote", "sleep", [0.3]) for _ in range(3)]
+        self.assertEqual([future.result() for future in futures], [0.3] * 3)
+        self.assertLess(time.time() - start, 0.6)
+
+    def test_batch(self):
+        """
+        Test batch of commands with one failing command.
+        Expected values are results in call order, error for the failing one, one multicall round trip.
+        """
+        results = self.client.batch([
+            ("request_remote", ("get_sfp_diagnostics", [])),
+            ("request_remote", ("unknown", [])),
+            ("request_remote", ("sleep", [0])),
+        ])
+        self.assertEqual(results[0]["result"]["sfp_0"]["diagnostics"]["rx_power_dBm"], -5.5)
+        self.assertIn("error", results[1])
+        self.assertEqual(results[2], {"result": 0})
+        self.assertEqual(list(self.client.get_metrics()), ["system.multicall"])
+
+    def test_batch_fallback(self):
+        """
+        Test batch to a peer without system.multicall.
+        Expected values are the same results from separate calls.
+        """
+        peer = StandInPeer(multicall=False)
+        client = RemoteClient(peer.get_url())
+        try:
+            results = client.batch([("request_remote", ("sleep", [0])), ("request_remote", ("unknown", []))])
+            self.assertEqual(results[0], {"result": 0})
+            self.assertIn("error", results[1])
+            self.assertEqual(client.get_metrics()["request_remote"]["calls"], 2)
+        finally:
+            client.close()
+            peer.close()
+
+    def test_batch_forwarded(self):
+        """
+        Test batch forwarded to the remote unit with one failing command.
+        Expected values are results in call order, error for the failing one, one request sent on to the remote unit.
+        """
+        results = self.client.batch_forwarded("request_remote", [("get_sfp_diagnostics", []), ("unknown", []), ("sleep", [0])])
+        self.assertEqual(results[0]["result"]["sfp_0"]["diagnostics"]["rx_power_dBm"], -5.5)
+        self.assertIn("Unknown command", results[1]["error"])
+        self.assertEqual(results[2], {"result": 0})
+        self.assertEqual(self.peer.remote_requests, 1)
+
+    def test_batch_forwarded_fallback(self):
+        """
+        Test forwarded batch when the remote unit does not answer system.multicall.
+        Expected values are the same results from commands forwarded one by one in one multicall to the device manager.
+        """
+        self.peer.forward_multicall = False
+        results = self.client.batch_forwarded("request_remote", [("sleep", [0]), ("unknown", [])])
+        self.assertEqual(results[0], {"result": 0})
+        self.assertIn("error", results[1])
+        self.assertEqual(self.peer.remote_requests, 3)
+        self.assertEqual(self.client.get_metrics()["system.multicall"]["calls"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
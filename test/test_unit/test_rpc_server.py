@@ -0,0 +1,204 @@
+import time
+import unittest
+import xmlrpc.client
+
+from threading import Thread, Lock
+
+from ...src.rpc_server import *
+from ...src.status_cache import StatusCache
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_rpc_server`
+
+No hardware is needed - the server runs on a free localhost port with a stand-in instance.
+"""
+
+class SlowInstance():
+    """Instance with one fast and one slow method, counts concurrent slow calls"""
+    def __init__(self):
+        self.lock = Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def get_unit_id(self):
+        return "test"
+
+    def take_picture(self):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.3)
+        with self.lock:
+            self.running -= 1
+        return True
+
+class StatusInstance():
+    """Instance with get_full_status over a counter section"""
+    def __init__(self):
+        self.status_cache = StatusCache()
+        self.counter = 0
+
+    def increment(self):
+        self.counter += 1
+        return self.counter
+
+    def get_full_status(self, since=None):
+        return self.status_cache.update({"unit_id": "test", "counter": self.counter}, since)
+
+class TestPooledXMLRPCServer(unittest.TestCase):
+
+    def setUp(self):
+        self.instance = SlowInstance()
+        self.server = PooledXMLRPCServer(("localhost", 0), workers=8, slow_workers=2, slow_methods=["take_picture"], allow_none=True, logRequests=False)
+        self.server.register_instance(self.instance)
+        self.server.register_multicall_functions()
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://localhost:{self.server.server_address[1]}/RPC2"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def call_in_threads(self, method, count):
+        threads = [Thread(target=lambda: getattr(xmlrpc.client.ServerProxy(self.url), method)()) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def test_fast_call_during_slow_calls(self):
+        """
+        Test fast getter while slow calls are in progress.
+        Expected behaviour is a fast reply without waiting for slow calls.
+        """
+        threads = self.call_in_threads("take_picture", 2)
+        time.sleep(0.05)
+
+        start = time.time()
+        self.assertEqual(xmlrpc.client.ServerProxy(self.url).get_unit_id(), "test")
+        self.assertLess(time.time() - start, 0.2)
+        for thread in threads:
+            thread.join()
+
+    def test_slow_lane_limit(self):
+        """
+        Test more concurrent slow calls than slow workers.
+        Expected behaviour is at most slow_workers running at once, all calls complete.
+        """
+        for thread in self.call_in_threads("take_picture", 5):
+            thread.join()
+        self.assertEqual(self.instance.max_running, 2)
+        self.assertEqual(self.server.get_rpc_metrics()["take_picture"]["calls"], 5)
+
+    def test_slow_burst_keeps_workers_free(self):
+        """
+        Test more concurrent slow calls than main workers.
+        Expected behaviour is a fast reply, slow calls wait in the slow pool without holding main workers.
+        """
+        server = PooledXMLRPCServer(("localhost", 0), workers=2, slow_workers=1, slow_methods=["take_picture"], logRequests=False)
+        server.register_instance(self.instance)
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://localhost:{server.server_address[1]}/RPC2"
+        try:
+            threads = [Thread(target=lambda: xmlrpc.client.ServerProxy(url).take_picture()) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.1)
+
+            start = time.time()
+            self.assertEqual(xmlrpc.client.ServerProxy(url).get_unit_id(), "test")
+            self.assertLess(time.time() - start, 0.2)
+            for thread in threads:
+                thread.join()
+            self.assertEqual(self.instance.max_running, 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_slow_queue_full(self):
+        """
+        Test more slow calls than slow workers and queue places.
+        Expected behaviour is a fault for calls over the limit, fast calls still served.
+        """
+        server = PooledXMLRPCServer(("localhost", 0), workers=8, slow_workers=1, slow_queue=1, slow_methods=["take_picture"], logRequests=False)
+        server.register_instance(self.instance)
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://localhost:{server.server_address[1]}/RPC2"
+        results = []
+        def call():
+            try:
+                results.append(xmlrpc.client.ServerProxy(url).take_picture())
+            except xmlrpc.client.Fault as e:
+                results.append(e.faultString)
+        try:
+            threads = [Thread(target=call) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+                time.sleep(0.02)
+            self.assertEqual(xmlrpc.client.ServerProxy(url).get_unit_id(), "test")
+            for thread in threads:
+                thread.join()
+            self.assertEqual(results.count(True), 2)
+            self.assertEqual(server.get_slow_lane_status(), {"pending": 0, "rejected": 2})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_keep_alive_connection(self):
+        """
+        Test slow and fast calls alternating on one HTTP/1.1 connection.
+        Expected behaviour is every call answered, the connection moving between the pools.
+        """
+        class KeepAliveRequestHandler(RequestHandler):
+            protocol_version = "HTTP/1.1"
+
+        server = PooledXMLRPCServer(("localhost", 0), slow_methods=["take_picture"], requestHandler=KeepAliveRequestHandler, logRequests=False)
+        server.register_instance(self.instance)
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            proxy = xmlrpc.client.ServerProxy(f"http://localhost:{server.server_address[1]}/RPC2")
+            for _ in range(3):
+                self.assertTrue(proxy.take_picture())
+                self.assertEqual(proxy.get_unit_id(), "test")
+            proxy("close")()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_multicall(self):
+        """
+        Test batching calls with system.multicall.
+        Expected values are results of all calls in order.
+        """
+        multicall = xmlrpc.client.MultiCall(xmlrpc.client.ServerProxy(self.url))
+        multicall.get_unit_id()
+        multicall.take_picture()
+        self.assertEqual(list(multicall()), ["test", True])
+
+    def test_create_server_multicall(self):
+        """
+        Test system.multicall on the server created like main.py does, with get_full_status polled inside it.
+        Expected values are results of all calls in order, the second status holding only the changed section.
+        """
+        server = create_server(StatusInstance(), ("localhost", 0))
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            proxy = xmlrpc.client.ServerProxy(f"http://localhost:{server.server_address[1]}/RPC2", allow_none=True)
+            self.assertIn("system.multicall", proxy.system.listMethods())
+
+            since = proxy.get_full_status()["timestamp"]
+            multicall = xmlrpc.client.MultiCall(proxy)
+            multicall.increment()
+            multicall.get_full_status(since)
+            multicall.get_rpc_metrics()
+            counter, status, metrics = multicall()
+            self.assertEqual(counter, 1)
+            self.assertEqual(status["sections"], {"counter": 1})
+            self.assertGreater(status["timestamp"], since)
+            self.assertEqual(metrics["get_full_status"]["calls"], 2)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
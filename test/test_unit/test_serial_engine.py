@@ -0,0 +1,171 @@
+import time
+import serial
+import unittest
+
+from unittest import mock
+from threading import Event, Timer
+
+from ...src.communication import *
+from ...src import serial_engine
+from ...src.serial_engine import *
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_serial_engine`
+
+No hardware is needed - pyserial's loop:// URL echoes every written frame back as its reply.
+"""
+
+class GatedLoop():
+    """loop:// serial that blocks writes until released and can drop or delay frames instead of echoing them"""
+    def __init__(self):
+        self.ser = serial.serial_for_url("loop://", timeout=2)
+        self.gate = Event()
+        self.gate.set()
+        self.echo = True
+        self.delay = 0  # seconds before the echo is received
+        self.written = []
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+        if name == "timeout":
+            self.ser.timeout = value
+        else:
+            super().__setattr__(name, value)
+
+    def write(self, frame):
+        self.gate.wait()
+        self.written.append(frame)
+        if self.echo and self.delay:
+            Timer(self.delay, self.ser.write, args=(frame,)).start()
+        elif self.echo:
+            self.ser.write(frame)
+
+class TestSerialEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.ser = GatedLoop()
+        self.engine = SerialEngine(self.ser, reply_timeout=0.3)
+
+    def tearDown(self):
+        self.ser.gate.set()
+        self.engine.close()
+
+    def test_request_reply(self):
+        """
+        Test request with a reply.
+        Expected value is the echoed frame, round trip time is recorded.
+        """
+        frame = command_frame(TlvCommand.COMMAND_GET_STATUS)
+        self.assertEqual(self.engine.request(frame), frame)
+
+        metrics = self.engine.get_metrics()
+        self.assertEqual(metrics["replies_received"], 1)
+        self.assertIsNotNone(metrics["last_rtt"])
+        self.assertEqual(metrics["pending_replies"], 0)
+
+    def test_fire_and_forget(self):
+        """
+        Test send without a reply.
+        Expected future result is None, the echoed frame is counted as unsolicited.
+        """
+        future = self.engine.send(command_frame(TlvCommand.COMMAND_HOMING))
+        self.assertIsNone(future.result(timeout=1))
+        time.sleep(0.2)
+        self.assertEqual(self.engine.get_metrics()["unsolicited_frames"], 1)
+
+    def test_reply_timeout(self):
+        """
+        Test request when no reply is received.
+        Expected behaviour is an exception after the reply timeout, not later than one read timeout.
+        """
+        self.ser.echo = False
+        start = time.time()
+        with self.assertRaises(Exception):
+            self.engine.request(command_frame(TlvCommand.COMMAND_GET_STATUS))
+        self.assertLess(time.time() - start, 0.3 + 4 * READ_TIMEOUT)
+        self.assertEqual(self.engine.get_metrics()["reply_timeouts"], 1)
+
+    def test_late_reply(self):
+        """
+        Test reply received after its request timed out, before the next request is written.
+        Expected behaviour is the late reply dropped, the next request gets its own reply.
+        """
+        status = command_frame(TlvCommand.COMMAND_GET_STATUS)
+        other = motor_position_frame(TlvCommand.COMMAND_MOVE_MOTOR, 1, 2, 3)
+        self.ser.delay = 0.45
+        with self.assertRaises(Exception):
+            self.engine.request(status)
+        time.sleep(0.2)  # late reply is received
+
+        self.ser.delay = 0
+        self.assertEqual(self.engine.request(other), other)
+        metrics = self.engine.get_metrics()
+        self.assertEqual(metrics["late_replies"], 1)
+        self.assertEqual(metrics["replies_received"], 1)
+
+    def test_lost_reply(self):
+        """
+        Test reply that is never received, the driver answers the following requests promptly.
+        Expected behaviour is only the request with the lost reply failing, every following request gets its own reply.
+        """
+        self.ser.echo = False
+        with self.assertRaises(Exception):
+            self.engine.request(command_frame(TlvCommand.COMMAND_GET_STATUS))
+
+        self.ser.echo = True
+        for x in range(5):
+            frame = motor_position_frame(TlvCommand.COMMAND_MOVE_MOTOR, x, 0, 0)
+            self.assertEqual(self.engine.request(frame), frame)
+        self.assertEqual(self.engine.get_metrics()["replies_received"], 5)
+
+    def test_request_after_close(self):
+        """
+        Test request submitted after the engine was closed.
+        Expected behaviour is an exception instead of waiting forever.
+        """
+        self.engine.close()
+        start = time.time()
+        with self.assertRaises(Exception):
+            self.engine.request(command_frame(TlvCommand.COMMAND_GET_STATUS))
+        self.assertLess(time.time() - start, QUEUE_TIMEOUT + 0.3 + 0.5)
+
+    def test_queue_wait_timeout(self):
+        """
+        Test request while the writer is blocked on a previous frame.
+        Expected behaviour is an exception after queue and reply timeout, the request is never written.
+        """
+        self.ser.gate.clear()
+        self.engine.send(command_frame(TlvCommand.COMMAND_HOMING))
+        time.sleep(0.05)
+        with mock.patch.object(serial_engine, "QUEUE_TIMEOUT", 0.2):
+            with self.assertRaises(Exception):
+                self.engine.request(command_frame(TlvCommand.COMMAND_GET_STATUS))
+        self.ser.gate.set()
+        time.sleep(0.1)
+        self.assertEqual(len(self.ser.written), 1)
+
+    def test_priority(self):
+        """
+        Test that queued moves are written ahead of queued status polls.
+        Expected write order is the blocked first frame, then high priority frames, then low priority frames.
+        """
+        status = command_frame(TlvCommand.COMMAND_GET_STATUS)
+        moves = [motor_position_frame(TlvCommand.COMMAND_MOVE_MOTOR, x, 0, 0) for x in range(3)]
+        self.ser.echo = False
+        self.ser.gate.clear()  # writer blocks on the first frame, the rest stays queued
+
+        futures = [self.engine.send(moves[0])]
+        time.sleep(0.1)
+        futures.append(self.engine.submit(status, priority=PRIORITY_LOW, expect_reply=False))
+        futures += [self.engine.send(move) for move in moves[1:]]
+        self.assertGreaterEqual(self.engine.get_metrics()["queue_depth"], 3)
+
+        self.ser.gate.set()
+        for future in futures:
+            future.result(timeout=1)
+        self.assertEqual(self.ser.written, moves + [status])
+
+if __name__ == '__main__':
+    unittest.main()
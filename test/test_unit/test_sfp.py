@@ -0,0 +1,124 @@
+import unittest
+
+from unittest import mock
+
+from ...hardware import i2c_bus
+from ...hardware.sfp import Sfp
+from .fake_i2c_bus import FakeI2cBus, make_sfp_id_page, make_sfp_diag_page
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_sfp`
+
+No hardware is needed - SFP EEPROMs are simulated by FakeI2cBus.
+"""
+
+class TestSfpInit(unittest.TestCase):
+
+    def create_sfp(self, bus):
+        with mock.patch.object(i2c_bus, "SMBus", return_value=bus):
+            driver = Sfp()
+        self.addCleanup(driver.close)
+        return driver
+
+    def test_module_info(self):
+        """
+        Test module info parsed from the ID page.
+        Expected values are the fields written to the EEPROM, ID page and thresholds read in one transaction each.
+        """
+        bus = FakeI2cBus({0x50: make_sfp_id_page(), 0x51: make_sfp_diag_page()})
+        driver = self.create_sfp(bus)
+        self.assertEqual(driver.get_module_info(), {
+            "manufacturer": "IRNAS           ",
+            "revision": "1.0 ",
+            "serial_num": "KRZ000001       ",
+            "sfp_type": 3,
+            "connector": 7,
+            "bitrate": 1300,
+            "wavelength": 1310,
+        })
+        self.assertEqual(driver.diag_settings, 0x68)
+        self.assertTrue(driver.checksum_valid)
+        self.assertEqual(driver.get_id_page(), bytes(make_sfp_id_page()[:96]))
+        self.assertEqual(bus.transactions, 2)
+
+    def test_block_read_fallback(self):
+        """
+        Test init on an adapter without i2c_rdwr support.
+        Expected behaviour is the same module info from 32 byte block reads.
+        """
+        bus = FakeI2cBus({0x50: make_sfp_id_page(), 0x51: make_sfp_diag_page()}, rdwr=False)
+        driver = self.create_sfp(bus)
+        self.assertEqual(driver.get_module_info()["wavelength"], 1310)
+        self.assertEqual(driver.get_id_page(), bytes(make_sfp_id_page()[:96]))
+        self.assertEqual(driver.get_thresholds()["high_alarm"]["temp"], 85.0)
+        self.assertEqual(bus.transactions, 6)
+
+    def test_checksum_mismatch(self):
+        """
+        Test init with a corrupted ID page.
+        Expected behaviour is module info still parsed and checksum_valid set to False.
+        """
+        driver = self.create_sfp(FakeI2cBus({0x50: make_sfp_id_page(valid_checksum=False)}))
+        self.assertFalse(driver.checksum_valid)
+        self.assertEqual(driver.get_module_info()["bitrate"], 1300)
+
+    def test_diagnostics(self):
+        """
+        Test diagnostics read of a module at 0.5 mW TX and no RX power.
+        Expected values are the converted diagnostics read in one transaction.
+        """
+        bus = FakeI2cBus({0x50: make_sfp_id_page(), 0x51: make_sfp_diag_page()})
+        driver = self.create_sfp(bus)
+        bus.transactions = 0
+        self.assertEqual(driver.get_diagnostics(), {
+            "temp": 26.25,
+            "tx_power_dBm": -3.01,
+            "rx_power_dBm": -40.0,
+            "tx_power": 0.5,
+            "rx_power": 0.0,
+            "vcc": 3.2768,
+            "tx_bias": 8.192,
+        })
+        self.assertEqual(driver.get_flags(), {"temp": "ok", "vcc": "ok", "tx_bias": "ok", "tx_power": "ok", "rx_power": "low_alarm"})
+        self.assertEqual(bus.transactions, 1)
+
+    def test_external_calibration(self):
+        """
+        Test diagnostics of an externally calibrated module.
+        Expected values are raw values corrected with calibration constants, thresholds corrected the same way.
+        """
+        calibration = (0.0, 0.0, 0.0, 2.0, 10.0, 256, 0, 512, 0, 256, 0x100, 256, 0)  # rx = 2 * raw + 10, tx power doubled, temp + 1 degC
+        bus = FakeI2cBus({0x50: make_sfp_id_page(diag_settings=0x58), 0x51: make_sfp_diag_page(calibration=calibration)})
+        driver = self.create_sfp(bus)
+        diagnostics = driver.get_diagnostics()
+        self.assertEqual(diagnostics["temp"], 27.25)
+        self.assertEqual(diagnostics["tx_power"], 1.0)
+        self.assertEqual(diagnostics["rx_power"], 0.001)
+        self.assertEqual(diagnostics["vcc"], 3.2768)
+        self.assertEqual(driver.get_thresholds()["high_alarm"]["temp"], 86.0)
+        self.assertEqual(driver.get_thresholds()["low_alarm"]["rx_power"], 0.011)
+        self.assertEqual(driver.get_flags()["rx_power"], "low_alarm")
+
+    def test_no_diagnostics(self):
+        """
+        Test module without digital diagnostics.
+        Expected behaviour is no thresholds read and no flags.
+        """
+        bus = FakeI2cBus({0x50: make_sfp_id_page(diag_settings=0)})
+        driver = self.create_sfp(bus)
+        self.assertIsNone(driver.get_thresholds())
+        self.assertEqual(bus.transactions, 1)
+
+    def test_no_module(self):
+        """
+        Test init without a module in the cage.
+        Expected behaviour is an exception and the bus released.
+        """
+        bus = FakeI2cBus({})
+        with self.assertRaises(Exception):
+            self.create_sfp(bus)
+        self.assertTrue(bus.closed)
+        self.assertEqual(i2c_bus.get_open_buses(), {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+from unittest import mock
+
+from ...hardware import i2c_bus
+from ...hardware.pca9546a import Pca9546a
+from ...src.sfp_monitor import *
+from .fake_i2c_bus import FakeI2cBus, make_sfp_id_page, make_sfp_diag_page
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_sfp_monitor`
+
+No hardware is needed - the switch and both SFPs are simulated by FakeI2cBus.
+"""
+
+def make_module():
+    return {0x50: make_sfp_id_page(), 0x51: make_sfp_diag_page()}
+
+class TestSfpMonitor(unittest.TestCase):
+
+    def create_monitor(self, bus):
+        with mock.patch.object(i2c_bus, "SMBus", return_value=bus):
+            monitor = SfpMonitor()
+        self.addCleanup(monitor.close)
+        return monitor
+
+    def test_switch_skips_selected_channel(self):
+        """
+        Test selecting the same channel configuration repeatedly.
+        Expected behaviour is one switch write, invalid configurations rejected without a write.
+        """
+        bus = FakeI2cBus({}, switch_address=0x70)
+        with mock.patch.object(i2c_bus, "SMBus", return_value=bus):
+            switch = Pca9546a(0x70)
+        self.addCleanup(switch.close)
+        bus.transactions = 0
+        for _ in range(5):
+            with switch.channel(SFP_OUT_line) as selected:
+                self.assertTrue(selected)
+        self.assertFalse(switch.select_channel(val=16))
+        self.assertFalse(switch.select_channel(val=SFP_CAMERA_line, ch2=2))
+        self.assertEqual(bus.switch_writes, 1)
+        self.assertEqual(switch.get_stats()["writes_skipped"], 4)
+
+    def test_update_cycle(self):
+        """
+        Test update cycles with both modules present.
+        Expected behaviour is one diagnostics read per module and one switch write per cycle, counted per cycle.
+        """
+        bus = FakeI2cBus({}, switch_address=0x70, lines={SFP_CAMERA_line: make_module(), SFP_OUT_line: make_module()})
+        monitor = self.create_monitor(bus)
+        for _ in range(10):
+            start = bus.transactions
+            monitor.update_sfp_diagnostics()
+            self.assertEqual(monitor.get_i2c_stats()["cycle_transactions"], 3)
+            self.assertEqual(bus.transactions - start, 3)
+        data = monitor.get_complete_diagnostics()
+        for name in ["sfp_0", "sfp_1"]:
+            self.assertEqual(data[name]["diagnostics"]["tx_power"], 0.5)
+            self.assertEqual(data[name]["flags"]["rx_power"], "low_alarm")
+
+    def test_re_init_grouped(self):
+        """
+        Test update cycles with one module missing.
+        Expected behaviour is no switch writes between re-inits, re-init probe done in the missing module's switch window.
+        """
+        bus = FakeI2cBus({}, switch_address=0x70, lines={SFP_CAMERA_line: make_module(), SFP_OUT_line: {}})
+        monitor = self.create_monitor(bus)
+        self.assertIsNone(monitor.sfp_1)
+        monitor.update_sfp_diagnostics()
+        monitor.update_sfp_diagnostics()
+        self.assertEqual(monitor.get_i2c_stats()["cycle_transactions"], 1)
+
+        bus.lines[SFP_OUT_line] = make_module()  # module plugged in
+        monitor.init_timestamp -= RE_INIT_INTERVAL + 1
+        monitor.update_sfp_diagnostics()
+        self.assertIsNotNone(monitor.sfp_1)
+        self.assertEqual(monitor.get_i2c_stats()["cycle_transactions"], 4)  # diagnostics, switch write, ID page, thresholds
+        self.assertEqual(monitor.get_module_info(SFP_OUT)["wavelength"], 1310)
+
+    def test_shared_bus(self):
+        """
+        Test bus handles of the switch and both sfp drivers.
+        Expected behaviour is one bus opened for all drivers and closed when the monitor is closed.
+        """
+        bus = FakeI2cBus({}, switch_address=0x70, lines={SFP_CAMERA_line: make_module(), SFP_OUT_line: {}})
+        with mock.patch.object(i2c_bus, "SMBus", return_value=bus) as smbus:
+            monitor = SfpMonitor()
+            for _ in range(3):
+                monitor.init_timestamp -= RE_INIT_INTERVAL + 1  # failed re-init probes of the missing module
+                monitor.update_sfp_diagnostics()
+            self.assertEqual(smbus.call_count, 1)
+        self.assertEqual(i2c_bus.get_open_buses(), {1: 2})  # switch and sfp 0
+        monitor.close()
+        self.assertEqual(i2c_bus.get_open_buses(), {})
+        self.assertTrue(bus.closed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import io
+import unittest
+import numpy as np
+
+from ...src.spot_detector import *
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_spot_detector`
+
+No camera is needed - frames with synthetic spots are generated with NumPy and Pillow.
+"""
+
+def make_frame(spots, size=720, background=40):
+    """Return JPEG frame with gaussian spots given as (x, y, sigma, brightness)"""
+    ys, xs = np.mgrid[0:size, 0:size].astype(np.float32)
+    frame = np.full((size, size), background, dtype=np.float32)
+    for x, y, sigma, brightness in spots:
+        frame += brightness * np.exp(-((xs - x) ** 2 + (ys - y) ** 2) / (2 * sigma ** 2))
+    out = io.BytesIO()
+    Image.fromarray(np.clip(frame, 0, 255).astype(np.uint8)).save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+@unittest.skipIf(Image is None, "Spot detection requires Pillow")
+class TestSpotDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = SpotDetector()
+
+    def test_single_spot(self):
+        """
+        Test frame with one spot at a sub-pixel position.
+        Expected centroid within half a pixel of the spot center, high confidence.
+        """
+        spot = self.detector.detect(make_frame([(280.3, 527.8, 8, 200)]))
+        self.assertAlmostEqual(spot["x"], 280.3, delta=0.5)
+        self.assertAlmostEqual(spot["y"], 527.8, delta=0.5)
+        self.assertAlmostEqual(spot["x_norm"], 280.8 / 720, delta=0.001)
+        self.assertGreater(spot["confidence"], 0.9)
+
+    def test_no_spot(self):
+        """
+        Test uniform frame.
+        Expected value is None.
+        """
+        self.assertIsNone(self.detector.detect(make_frame([])))
+
+    def test_two_spots(self):
+        """
+        Test frame with two equally bright spots far apart.
+        Expected confidence is low.
+        """
+        spot = self.detector.detect(make_frame([(100, 100, 8, 200), (600, 600, 8, 200)]))
+        self.assertLess(spot["confidence"], 0.3)
+
+if __name__ == '__main__':
+    unittest.main()
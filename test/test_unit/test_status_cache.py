@@ -0,0 +1,57 @@
+import unittest
+
+from ...src.status_cache import StatusCache
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_status_cache`
+
+No hardware is needed - sections are plain values and the clock is stubbed.
+"""
+
+class TestStatusCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        self.cache = StatusCache(clock=lambda: self.now)
+        self.sections = {"unit_id": "test", "led": {"mode": 1}, "motors_position": [0, 0]}
+
+    def test_first_update(self):
+        """
+        Test update without since.
+        Expected values are all sections, each changed at the response timestamp.
+        """
+        status = self.cache.update(self.sections)
+        self.assertEqual(status["timestamp"], 100.0)
+        self.assertEqual(status["sections"], self.sections)
+        self.assertEqual(status["changed"], {"unit_id": 100.0, "led": 100.0, "motors_position": 100.0})
+
+    def test_unchanged_sections_left_out(self):
+        """
+        Test update with since of the previous response after one section changed.
+        Expected values are only the changed section, change times of all sections.
+        """
+        since = self.cache.update(self.sections)["timestamp"]
+        self.now = 101.0
+        self.sections["motors_position"][0] = 500  # changed in place like the sources do
+        status = self.cache.update(self.sections, since)
+        self.assertEqual(status["sections"], {"motors_position": [500, 0]})
+        self.assertEqual(status["changed"], {"unit_id": 100.0, "led": 100.0, "motors_position": 101.0})
+
+        status = self.cache.update(self.sections, status["timestamp"])
+        self.assertEqual(status["sections"], {})
+
+    def test_since_advances(self):
+        """
+        Test updates polled with since of the previous response, also within one clock tick.
+        Expected behaviour is a strictly increasing timestamp and no change missed.
+        """
+        since = self.cache.update(self.sections)["timestamp"]
+        for position in range(1, 5):
+            self.sections["motors_position"] = [position, 0]
+            status = self.cache.update(self.sections, since)  # clock does not move
+            self.assertGreater(status["timestamp"], since)
+            self.assertEqual(status["sections"], {"motors_position": [position, 0]})
+            since = status["timestamp"]
+
+if __name__ == '__main__':
+    unittest.main()
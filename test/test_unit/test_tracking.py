@@ -0,0 +1,65 @@
+import time
+import unittest
+
+from ...src.tracking import *
+from ...src.alignment import SimulatedLink
+
+"""
+Run tests with `python3 -m unittest -v koruza_v2.koruza_v2_driver.test.test_unit.test_tracking`
+
+No hardware is needed - motors and rx power are simulated by SimulatedLink from the alignment module.
+"""
+
+class TestLinkTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.link = SimulatedLink(peak_x=0, peak_y=0, noise_dB=0.02, seed=0)
+        self.fast_sampling = []
+        self.tracker = LinkTracker(self.link.move_to, self.link.read_power, self.link.get_position,
+                                   set_fast_sampling=self.fast_sampling.append, clock=self.link.clock, step=100, deadband=0.1)
+
+    def test_on_peak(self):
+        """
+        Test tracking cycles on an aligned link.
+        Expected behaviour is no followed probe, motors return to center after every cycle.
+        """
+        for _ in range(5):
+            self.tracker.run_cycle()
+        status = self.tracker.get_status()
+        self.assertEqual(status["steps"], 0)
+        self.assertEqual(self.link.get_position(), (0, 0))
+        self.assertEqual(self.fast_sampling, [True, False] * 5)
+
+    def test_follow_drift(self):
+        """
+        Test tracking while the beam peak drifts away.
+        Expected behaviour is motors following the peak within 1 dB, instead of losing over 10 dB at the start position.
+        """
+        for drift in range(1, 41):
+            self.link.peak_x = drift * 75
+            self.link.peak_y = -drift * 40
+            self.tracker.run_cycle()
+        self.assertLess(self.link.power_at(0, 0), self.link.peak_dBm - 10)
+        self.assertGreater(self.link.power_at(self.link.x, self.link.y), self.link.peak_dBm - 1)
+
+        status = self.tracker.get_status()
+        self.assertGreater(status["steps"], 0)
+        self.assertGreater(status["recovered_dB"], 0)
+
+    def test_start_stop(self):
+        """
+        Test tracking in background thread.
+        Expected behaviour is cycles limited by interval, running flag cleared after stop.
+        """
+        tracker = LinkTracker(self.link.move_to, self.link.read_power, self.link.get_position, interval=0.1)
+        self.assertTrue(tracker.start())
+        self.assertFalse(tracker.start())
+        time.sleep(0.35)
+        tracker.stop()
+
+        status = tracker.get_status()
+        self.assertFalse(status["running"])
+        self.assertTrue(2 <= status["cycles"] <= 5)
+
+if __name__ == '__main__':
+    unittest.main()